@@ -49,19 +49,38 @@ a = Analysis(
         'starlette.middleware',
         'starlette.staticfiles',
         'starlette.responses',
+        'numpy',
         'multipart',
         'multipart.multipart',
-        'pydub',
-        'pydub.utils',
+        'python_multipart',
+        'python_multipart.multipart',
         'app',
         'app.main',
         'app.config',
         'app.audio_utils',
         'app.task_manager',
+        'app.scheduler',
+        'app.result_cache',
+        'app.task_store',
+        'app.task_writer',
+        'app.blob_store',
+        'app.events',
+        'app.segment_index',
+        'app.metrics',
+        'app.exporters',
+        'app.playback',
+        'app.waveform',
+        'app.storage',
+        'app.batches',
+        'app.uploads',
+        'app.long_audio',
+        'app.engine_worker',
         'app.engines',
         'app.engines.base',
+        'app.engines.model_cache',
         'app.engines.whisper_engine',
         'app.engines.funasr_engine',
+        'app.engines.probe',
     ],
     hookspath=[],
     hooksconfig={},
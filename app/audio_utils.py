@@ -1,11 +1,19 @@
 """音频处理工具 - 格式转换与音频提取"""
 import os
+import re
+import json
+import time
 import uuid
+import wave
+import hashlib
+import threading
 import subprocess
 import shutil
-from pydub import AudioSegment
+import struct
+from typing import Any, Dict, Optional, Tuple
 
-from app.config import UPLOAD_DIR, SUPPORTED_AUDIO_FORMATS, SUPPORTED_VIDEO_FORMATS
+from app.config import UPLOAD_DIR, FFMPEG_THREADS
+from app import metrics
 
 
 def get_ffmpeg_path() -> str:
@@ -30,55 +38,310 @@ def get_ffmpeg_path() -> str:
     )
 
 
+# 流式转换时每次从 ffmpeg 管道读取的字节数（16kHz 单声道 s16le 约 8 秒）
+_PIPE_CHUNK_SIZE = 256 * 1024
+TARGET_SAMPLE_RATE = 16000
+
+
+def _pcm_hasher(sample_rate: int, channels: int, sampwidth: int):
+    """与 hash_pcm 相同的哈希初始化，保证流式计算与读文件计算结果一致"""
+    hasher = hashlib.sha256()
+    hasher.update(f"{sample_rate}:{channels}:{sampwidth}:".encode())
+    return hasher
+
+
+def _wait_with_cpu_time(proc: subprocess.Popen) -> float:
+    """等待子进程退出，返回其消耗的 CPU 时间（用户态+内核态，秒）"""
+    if hasattr(os, "wait4"):
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        return usage.ru_utime + usage.ru_stime
+    proc.wait()
+    return 0.0
+
+
 def extract_audio_from_video(video_path: str) -> str:
     """从视频文件中提取音频"""
+    return convert_to_wav(video_path)
+
+
+def convert_to_wav(input_path: str, output_path: Optional[str] = None,
+                   stats: Optional[Dict[str, Any]] = None) -> str:
+    """将任意音视频文件转换为16kHz单声道WAV。
+
+    由单个 ffmpeg 进程解码并重采样为 s16le 输出到管道，这里边读边写入 WAV
+    并计算 PCM 哈希，内存占用与文件时长无关。传入 stats 字典时会填入
+    转换耗时、ffmpeg 线程数与 CPU 时间、音频时长和 pcm_hash。
+    """
     ffmpeg = get_ffmpeg_path()
-    output_path = os.path.join(
-        UPLOAD_DIR, f"{uuid.uuid4().hex}_extracted.wav"
+    if not output_path:
+        output_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}.wav")
+
+    cmd = [
+        ffmpeg, "-nostdin", "-hide_banner", "-loglevel", "error",
+        "-threads", str(FFMPEG_THREADS),
+        "-i", input_path,
+        "-vn", "-acodec", "pcm_s16le", "-f", "s16le",
+        "-ar", str(TARGET_SAMPLE_RATE), "-ac", "1",
+        "pipe:1",
+    ]
+
+    started = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    # stderr 在后台线程中读取，避免管道写满导致 ffmpeg 阻塞
+    stderr_chunks = []
+    stderr_thread = threading.Thread(
+        target=lambda: stderr_chunks.append(proc.stderr.read()), daemon=True
     )
+    stderr_thread.start()
+
+    hasher = _pcm_hasher(TARGET_SAMPLE_RATE, 1, 2)
+    pcm_bytes = 0
+    try:
+        with wave.open(output_path, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(TARGET_SAMPLE_RATE)
+            while True:
+                chunk = proc.stdout.read(_PIPE_CHUNK_SIZE)
+                if not chunk:
+                    break
+                w.writeframesraw(chunk)
+                hasher.update(chunk)
+                pcm_bytes += len(chunk)
+    except BaseException:
+        proc.kill()
+        raise
+    finally:
+        proc.stdout.close()
+        cpu_time = _wait_with_cpu_time(proc)
+        stderr_thread.join()
+        proc.stderr.close()
+
+    if proc.returncode != 0:
+        try:
+            os.remove(output_path)
+        except OSError:
+            pass
+        err = b"".join(c for c in stderr_chunks if c).decode("utf-8", errors="replace")
+        raise RuntimeError(f"音频转换失败: {err.strip()}")
+
+    elapsed = time.perf_counter() - started
+    audio_seconds = pcm_bytes / (TARGET_SAMPLE_RATE * 2)
+    metrics.FFMPEG_SECONDS.observe(elapsed)
+    metrics.FFMPEG_AUDIO_SECONDS.inc(audio_seconds)
+    if stats is not None:
+        stats.update({
+            "elapsed": round(elapsed, 3),
+            "ffmpeg_threads": FFMPEG_THREADS,
+            "ffmpeg_cpu_time": round(cpu_time, 3),
+            "audio_seconds": round(audio_seconds, 3),
+            "speed": round(audio_seconds / elapsed, 1) if elapsed > 0 else 0.0,
+            "pcm_hash": hasher.hexdigest(),
+        })
+    return output_path
+
+
+# 播放代理的编码格式：codec -> (扩展名, Content-Type, ffmpeg 编码与封装参数)
+PLAYBACK_FORMATS = {
+    "aac": (".m4a", "audio/mp4", ["-c:a", "aac", "-f", "mp4", "-movflags", "+faststart"]),
+    "opus": (".webm", "audio/webm", ["-c:a", "libopus", "-application", "voip", "-f", "webm"]),
+}
+
+
+def encode_playback_proxy(wav_path: str, output_path: str, codec: str, bitrate: str):
+    """将转录用的 WAV 编码为低码率的播放代理文件。
+
+    不做重采样和裁剪；编码器引入的起始延迟记录在容器中（MP4 编辑列表 / WebM CodecDelay），
+    由浏览器解码时扣除，播放时间线与 WAV 及转录时间戳一致。MP4 的索引写在文件开头，
+    浏览器读取文件头后即可开始播放并按字节范围定位。
+    """
+    args = PLAYBACK_FORMATS[codec][2]
     cmd = [
-        ffmpeg, "-i", video_path,
-        "-vn", "-acodec", "pcm_s16le",
-        "-ar", "16000", "-ac", "1",
-        output_path, "-y"
+        get_ffmpeg_path(), "-nostdin", "-hide_banner", "-loglevel", "error", "-y",
+        "-threads", str(FFMPEG_THREADS),
+        "-i", wav_path,
+        "-vn", "-ac", "1", "-b:a", bitrate,
+        *args, output_path,
+    ]
+    proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        err = proc.stderr.decode("utf-8", errors="replace").strip()
+        raise RuntimeError(f"播放代理编码失败: {err}")
+
+
+def get_ffprobe_path() -> str:
+    """获取 ffprobe 路径（优先与 ffmpeg 同目录），找不到返回空字符串"""
+    path = shutil.which("ffprobe")
+    if path:
+        return path
+    try:
+        ffmpeg = get_ffmpeg_path()
+    except RuntimeError:
+        return ""
+    name = "ffprobe.exe" if ffmpeg.lower().endswith(".exe") else "ffprobe"
+    candidate = os.path.join(os.path.dirname(ffmpeg), name)
+    return candidate if os.path.isfile(candidate) else ""
+
+
+def _empty_media_info(file_path: str) -> Dict[str, Any]:
+    return {
+        "size": os.path.getsize(file_path),
+        "format": "",
+        "duration": 0.0,
+        "codec": "",
+        "sample_rate": 0,
+        "channels": 0,
+        "has_audio": False,
+        "has_video": False,
+    }
+
+
+def _probe_wav_header(file_path: str, info: Dict[str, Any]) -> bool:
+    try:
+        with wave.open(file_path, "rb") as w:
+            rate = w.getframerate()
+            info.update({
+                "format": "wav",
+                "duration": round(w.getnframes() / rate, 3) if rate else 0.0,
+                "codec": f"pcm_s{w.getsampwidth() * 8}le",
+                "sample_rate": rate,
+                "channels": w.getnchannels(),
+                "has_audio": True,
+            })
+        return True
+    except (wave.Error, EOFError, OSError):
+        # 非 PCM 编码的 WAV（如 IEEE float / ADPCM）交给 ffprobe
+        return False
+
+
+def _probe_ffprobe(ffprobe: str, file_path: str, info: Dict[str, Any]) -> bool:
+    cmd = [
+        ffprobe, "-v", "error",
+        "-show_entries",
+        "format=format_name,duration:stream=codec_type,codec_name,sample_rate,channels,duration",
+        "-of", "json", file_path,
     ]
     result = subprocess.run(cmd, capture_output=True, text=True)
     if result.returncode != 0:
-        raise RuntimeError(f"音频提取失败: {result.stderr}")
-    return output_path
+        return False
+    data = json.loads(result.stdout or "{}")
+    fmt = data.get("format", {})
+    streams = data.get("streams", [])
+    audio = next((st for st in streams if st.get("codec_type") == "audio"), None)
+    info["format"] = fmt.get("format_name", "")
+    info["has_video"] = any(st.get("codec_type") == "video" for st in streams)
+    duration = fmt.get("duration") or (audio or {}).get("duration") or 0
+    info["duration"] = round(float(duration), 3)
+    if audio:
+        info.update({
+            "codec": audio.get("codec_name", ""),
+            "sample_rate": int(audio.get("sample_rate") or 0),
+            "channels": int(audio.get("channels") or 0),
+            "has_audio": True,
+        })
+    return True
 
 
-def convert_to_wav(input_path: str) -> str:
-    """将音频文件转换为16kHz单声道WAV"""
-    ext = os.path.splitext(input_path)[1].lower()
+_DURATION_RE = re.compile(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)")
+_AUDIO_STREAM_RE = re.compile(r"Stream #\S+.*?: Audio: ([\w-]+).*?, (\d+) Hz, ([^,]+)")
 
-    if ext in SUPPORTED_VIDEO_FORMATS:
-        return extract_audio_from_video(input_path)
 
-    if ext == ".wav":
-        audio = AudioSegment.from_wav(input_path)
-    elif ext == ".mp3":
-        audio = AudioSegment.from_mp3(input_path)
-    elif ext in (".m4a", ".aac"):
-        audio = AudioSegment.from_file(input_path, format="m4a" if ext == ".m4a" else "aac")
-    elif ext == ".ogg":
-        audio = AudioSegment.from_ogg(input_path)
-    elif ext == ".flac":
-        audio = AudioSegment.from_file(input_path, format="flac")
-    else:
-        audio = AudioSegment.from_file(input_path)
+def _probe_ffmpeg_banner(file_path: str, info: Dict[str, Any]) -> bool:
+    """没有 ffprobe 时，解析 `ffmpeg -i` 输出的容器头信息（不解码）"""
+    cmd = [get_ffmpeg_path(), "-hide_banner", "-nostdin", "-i", file_path]
+    result = subprocess.run(cmd, capture_output=True, text=True, errors="replace")
+    text = result.stderr
+    m = _DURATION_RE.search(text)
+    if not m:
+        return False
+    h, mi, sec = m.groups()
+    info["duration"] = round(int(h) * 3600 + int(mi) * 60 + float(sec), 3)
+    info["has_video"] = ": Video:" in text
+    a = _AUDIO_STREAM_RE.search(text)
+    if a:
+        layout = a.group(3).strip()
+        channels = {"mono": 1, "stereo": 2}.get(layout, 0)
+        if not channels:
+            ch = re.match(r"(\d+)", layout)
+            channels = int(ch.group(1)) if ch else 0
+        info.update({
+            "codec": a.group(1),
+            "sample_rate": int(a.group(2)),
+            "channels": channels,
+            "has_audio": True,
+        })
+    return True
 
-    audio = audio.set_frame_rate(16000).set_channels(1).set_sample_width(2)
 
-    output_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}.wav")
-    audio.export(output_path, format="wav")
-    return output_path
+def probe_media(file_path: str) -> Dict[str, Any]:
+    """读取媒体文件头获取时长、编码、采样率、声道数和大小（毫秒级，不解码音频）。
+
+    依次尝试：WAV 文件头 -> ffprobe -> ffmpeg 输入信息。全部失败时返回
+    时长为 0 的记录，并带 probe_error 字段。
+    """
+    info = _empty_media_info(file_path)
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == ".wav" and _probe_wav_header(file_path, info):
+        return info
+
+    try:
+        ffprobe = get_ffprobe_path()
+        if ffprobe and _probe_ffprobe(ffprobe, file_path, info):
+            return info
+        if _probe_ffmpeg_banner(file_path, info):
+            return info
+        info["probe_error"] = "无法识别的媒体文件"
+    except Exception as e:
+        info["probe_error"] = str(e)
+    return info
 
 
 def get_audio_duration(file_path: str) -> float:
-    """获取音频时长（秒）"""
+    """获取音频时长（秒），只读取文件头"""
     try:
-        audio = AudioSegment.from_file(file_path)
-        return len(audio) / 1000.0
+        return probe_media(file_path)["duration"]
     except Exception:
         return 0.0
+
+
+def hash_pcm(wav_path: str, chunk_frames: int = 1 << 18) -> str:
+    """计算 WAV 文件中 PCM 数据的 SHA-256（不含文件头，分块读取）"""
+    with wave.open(wav_path, "rb") as w:
+        hasher = _pcm_hasher(w.getframerate(), w.getnchannels(), w.getsampwidth())
+        while True:
+            frames = w.readframes(chunk_frames)
+            if not frames:
+                break
+            hasher.update(frames)
+    return hasher.hexdigest()
+
+
+def wav_pcm_layout(wav_path: str) -> Tuple[int, int, int]:
+    """解析 WAV 文件头，返回 (PCM 数据起始偏移, 采样帧数, 采样率)。
+
+    用于以内存映射方式直接读取 16 位 PCM 数据（numpy.memmap）。
+    """
+    with open(wav_path, "rb") as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+            raise ValueError(f"不是有效的 WAV 文件: {wav_path}")
+        channels, rate, sampwidth = 1, TARGET_SAMPLE_RATE, 2
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"WAV 文件缺少 data 块: {wav_path}")
+            chunk_id, size = header[:4], struct.unpack("<I", header[4:])[0]
+            if chunk_id == b"fmt ":
+                fmt = f.read(size)
+                channels, rate = struct.unpack("<HI", fmt[2:8])
+                sampwidth = struct.unpack("<H", fmt[14:16])[0] // 8
+                f.seek(size % 2, 1)
+            elif chunk_id == b"data":
+                offset = f.tell()
+                available = os.path.getsize(wav_path) - offset
+                size = min(size, available)
+                return offset, size // (channels * sampwidth), rate
+            else:
+                f.seek(size + size % 2, 1)
@@ -0,0 +1,336 @@
+"""批量导入 - 一次提交多个文件（上传或服务器本地目录），以相同设置创建任务并汇总进度"""
+import os
+import time
+import uuid
+import fnmatch
+import threading
+from collections import deque
+from typing import Deque, Dict, Any, List, Optional, Tuple
+
+from app.config import (
+    SUPPORTED_FORMATS, MAX_FILE_SIZE_MB, BATCH_MAX_FILES, BATCH_INGEST_ROOTS,
+)
+from app.audio_utils import probe_media
+from app.task_manager import task_manager
+
+# 批次的导入状态
+INGESTING = "ingesting"
+INGESTED = "ingested"
+INTERRUPTED = "interrupted"
+
+
+class BatchError(Exception):
+    """批量导入参数错误（目录不允许导入、文件数超限等）"""
+
+
+class _IngestItem:
+    """待导入的一个文件"""
+    __slots__ = ("batch_id", "path", "filename", "move", "content_hash", "file_size")
+
+    def __init__(self, batch_id: str, path: str, filename: str, move: bool,
+                 content_hash: str = "", file_size: int = 0):
+        self.batch_id = batch_id
+        self.path = path
+        self.filename = filename
+        # True：上传目录中的临时文件，导入后移入媒体存储；False：服务器本地文件，只复制
+        self.move = move
+        self.content_hash = content_hash
+        self.file_size = file_size
+
+
+def _split_patterns(value: str) -> List[str]:
+    return [p.strip() for p in (value or "").split(",") if p.strip()]
+
+
+def _matches(rel_path: str, patterns: List[str]) -> bool:
+    """相对路径或文件名匹配任一模式（不区分大小写）"""
+    rel_path = rel_path.replace(os.sep, "/").lower()
+    name = rel_path.rsplit("/", 1)[-1]
+    return any(fnmatch.fnmatchcase(rel_path, p.lower()) or fnmatch.fnmatchcase(name, p.lower())
+               for p in patterns)
+
+
+def _within(path: str, root: str) -> bool:
+    try:
+        return os.path.commonpath([path, root]) == root
+    except ValueError:
+        return False
+
+
+def _allowed_root(path: str) -> Optional[str]:
+    for root in BATCH_INGEST_ROOTS:
+        root = os.path.realpath(root)
+        if _within(path, root):
+            return root
+    return None
+
+
+def scan_folder(path: str, include: str = "", exclude: str = "",
+                recursive: bool = True) -> List[Tuple[str, str]]:
+    """列出目录中要导入的媒体文件，返回 [(绝对路径, 相对路径)]（按路径排序）。
+
+    目录必须位于 BATCH_INGEST_ROOTS 之内，指向允许目录之外的符号链接被忽略；
+    include / exclude 为逗号分隔的通配符模式，匹配相对路径或文件名。
+    不支持的格式直接忽略，文件数超过 BATCH_MAX_FILES 时报错。
+    """
+    if not BATCH_INGEST_ROOTS:
+        raise BatchError("未配置允许导入的目录（BATCH_INGEST_ROOTS）")
+    folder = os.path.realpath(path)
+    root = _allowed_root(folder)
+    if root is None:
+        raise BatchError(f"目录不在允许导入的范围内: {path}")
+    if not os.path.isdir(folder):
+        raise BatchError(f"目录不存在: {path}")
+
+    includes, excludes = _split_patterns(include), _split_patterns(exclude)
+    files = []
+    for dirpath, dirnames, filenames in os.walk(folder):
+        dirnames.sort()
+        if not recursive:
+            dirnames[:] = []
+        for name in sorted(filenames):
+            if os.path.splitext(name)[1].lower() not in SUPPORTED_FORMATS:
+                continue
+            full = os.path.join(dirpath, name)
+            rel = os.path.relpath(full, folder)
+            if includes and not _matches(rel, includes):
+                continue
+            if excludes and _matches(rel, excludes):
+                continue
+            real = os.path.realpath(full)
+            if not _within(real, root) or not os.path.isfile(real):
+                continue
+            files.append((real, rel))
+            if len(files) > BATCH_MAX_FILES:
+                raise BatchError(f"目录中的文件数超过单批上限 {BATCH_MAX_FILES}")
+    return files
+
+
+class BatchManager:
+    """批次的创建、后台导入与进度汇总。
+
+    提交时只登记文件，探测媒体、放入媒体存储和创建任务由单个后台线程按提交顺序逐个完成，
+    每创建一个任务立即交给调度器；同一批次同时执行的转录数由调度器按 BATCH_MAX_RUNNING 限制。
+    批次记录保存在任务数据库中，所含任务通过任务的 batch_id 关联，进度实时由任务状态汇总。
+    """
+
+    def __init__(self):
+        self._lock = threading.Condition()
+        self._batches: Dict[str, Dict[str, Any]] = {}
+        self._queue: Deque[_IngestItem] = deque()
+        # 各批次尚未导入的文件数
+        self._remaining: Dict[str, int] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def load(self):
+        """启动时加载批次记录（在任务历史加载之后调用）；上次未导入完的批次标记为中断"""
+        interrupted = []
+        with self._lock:
+            for batch in task_manager.load_batches():
+                if batch["state"] == INGESTING:
+                    batch["state"] = INTERRUPTED
+                    batch["ingested_at"] = time.time()
+                    interrupted.append(dict(batch))
+                self._batches[batch["id"]] = batch
+        for batch in interrupted:
+            task_manager.save_batch(batch)
+        if interrupted:
+            print(f"[批量导入] {len(interrupted)} 个批次在服务重启前未导入完成，已标记为中断")
+
+    # ---- 创建 ----
+
+    def _create(self, batch_id: str, source: str, engine: str, model: str, language: str,
+                items: List[_IngestItem], skipped: List[Dict[str, str]]) -> str:
+        batch = {
+            "id": batch_id,
+            "source": source,
+            "engine": engine,
+            "model": model,
+            "language": language,
+            "total": len(items) + len(skipped),
+            "created": 0,
+            "skipped": list(skipped),
+            "state": INGESTING if items else INGESTED,
+            "created_at": time.time(),
+            "ingested_at": None if items else time.time(),
+        }
+        task_manager.save_batch(dict(batch))
+        with self._lock:
+            self._batches[batch["id"]] = batch
+            if items:
+                self._remaining[batch["id"]] = len(items)
+                self._queue.extend(items)
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="batch-ingest", daemon=True)
+                    self._thread.start()
+                self._lock.notify()
+        print(f"[批量导入] 批次 {batch['id']}（{source}）：{len(items)} 个文件待导入，跳过 {len(skipped)} 个")
+        return batch["id"]
+
+    def create_from_uploads(self, uploads: List[Tuple[str, str, str, int]],
+                            skipped: List[Dict[str, str]],
+                            engine: str, model: str, language: str) -> str:
+        """由已保存到上传目录的文件创建批次：uploads 为 [(临时文件路径, 原文件名, 内容哈希, 字节数)]"""
+        batch_id = uuid.uuid4().hex[:12]
+        items = [_IngestItem(batch_id, path, filename, True, content_hash, size)
+                 for path, filename, content_hash, size in uploads]
+        return self._create(batch_id, "upload", engine, model, language, items, skipped)
+
+    def create_from_folder(self, path: str, include: str, exclude: str, recursive: bool,
+                           engine: str, model: str, language: str) -> str:
+        """扫描服务器本地目录并创建批次（文件被复制进媒体存储，原目录不受影响）"""
+        files = scan_folder(path, include, exclude, recursive)
+        if not files:
+            raise BatchError("目录中没有可导入的媒体文件")
+        batch_id = uuid.uuid4().hex[:12]
+        items = [_IngestItem(batch_id, full, rel.replace(os.sep, "/"), False) for full, rel in files]
+        source = f"folder:{os.path.realpath(path)}"
+        return self._create(batch_id, source, engine, model, language, items, [])
+
+    # ---- 后台导入 ----
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._queue:
+                    self._lock.wait()
+                item = self._queue.popleft()
+            task_id, reason = None, ""
+            try:
+                task_id, reason = self._ingest(item)
+            except Exception as e:
+                reason = f"导入失败: {e}"
+            if task_id is None and item.move:
+                try:
+                    os.remove(item.path)
+                except OSError:
+                    pass
+            self._finish_item(item, task_id, reason)
+
+    def _ingest(self, item: _IngestItem) -> Tuple[Optional[str], str]:
+        """导入一个文件，返回 (任务 ID, 跳过原因)"""
+        batch = self._batches.get(item.batch_id)
+        if batch is None:
+            return None, "批次已删除"
+        size = item.file_size or os.path.getsize(item.path)
+        if size > MAX_FILE_SIZE_MB * 1024 * 1024:
+            return None, f"文件大小超过限制 {MAX_FILE_SIZE_MB}MB"
+        media_info = probe_media(item.path)
+        if not media_info.get("probe_error") and not media_info.get("has_audio"):
+            return None, "文件中未找到音频流"
+        task_id = task_manager.create_task(
+            filename=item.filename,
+            engine=batch["engine"],
+            model=batch["model"],
+            language=batch["language"],
+            file_path=item.path,
+            content_hash=item.content_hash,
+            file_size=size,
+            media_info=media_info,
+            batch_id=item.batch_id,
+        )
+        task_manager.submit(task_id)
+        return task_id, ""
+
+    def _finish_item(self, item: _IngestItem, task_id: Optional[str], reason: str):
+        with self._lock:
+            batch = self._batches.get(item.batch_id)
+            if batch is None:
+                return
+            if task_id:
+                batch["created"] += 1
+            else:
+                batch["skipped"].append({"file": item.filename, "reason": reason})
+            remaining = self._remaining.get(item.batch_id, 1) - 1
+            if remaining > 0:
+                self._remaining[item.batch_id] = remaining
+                return
+            self._remaining.pop(item.batch_id, None)
+            batch["state"] = INGESTED
+            batch["ingested_at"] = time.time()
+            snapshot = dict(batch, skipped=list(batch["skipped"]))
+        task_manager.save_batch(snapshot)
+        print(f"[批量导入] 批次 {item.batch_id} 导入完成：创建 {snapshot['created']} 个任务，"
+              f"跳过 {len(snapshot['skipped'])} 个文件")
+
+    # ---- 查询 ----
+
+    @staticmethod
+    def _summarize(batch: Dict[str, Any], tasks: List[Dict[str, Any]],
+                   remaining: int) -> Dict[str, Any]:
+        counts = {"pending": 0, "processing": 0, "completed": 0, "failed": 0}
+        done = 0.0
+        for task in tasks:
+            counts[task["status"]] = counts.get(task["status"], 0) + 1
+            if task["status"] in ("completed", "failed"):
+                done += 1.0
+            else:
+                done += task["progress"] or 0.0
+        # 尚未导入的文件按进度 0 计入，被删除的任务不再计入
+        expected = len(tasks) + remaining
+        if batch["state"] == INGESTING:
+            status = INGESTING
+        elif counts["pending"] or counts["processing"]:
+            status = "running"
+        else:
+            status = "completed"
+        return {
+            "id": batch["id"],
+            "source": batch["source"],
+            "engine": batch["engine"],
+            "model": batch["model"],
+            "language": batch["language"],
+            "status": status,
+            "ingest_state": batch["state"],
+            "created_at": batch["created_at"],
+            "ingested_at": batch["ingested_at"],
+            "files": {
+                "total": batch["total"],
+                "created": batch["created"],
+                "skipped": len(batch["skipped"]),
+                "pending_ingest": remaining,
+            },
+            "tasks": counts,
+            "deleted_tasks": max(0, batch["created"] - len(tasks)),
+            "progress": round(done / expected, 4) if expected else 1.0,
+            "skipped_files": list(batch["skipped"]),
+        }
+
+    def get(self, batch_id: str, include_tasks: bool = True) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            if batch is None:
+                return None
+            batch = dict(batch, skipped=list(batch["skipped"]))
+            remaining = self._remaining.get(batch_id, 0)
+        tasks = task_manager.batch_tasks({batch_id}).get(batch_id, [])
+        summary = self._summarize(batch, tasks, remaining)
+        if include_tasks:
+            summary["task_list"] = sorted(tasks, key=lambda t: t["created_at"])
+        return summary
+
+    def list_batches(self) -> List[Dict[str, Any]]:
+        """所有批次的进度汇总（按创建时间倒序，不含任务列表与跳过的文件明细）"""
+        with self._lock:
+            batches = [(dict(b, skipped=list(b["skipped"])), self._remaining.get(b["id"], 0))
+                       for b in self._batches.values()]
+        groups = task_manager.batch_tasks({b["id"] for b, _ in batches})
+        summaries = []
+        for batch, remaining in batches:
+            summary = self._summarize(batch, groups.get(batch["id"], []), remaining)
+            summary.pop("skipped_files")
+            summaries.append(summary)
+        summaries.sort(key=lambda s: s["created_at"], reverse=True)
+        return summaries
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "batches": len(self._batches),
+                "ingesting": len(self._remaining),
+                "pending_files": len(self._queue),
+            }
+
+
+# 全局单例
+batch_manager = BatchManager()
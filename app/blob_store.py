@@ -0,0 +1,117 @@
+"""媒体文件存储 - 按内容哈希寻址，相同内容的原始媒体只保存一份"""
+import os
+import uuid
+import shutil
+import hashlib
+import threading
+from typing import Dict, Any
+
+from app.config import MEDIA_BLOB_DIR
+
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """文件内容的 SHA-256（与上传时边写边算的哈希一致）"""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class BlobStore:
+    """原始媒体存储：MEDIA_BLOB_DIR/{哈希前两位}/{哈希}{扩展名}。
+
+    任务目录中的 media.{ext} 是指向 blob 的硬链接，任务目录的布局和删除方式不变；
+    blob 的链接数降到 1（只剩存储自身）时已没有任务使用，由 release() 删除。
+    文件系统不支持硬链接时，任务直接引用 blob 路径。
+    """
+
+    def __init__(self, root: str = MEDIA_BLOB_DIR):
+        self._root = root
+        # 放入与释放互斥，避免刚被去重复用的 blob 被并发删除
+        self._lock = threading.Lock()
+        self.stored = 0
+        self.dedup_hits = 0
+
+    def path(self, content_hash: str, ext: str) -> str:
+        return os.path.join(self._root, content_hash[:2], content_hash + ext.lower())
+
+    def add(self, src_path: str, content_hash: str, dest_path: str, move: bool = False) -> str:
+        """将媒体文件放入存储并在 dest_path 创建硬链接，返回任务应引用的路径。
+
+        move=True 时源文件（上传的临时文件）被移动到存储中，已有相同内容时直接删除；
+        否则复制一份，不改动源文件。
+        """
+        blob = self.path(content_hash, os.path.splitext(src_path)[1])
+        with self._lock:
+            if os.path.isfile(blob):
+                self.dedup_hits += 1
+                if move:
+                    _remove(src_path)
+            else:
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                if move:
+                    try:
+                        os.replace(src_path, blob)
+                    except OSError:
+                        # 跨文件系统时先复制为临时文件再原子替换
+                        _copy_into(src_path, blob)
+                        _remove(src_path)
+                else:
+                    _copy_into(src_path, blob)
+                self.stored += 1
+            try:
+                os.link(blob, dest_path)
+                return dest_path
+            except OSError:
+                return blob
+
+    def release(self, blob_path: str):
+        """任务不再使用 blob 后调用：没有其他硬链接时删除"""
+        with self._lock:
+            try:
+                if os.stat(blob_path).st_nlink <= 1:
+                    os.remove(blob_path)
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        count = size = 0
+        if os.path.isdir(self._root):
+            for dirpath, _, filenames in os.walk(self._root):
+                for name in filenames:
+                    try:
+                        size += os.path.getsize(os.path.join(dirpath, name))
+                        count += 1
+                    except OSError:
+                        pass
+        return {
+            "blobs": count,
+            "bytes": size,
+            "stored": self.stored,
+            "dedup_hits": self.dedup_hits,
+        }
+
+
+def _copy_into(src_path: str, dest_path: str):
+    tmp_path = f"{dest_path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        shutil.copyfile(src_path, tmp_path)
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        _remove(tmp_path)
+        raise
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# 全局单例
+blob_store = BlobStore()
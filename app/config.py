@@ -20,17 +20,120 @@ RESULT_DIR = os.path.join(BASE_DIR, "results")
 STATIC_DIR = os.path.join(_BUNDLE_DIR, "static")
 MODEL_CACHE_DIR = os.path.join(BASE_DIR, "models")
 HISTORY_DIR = os.path.join(BASE_DIR, "history")
+RESULT_CACHE_DIR = os.path.join(BASE_DIR, "cache")
+# 渲染好的导出文件（SRT / VTT / TXT / JSON）缓存
+EXPORT_CACHE_DIR = os.path.join(RESULT_CACHE_DIR, "exports")
+# 任务元数据与转录结果数据库（SQLite，WAL 模式）
+TASK_DB_PATH = os.path.join(HISTORY_DIR, "tasks.db")
+# 原始媒体文件按内容哈希存放，相同内容只保存一份（任务目录中为指向它的硬链接）
+MEDIA_BLOB_DIR = os.path.join(HISTORY_DIR, "blobs")
+# 已删除任务的目录先移到这里，再在后台删除（启动时清理上次未删完的内容）
+TRASH_DIR = os.path.join(HISTORY_DIR, ".trash")
 
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(RESULT_DIR, exist_ok=True)
 os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
 os.makedirs(HISTORY_DIR, exist_ok=True)
+os.makedirs(RESULT_CACHE_DIR, exist_ok=True)
 
 SUPPORTED_AUDIO_FORMATS = {".mp3", ".m4a", ".wav", ".flac", ".ogg", ".wma", ".aac"}
 SUPPORTED_VIDEO_FORMATS = {".mp4", ".mkv", ".avi", ".mov", ".webm", ".flv"}
 SUPPORTED_FORMATS = SUPPORTED_AUDIO_FORMATS | SUPPORTED_VIDEO_FORMATS
 
 MAX_FILE_SIZE_MB = 2000
+# 上传文件分块写盘的块大小（字节），单次上传的内存占用与文件大小无关
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# 音频转换时 ffmpeg 使用的线程数（0 表示由 ffmpeg 自动决定）
+FFMPEG_THREADS = 2
+
+# 播放代理：转录用的 16kHz WAV（约 115MB/小时）另行压缩为低码率音频供浏览器播放，
+# 每个任务生成一次并保存在任务目录中。编码格式为 "aac"（.m4a）或 "opus"（.webm）
+PLAYBACK_PROXY_CODEC = "aac"
+PLAYBACK_PROXY_BITRATE = "24k"
+
+# 波形峰值金字塔：第 0 级每桶 WAVEFORM_BASE_SAMPLES 个采样（16kHz 下 16ms），
+# 每升一级每桶采样数乘以 WAVEFORM_LEVEL_FACTOR，共 WAVEFORM_LEVELS 级；单次请求最多返回的桶数
+WAVEFORM_BASE_SAMPLES = 256
+WAVEFORM_LEVEL_FACTOR = 4
+WAVEFORM_LEVELS = 6
+WAVEFORM_MAX_BUCKETS = 20000
+
+# 转录调度：同时执行的转录任务数上限（工作线程数）
+MAX_CONCURRENT_TASKS = 2
+# 每个引擎（或 "引擎:模型"）同时执行的任务数上限，未列出的使用默认值
+ENGINE_CONCURRENCY = {
+    "whisper": 1,
+    "funasr": 1,
+}
+DEFAULT_ENGINE_CONCURRENCY = 1
+# 同一批量任务同时执行的任务数上限（0 表示只受上面的限额约束），
+# 大批量导入不会占满全部工作线程，单独上传的文件仍能及时开始
+BATCH_MAX_RUNNING = 1
+
+# 批量导入：单个批次最多包含的文件数；允许从服务器本地导入的目录（含子目录），
+# 为空时不允许按目录导入
+BATCH_MAX_FILES = 1000
+BATCH_INGEST_ROOTS = []
+
+# 转录结果缓存（按 音频内容+引擎+模型+语言 寻址）的磁盘容量上限
+RESULT_CACHE_MAX_MB = 500
+# 导出文件缓存的磁盘容量上限
+EXPORT_CACHE_MAX_MB = 200
+
+# 磁盘配额：数据目录（history / uploads / results / cache）的总占用上限（MB，0 表示不限制）；
+# 超出配额或磁盘剩余空间低于 STORAGE_MIN_FREE_MB 时，按最近播放时间淘汰可重新生成的
+# 派生文件（audio.wav、播放代理、波形峰值），原始媒体与转录结果不会被删除
+STORAGE_QUOTA_MB = 0
+STORAGE_MIN_FREE_MB = 1024
+# 后台检查配额与清理孤立文件的间隔（秒）；孤立文件超过 STORAGE_ORPHAN_GRACE_SECONDS 未修改才删除，
+# 避免误删正在上传或转换中的文件
+STORAGE_SWEEP_INTERVAL_SECONDS = 600
+STORAGE_ORPHAN_GRACE_SECONDS = 24 * 3600
+
+# 每个引擎工作进程使用的计算线程数（torch / OpenMP）
+ENGINE_WORKER_THREADS = 4
+# 引擎工作进程数：>0 时模型在独立进程中加载并常驻，转录任务经本地管道派发，
+# 进程崩溃或 OOM 不影响 API 服务；0 表示在 API 进程内直接转录。
+# 默认按 CPU 核数分配（每进程 ENGINE_WORKER_THREADS 个线程），普通任务最多占用 MAX_CONCURRENT_TASKS 个，
+# 其余进程供长音频片段并行转录；每个进程各自加载模型，内存紧张时可调小
+ENGINE_WORKER_PROCESSES = max(MAX_CONCURRENT_TASKS, (os.cpu_count() or 1) // ENGINE_WORKER_THREADS)
+# 是否将各工作进程绑定到互不重叠的 CPU 核心（仅 Linux 支持）
+ENGINE_WORKER_PIN_CPUS = True
+# 工作进程启动时预加载的模型，格式 "引擎:模型"，例如 ["whisper:base"]
+ENGINE_WORKER_PRELOAD = []
+
+# 模型缓存：已加载模型的总内存预算，启用引擎工作进程时由各工作进程平分，
+# 超出时按 LRU 卸载未使用的模型（每个进程始终保留最近使用的一个）；
+# 空闲超过 MODEL_IDLE_TTL_SECONDS 的模型也会被卸载（0 表示不按空闲时间卸载）
+MODEL_CACHE_BUDGET_MB = 4096
+MODEL_IDLE_TTL_SECONDS = 30 * 60
+
+# 长音频模式：超过 LONG_AUDIO_MIN_SECONDS 的音频在静音处切分为不超过
+# LONG_AUDIO_CHUNK_SECONDS 的片段，由引擎工作进程并行转录（未启用工作进程时在 API 进程内逐段转录）
+LONG_AUDIO_MODE = True
+LONG_AUDIO_MIN_SECONDS = 20 * 60
+LONG_AUDIO_CHUNK_SECONDS = 5 * 60
+# 切分点找不到静音时，相邻片段互相重叠的秒数（拼接时去重）
+LONG_AUDIO_OVERLAP_SECONDS = 2.0
+
+# /api/tasks 每页最多返回的任务数
+TASK_LIST_MAX_LIMIT = 500
+
+# 片段窗口接口单次最多返回的片段数
+SEGMENT_WINDOW_MAX = 2000
+
+# 片段编辑：单次批量编辑最多包含的片段数；编辑先写入只追加的日志，
+# 首次编辑后 EDIT_COMPACT_DELAY_SECONDS 秒或积压超过 EDIT_COMPACT_MAX_PENDING 条时由后台合并进结果
+EDIT_BATCH_MAX = 5000
+EDIT_COMPACT_DELAY_SECONDS = 5.0
+EDIT_COMPACT_MAX_PENDING = 1000
+
+# 任务事件推送（SSE）：每个连接最多积压的事件数，以及保活注释的发送间隔（秒）
+EVENT_QUEUE_SIZE = 1000
+EVENT_KEEPALIVE_SECONDS = 15
+# 进度事件的最小变化量，小于该值且消息未变时不推送
+EVENT_PROGRESS_STEP = 0.01
 
 SYSTEM_INFO = {
     "os": platform.system(),
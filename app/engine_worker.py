@@ -0,0 +1,320 @@
+"""引擎工作进程 - 在独立进程中常驻加载模型，通过本地管道接收转录任务"""
+import os
+import threading
+import traceback
+import multiprocessing
+from collections import deque
+from typing import Dict, List, Any, Optional
+
+from app.config import (
+    ENGINE_WORKER_PROCESSES, ENGINE_WORKER_THREADS, ENGINE_WORKER_PIN_CPUS, ENGINE_WORKER_PRELOAD,
+    MODEL_CACHE_BUDGET_MB,
+)
+from app.engines.base import TranscriptionResult
+from app import metrics
+
+
+def _limit_threads(threads: int):
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["MKL_NUM_THREADS"] = str(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except Exception:
+        pass
+
+
+def _models_message(model_cache) -> Dict[str, Any]:
+    """模型缓存统计，附带尚未上报的模型加载耗时（由主进程计入指标）"""
+    return dict(model_cache.stats(), loads=model_cache.drain_loads())
+
+
+def _worker_main(conn, cpus: List[int], preload: List[str], budget_bytes: int):
+    """工作进程主循环。
+
+    消息协议（父 -> 子）：作业字典，{"cmd": "models"} 查询模型缓存，或 None 表示退出。
+    消息协议（子 -> 父）：("progress", 进度, 消息) / ("segments", 新增片段字典列表, 已处理秒数) /
+    ("models", 模型缓存统计) / ("result", 结果字典) / ("error", 错误信息, 堆栈)。
+    """
+    if cpus and hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, set(cpus))
+        except OSError:
+            pass
+    _limit_threads(len(cpus) if cpus else ENGINE_WORKER_THREADS)
+
+    from app.engines.base import get_engine
+    from app.engines.model_cache import model_cache
+
+    # MODEL_CACHE_BUDGET_MB 是所有工作进程合计的预算
+    model_cache.set_budget(budget_bytes)
+    for spec in preload:
+        engine_name, _, model_name = spec.partition(":")
+        engine = get_engine(engine_name)
+        try:
+            if engine and engine.is_available():
+                engine.preload(model_name)
+        except Exception as e:
+            print(f"[引擎进程] 预加载 {spec} 失败: {e}")
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+        if job.get("cmd") == "models":
+            conn.send(("models", _models_message(model_cache)))
+            continue
+
+        def progress(p, message):
+            conn.send(("progress", p, message))
+
+        def segments(new_segments, processed_seconds):
+            conn.send(("segments", [seg.to_dict() for seg in new_segments], processed_seconds))
+
+        try:
+            engine = get_engine(job["engine"])
+            if not engine:
+                raise RuntimeError(f"引擎 {job['engine']} 不可用")
+            result = engine.transcribe(
+                audio_path=job["audio_path"],
+                model_name=job["model"],
+                language=job["language"],
+                progress_callback=progress,
+                segment_callback=segments if job.get("stream_segments") else None,
+            )
+            conn.send(("models", _models_message(model_cache)))
+            conn.send(("result", result.to_dict()))
+        except Exception as e:
+            conn.send(("models", _models_message(model_cache)))
+            conn.send(("error", str(e), traceback.format_exc()))
+    conn.close()
+
+
+class _WorkerHandle:
+    """父进程中对单个工作进程的引用"""
+    def __init__(self, index: int, cpus: List[int], budget_bytes: int):
+        self.index = index
+        self.cpus = cpus
+        self.budget_bytes = budget_bytes
+        self.process = None
+        self.conn = None
+        self.last_key = ""
+        self.jobs = 0
+        # 该进程最近一次上报的模型缓存统计
+        self.model_snapshot: Dict[str, Any] = {}
+
+    def set_model_snapshot(self, data: Dict[str, Any]):
+        for key, seconds in data.pop("loads", []):
+            metrics.MODEL_LOAD_SECONDS.observe(seconds, model=key)
+        self.model_snapshot = data
+
+    def start(self, ctx):
+        parent_conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(child_conn, self.cpus, list(ENGINE_WORKER_PRELOAD), self.budget_bytes),
+            name=f"engine-worker-{self.index}",
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.last_key = ""
+        self.model_snapshot = {}
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def stop(self, timeout: float = 5.0):
+        if self.process is None:
+            return
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(1)
+        self.conn.close()
+        self.process = None
+
+
+def _cpu_sets(count: int) -> List[List[int]]:
+    """将可用 CPU 平均分给各工作进程；不支持绑核时返回空列表"""
+    if not ENGINE_WORKER_PIN_CPUS or not hasattr(os, "sched_getaffinity"):
+        return [[] for _ in range(count)]
+    cpus = sorted(os.sched_getaffinity(0))
+    per = len(cpus) // count
+    if per == 0:
+        return [[] for _ in range(count)]
+    return [cpus[i * per:(i + 1) * per] for i in range(count)]
+
+
+class EngineWorkerPool:
+    """固定数量的引擎工作进程。
+
+    同一时刻每个进程只执行一个作业；空闲进程中优先选择上次使用过相同
+    引擎/模型的进程，使模型保持热加载。进程异常退出时当前作业失败并自动重启。
+    等待空闲进程的调用方按先来先得的顺序获得进程，长音频的大量片段不会让其他任务一直等待。
+    模型内存预算 MODEL_CACHE_BUDGET_MB 由各进程平分。
+    """
+
+    def __init__(self, size: int = ENGINE_WORKER_PROCESSES):
+        self._size = max(0, int(size))
+        self._ctx = multiprocessing.get_context("spawn")
+        self._cond = threading.Condition()
+        self._workers: List[_WorkerHandle] = []
+        self._idle: List[_WorkerHandle] = []
+        # 等待空闲进程的调用方（按到达顺序）
+        self._waiting: deque = deque()
+
+    @property
+    def enabled(self) -> bool:
+        return self._size > 0
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def _ensure_started(self):
+        # 调用方需持有 self._cond
+        if self._workers:
+            return
+        budget = MODEL_CACHE_BUDGET_MB * 1024 * 1024 // self._size
+        for i, cpus in enumerate(_cpu_sets(self._size)):
+            worker = _WorkerHandle(i, cpus, budget)
+            worker.start(self._ctx)
+            self._workers.append(worker)
+            self._idle.append(worker)
+
+    def _acquire(self, key: str) -> _WorkerHandle:
+        with self._cond:
+            self._ensure_started()
+            ticket = object()
+            self._waiting.append(ticket)
+            try:
+                while not self._idle or self._waiting[0] is not ticket:
+                    self._cond.wait()
+            finally:
+                self._waiting.remove(ticket)
+            worker = next((w for w in self._idle if w.last_key == key), self._idle[0])
+            self._idle.remove(worker)
+            # 还有空闲进程时让下一个等待者继续
+            self._cond.notify_all()
+            return worker
+
+    def _release(self, worker: _WorkerHandle):
+        with self._cond:
+            self._idle.append(worker)
+            self._cond.notify_all()
+
+    def transcribe(self, engine_name: str, audio_path: str, model_name: str,
+                   language: Optional[str], progress_callback=None,
+                   segment_callback=None) -> TranscriptionResult:
+        key = f"{engine_name}:{model_name}"
+        worker = self._acquire(key)
+        try:
+            if not worker.alive():
+                worker.start(self._ctx)
+            worker.jobs += 1
+            worker.conn.send({
+                "engine": engine_name,
+                "audio_path": audio_path,
+                "model": model_name,
+                "language": language,
+                "stream_segments": segment_callback is not None,
+            })
+            while True:
+                try:
+                    msg = worker.conn.recv()
+                except (EOFError, OSError):
+                    worker.process.join(1)
+                    code = worker.process.exitcode
+                    worker.conn.close()
+                    worker.start(self._ctx)
+                    hint = "，可能因内存不足被系统终止" if code is not None and code < 0 else ""
+                    raise RuntimeError(f"转录进程异常退出（退出码 {code}）{hint}")
+                kind = msg[0]
+                if kind == "progress":
+                    if progress_callback:
+                        progress_callback(msg[1], msg[2])
+                elif kind == "segments":
+                    if segment_callback:
+                        segment_callback(TranscriptionResult.from_dict({"segments": msg[1]}).segments, msg[2])
+                elif kind == "models":
+                    worker.set_model_snapshot(msg[1])
+                elif kind == "result":
+                    worker.last_key = key
+                    return TranscriptionResult.from_dict(msg[1])
+                elif kind == "error":
+                    worker.last_key = key
+                    print(msg[2])
+                    raise RuntimeError(msg[1])
+        finally:
+            self._release(worker)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._cond:
+            return [
+                {
+                    "index": w.index,
+                    "pid": w.process.pid if w.process else None,
+                    "alive": w.alive(),
+                    "busy": w not in self._idle,
+                    "cpus": w.cpus,
+                    "last_model": w.last_key,
+                    "jobs": w.jobs,
+                }
+                for w in self._workers
+            ]
+
+    def model_stats(self) -> List[Dict[str, Any]]:
+        """各工作进程的模型缓存统计：空闲进程实时查询，忙碌进程返回最近一次上报"""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            workers = list(self._workers)
+        try:
+            for w in idle:
+                if not w.alive():
+                    continue
+                try:
+                    w.conn.send({"cmd": "models"})
+                    if w.conn.poll(5):
+                        kind, data = w.conn.recv()[:2]
+                        if kind == "models":
+                            w.set_model_snapshot(data)
+                except (EOFError, OSError):
+                    pass
+        finally:
+            with self._cond:
+                self._idle.extend(idle)
+                self._cond.notify_all()
+        return [
+            {"worker": w.index, "pid": w.process.pid if w.process else None, **w.model_snapshot}
+            for w in workers
+        ]
+
+    def last_model_stats(self) -> List[Dict[str, Any]]:
+        """各工作进程最近一次上报的模型缓存统计（不查询进程，供指标采集使用）"""
+        with self._cond:
+            return [
+                {"worker": w.index, "pid": w.process.pid if w.process else None, **w.model_snapshot}
+                for w in self._workers
+            ]
+
+    def shutdown(self):
+        with self._cond:
+            workers = list(self._workers)
+            self._workers.clear()
+            self._idle.clear()
+        for w in workers:
+            w.stop()
+
+
+# 全局单例
+engine_workers = EngineWorkerPool()
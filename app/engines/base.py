@@ -1,4 +1,5 @@
 """转录引擎基类与注册"""
+import importlib
 from abc import ABC, abstractmethod
 from typing import Dict, List, Any, Optional
 
@@ -34,6 +35,25 @@ class TranscriptionResult:
         self.full_text = full_text or " ".join(s.text for s in segments)
         self.engine = engine
 
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "TranscriptionResult":
+        segments = [
+            TranscriptionSegment(
+                start=seg.get("start", 0.0),
+                end=seg.get("end", 0.0),
+                text=seg.get("text", ""),
+                confidence=seg.get("confidence", 1.0),
+                speaker=seg.get("speaker", ""),
+            )
+            for seg in data.get("segments", [])
+        ]
+        return cls(
+            segments=segments,
+            language=data.get("language", ""),
+            full_text=data.get("full_text", ""),
+            engine=data.get("engine", ""),
+        )
+
     def to_dict(self) -> Dict[str, Any]:
         return {
             "segments": [s.to_dict() for s in self.segments],
@@ -49,6 +69,8 @@ class BaseEngine(ABC):
     display_name: str = ""
     description: str = ""
     supported_languages: List[str] = []
+    # 引擎依赖的 pip 包（用于能力探测的版本记录和安装提示）
+    packages: List[str] = []
 
     @abstractmethod
     def is_available(self) -> bool:
@@ -60,40 +82,56 @@ class BaseEngine(ABC):
         """获取可用模型列表"""
         pass
 
+    def preload(self, model_name: str = ""):
+        """预先加载模型（工作进程启动时调用），默认不做任何事"""
+        pass
+
     @abstractmethod
     def transcribe(self, audio_path: str, model_name: str = "",
                    language: Optional[str] = None,
-                   progress_callback=None) -> TranscriptionResult:
-        """执行转录"""
+                   progress_callback=None,
+                   segment_callback=None) -> TranscriptionResult:
+        """执行转录。
+
+        segment_callback(segments, processed_seconds)：引擎每解码出一批片段时调用，
+        segments 为新增的 TranscriptionSegment 列表，processed_seconds 为已处理的音频秒数。
+        不支持增量输出的引擎可以不调用。
+        """
         pass
 
 
 # 引擎注册表
 _engines: Dict[str, BaseEngine] = {}
 
+# 内置引擎所在模块，首次用到时才导入
+_ENGINE_MODULES = {
+    "whisper": "app.engines.whisper_engine",
+    "funasr": "app.engines.funasr_engine",
+}
+
 
 def register_engine(engine: BaseEngine):
     _engines[engine.name] = engine
 
 
+def _load_engine_module(name: str):
+    module = _ENGINE_MODULES.get(name)
+    if module and name not in _engines:
+        importlib.import_module(module)
+
+
 def get_engine(name: str) -> Optional[BaseEngine]:
+    _load_engine_module(name)
     return _engines.get(name)
 
 
 def get_all_engines() -> Dict[str, BaseEngine]:
+    for name in _ENGINE_MODULES:
+        _load_engine_module(name)
     return _engines.copy()
 
 
 def get_available_engines() -> List[Dict[str, Any]]:
-    """获取所有可用引擎的信息"""
-    result = []
-    for name, engine in _engines.items():
-        available = engine.is_available()
-        result.append({
-            "name": engine.name,
-            "display_name": engine.display_name,
-            "description": engine.description,
-            "available": available,
-            "models": engine.get_models() if available else [],
-        })
-    return result
+    """获取所有引擎的信息（可用性来自缓存的能力探测结果）"""
+    from app.engines.probe import engine_probe
+    return engine_probe.describe()
@@ -5,6 +5,7 @@ from typing import Dict, List, Any, Optional
 from app.engines.base import (
     BaseEngine, TranscriptionResult, TranscriptionSegment, register_engine
 )
+from app.engines.model_cache import model_cache
 from app.config import MODEL_CACHE_DIR
 
 
@@ -13,8 +14,14 @@ class FunASREngine(BaseEngine):
     display_name = "FunASR (阿里达摩院)"
     description = "阿里达摩院开源语音识别模型，中文效果优秀，支持标点恢复与时间戳"
     supported_languages = ["zh", "en", "ja", "ko"]
+    packages = ["funasr", "torch", "torchaudio"]
 
-    _pipeline_cache = {}
+    # 各模型组合（含 VAD/标点/说话人模型）的内存占用预估（字节）
+    _size_hints = {
+        "paraformer-zh": 1200 * 1024 * 1024,
+        "paraformer-en": 1000 * 1024 * 1024,
+        "sensevoice-small": 900 * 1024 * 1024,
+    }
 
     def is_available(self) -> bool:
         try:
@@ -61,32 +68,43 @@ class FunASREngine(BaseEngine):
         return configs.get(model_name, configs["paraformer-zh"])
 
     def _load_pipeline(self, model_name: str):
-        if model_name not in self._pipeline_cache:
-            from funasr import AutoModel
-
-            cache_dir = os.path.join(MODEL_CACHE_DIR, "funasr")
-            os.makedirs(cache_dir, exist_ok=True)
-
-            config = self._get_model_config(model_name)
-
-            kwargs = {"model": config["model"], "model_revision": "v2.0.4"}
-            if "vad_model" in config:
-                kwargs["vad_model"] = config["vad_model"]
-                kwargs["vad_model_revision"] = "v2.0.4"
-            if "punc_model" in config:
-                kwargs["punc_model"] = config["punc_model"]
-                kwargs["punc_model_revision"] = "v2.0.4"
-            if "spk_model" in config:
-                kwargs["spk_model"] = config["spk_model"]
-                kwargs["spk_model_revision"] = "v2.0.2"
-
-            self._pipeline_cache[model_name] = AutoModel(**kwargs)
+        """从磁盘加载 FunASR 模型组合（不经过缓存）"""
+        from funasr import AutoModel
+
+        cache_dir = os.path.join(MODEL_CACHE_DIR, "funasr")
+        os.makedirs(cache_dir, exist_ok=True)
+
+        config = self._get_model_config(model_name)
+
+        kwargs = {"model": config["model"], "model_revision": "v2.0.4"}
+        if "vad_model" in config:
+            kwargs["vad_model"] = config["vad_model"]
+            kwargs["vad_model_revision"] = "v2.0.4"
+        if "punc_model" in config:
+            kwargs["punc_model"] = config["punc_model"]
+            kwargs["punc_model_revision"] = "v2.0.4"
+        if "spk_model" in config:
+            kwargs["spk_model"] = config["spk_model"]
+            kwargs["spk_model_revision"] = "v2.0.2"
+
+        return AutoModel(**kwargs)
+
+    def _use_pipeline(self, model_name: str):
+        return model_cache.use(
+            f"funasr:{model_name}",
+            lambda: self._load_pipeline(model_name),
+            size_hint=self._size_hints.get(model_name, 0),
+        )
 
-        return self._pipeline_cache[model_name]
+    def preload(self, model_name: str = ""):
+        with self._use_pipeline(model_name or "paraformer-zh"):
+            pass
 
     def transcribe(self, audio_path: str, model_name: str = "paraformer-zh",
                    language: Optional[str] = None,
-                   progress_callback=None) -> TranscriptionResult:
+                   progress_callback=None,
+                   segment_callback=None) -> TranscriptionResult:
+        # FunASR 的标点与说话人模型在整段识别完成后才运行，不支持增量输出片段
 
         if not model_name:
             model_name = "paraformer-zh"
@@ -94,12 +112,11 @@ class FunASREngine(BaseEngine):
         if progress_callback:
             progress_callback(0.1, "正在加载FunASR模型...")
 
-        pipeline = self._load_pipeline(model_name)
-
-        if progress_callback:
-            progress_callback(0.3, "模型加载完成，开始转录...")
+        with self._use_pipeline(model_name) as pipeline:
+            if progress_callback:
+                progress_callback(0.3, "模型加载完成，开始转录...")
 
-        result = pipeline.generate(input=audio_path)
+            result = pipeline.generate(input=audio_path)
 
         if progress_callback:
             progress_callback(0.9, "转录完成，正在处理结果...")
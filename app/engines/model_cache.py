@@ -0,0 +1,255 @@
+"""模型缓存 - 按内存预算做 LRU 淘汰、空闲超时卸载，使用中的模型不会被淘汰"""
+import gc
+import time
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Any, Optional
+
+from app.config import MODEL_CACHE_BUDGET_MB, MODEL_IDLE_TTL_SECONDS
+from app import metrics
+
+
+def estimate_model_bytes(model) -> int:
+    """估算模型占用的内存（参数 + buffer 字节数）。
+
+    支持 torch.nn.Module，以及在属性中持有若干 nn.Module 的对象（如 FunASR AutoModel）。
+    无法估算时返回 0。
+    """
+    def module_bytes(m) -> int:
+        total = 0
+        for p in m.parameters():
+            total += p.numel() * p.element_size()
+        for b in m.buffers():
+            total += b.numel() * b.element_size()
+        return total
+
+    try:
+        if hasattr(model, "parameters") and hasattr(model, "buffers"):
+            return module_bytes(model)
+        total = 0
+        seen = set()
+        for value in vars(model).values():
+            if hasattr(value, "parameters") and hasattr(value, "buffers") and id(value) not in seen:
+                seen.add(id(value))
+                total += module_bytes(value)
+        return total
+    except Exception:
+        return 0
+
+
+class _Entry:
+    def __init__(self, key: str, model, size: int, load_seconds: float):
+        self.key = key
+        self.model = model
+        self.size = size
+        self.refs = 0
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+        self.load_seconds = load_seconds
+        self.uses = 0
+
+
+class ModelCache:
+    """进程内共享的模型缓存。
+
+    - 所有模型总大小超过 budget_bytes 时，按最近最少使用淘汰未被引用的模型
+    - 空闲超过 idle_ttl 秒的模型由后台线程卸载
+    - 通过 use()/acquire() 获取的模型在释放前引用计数 > 0，不会被淘汰
+    """
+
+    def __init__(self, budget_bytes: int = MODEL_CACHE_BUDGET_MB * 1024 * 1024,
+                 idle_ttl: float = MODEL_IDLE_TTL_SECONDS):
+        self._budget = budget_bytes
+        self._idle_ttl = idle_ttl
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._loading = set()
+        self._cond = threading.Condition()
+        self._sweeper: Optional[threading.Thread] = None
+        self.evictions = 0
+        # 尚未上报给主进程的加载记录 (key, 耗时秒数)（工作进程中使用，主进程中只保留最近若干条）
+        self._recent_loads: deque = deque(maxlen=100)
+
+    def set_budget(self, budget_bytes: int):
+        """调整内存预算（引擎工作进程启动时按进程数分摊总预算），超出部分立即淘汰"""
+        with self._cond:
+            self._budget = budget_bytes
+            evicted = self._evict()
+        self._unload(evicted)
+
+    # ---- 获取 / 释放 ----
+
+    def acquire(self, key: str, loader: Callable[[], Any], size_hint: int = 0):
+        """获取模型并增加引用计数，不存在时调用 loader 加载（同一 key 只加载一次）"""
+        with self._cond:
+            self._ensure_sweeper()
+            while key in self._loading:
+                self._cond.wait()
+            entry = self._entries.get(key)
+            if entry:
+                entry.refs += 1
+                entry.uses += 1
+                self._entries.move_to_end(key)
+                return entry.model
+            self._loading.add(key)
+            # 加载前先按预估大小腾出空间，降低峰值内存
+            evicted = self._evict(reserve=size_hint)
+        self._unload(evicted)
+
+        try:
+            started = time.perf_counter()
+            model = loader()
+            load_seconds = time.perf_counter() - started
+            size = estimate_model_bytes(model) or size_hint
+        except BaseException:
+            with self._cond:
+                self._loading.discard(key)
+                self._cond.notify_all()
+            raise
+
+        with self._cond:
+            entry = _Entry(key, model, size, load_seconds)
+            entry.refs = 1
+            entry.uses = 1
+            self._entries[key] = entry
+            self._loading.discard(key)
+            self._recent_loads.append((key, load_seconds))
+            evicted = self._evict()
+            self._cond.notify_all()
+        self._unload(evicted)
+        metrics.MODEL_LOAD_SECONDS.observe(load_seconds, model=key)
+        print(f"[模型缓存] 已加载 {key}（{size / 1024 / 1024:.0f}MB，{load_seconds:.1f}s）")
+        return model
+
+    def release(self, key: str):
+        with self._cond:
+            entry = self._entries.get(key)
+            if entry:
+                entry.refs = max(0, entry.refs - 1)
+                entry.last_used = time.time()
+            evicted = self._evict()
+        self._unload(evicted)
+
+    @contextmanager
+    def use(self, key: str, loader: Callable[[], Any], size_hint: int = 0):
+        model = self.acquire(key, loader, size_hint)
+        try:
+            yield model
+        finally:
+            self.release(key)
+
+    def preload(self, key: str, loader: Callable[[], Any], size_hint: int = 0):
+        """加载模型并放入缓存，不保留引用"""
+        self.acquire(key, loader, size_hint)
+        self.release(key)
+
+    # ---- 淘汰 ----
+
+    def _total_bytes(self) -> int:
+        return sum(e.size for e in self._entries.values())
+
+    def _evict(self, reserve: int = 0) -> List[_Entry]:
+        # 调用方需持有 self._cond；按 LRU 顺序从缓存中移除未被引用的模型，
+        # 返回被移除的条目，由调用方释放锁后交给 _unload() 回收。
+        # 不加载新模型时保留最近使用的一个，单个模型超出预算也不会每次用完即卸载
+        evicted = []
+        keep = None if reserve else next(reversed(self._entries), None)
+        for key in list(self._entries):
+            if self._total_bytes() + reserve <= self._budget:
+                break
+            entry = self._entries[key]
+            if entry.refs == 0 and key != keep:
+                evicted.append(self._entries.pop(key))
+        self._count_evicted(evicted, "超出内存预算")
+        return evicted
+
+    def sweep(self):
+        """卸载空闲超过 idle_ttl 的模型"""
+        now = time.time()
+        with self._cond:
+            expired = [
+                self._entries.pop(key) for key, e in list(self._entries.items())
+                if e.refs == 0 and now - e.last_used > self._idle_ttl
+            ]
+            self._count_evicted(expired, "空闲超时")
+        self._unload(expired)
+
+    def _count_evicted(self, entries: List[_Entry], reason: str):
+        # 调用方需持有 self._cond
+        self.evictions += len(entries)
+        for e in entries:
+            print(f"[模型缓存] 卸载 {e.key}（{reason}）")
+
+    @staticmethod
+    def _unload(entries: List[_Entry]):
+        """释放已移出缓存的模型并回收内存。
+
+        不持有 self._cond 调用：大模型的垃圾回收可能耗时数秒，期间其他线程仍可获取模型、查询统计。
+        """
+        if not entries:
+            return
+        for e in entries:
+            e.model = None
+        entries.clear()
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except Exception:
+            pass
+
+    def _ensure_sweeper(self):
+        # 调用方需持有 self._cond
+        if self._sweeper is not None or self._idle_ttl <= 0:
+            return
+        interval = max(5.0, min(60.0, self._idle_ttl / 2))
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                self.sweep()
+
+        self._sweeper = threading.Thread(target=loop, name="model-cache-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def clear(self):
+        """卸载所有未被使用的模型"""
+        with self._cond:
+            idle = [self._entries.pop(k) for k, e in list(self._entries.items()) if e.refs == 0]
+            self._count_evicted(idle, "手动清理")
+        self._unload(idle)
+
+    def drain_loads(self) -> List[tuple]:
+        """取出并清空最近的模型加载记录"""
+        with self._cond:
+            loads = list(self._recent_loads)
+            self._recent_loads.clear()
+        return loads
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._cond:
+            models = [
+                {
+                    "key": e.key,
+                    "bytes": e.size,
+                    "in_use": e.refs,
+                    "uses": e.uses,
+                    "load_seconds": round(e.load_seconds, 2),
+                    "loaded_at": e.loaded_at,
+                    "idle_seconds": round(now - e.last_used, 1) if e.refs == 0 else 0.0,
+                }
+                for e in reversed(self._entries.values())
+            ]
+            return {
+                "budget_bytes": self._budget,
+                "total_bytes": self._total_bytes(),
+                "idle_ttl": self._idle_ttl,
+                "evictions": self.evictions,
+                "models": models,
+            }
+
+
+# 全局单例（每个进程一个）
+model_cache = ModelCache()
@@ -0,0 +1,201 @@
+"""引擎能力探测 - 在子进程中检测各引擎依赖是否可用，结果按已安装包版本缓存到磁盘。
+
+探测需要导入 whisper / funasr（会连带导入 torch），耗时数秒，因此只在后台执行一次；
+已安装包的版本没有变化时直接复用上次的结果。
+
+也可以单独运行：python -m app.engines.probe
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import threading
+import subprocess
+from importlib import metadata
+from typing import Dict, List, Any, Optional
+
+from app.config import MODEL_CACHE_DIR, BASE_DIR
+from app.engines.base import get_all_engines
+
+PROBE_CACHE_PATH = os.path.join(MODEL_CACHE_DIR, "engine_probe.json")
+PROBE_TIMEOUT_SECONDS = 180
+
+
+def _package_versions(packages: List[str]) -> Dict[str, str]:
+    versions = {}
+    for pkg in packages:
+        try:
+            versions[pkg] = metadata.version(pkg)
+        except metadata.PackageNotFoundError:
+            versions[pkg] = ""
+    return versions
+
+
+def _fingerprint() -> str:
+    """当前解释器与各引擎依赖包版本的指纹（只读包元数据，不导入包）"""
+    parts = [sys.executable, sys.version]
+    for name, engine in sorted(get_all_engines().items()):
+        for pkg, ver in sorted(_package_versions(engine.packages).items()):
+            parts.append(f"{name}:{pkg}={ver}")
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def probe_in_process() -> Dict[str, Dict[str, Any]]:
+    """在当前进程中探测所有引擎"""
+    results = {}
+    for name, engine in get_all_engines().items():
+        started = time.perf_counter()
+        try:
+            available = bool(engine.is_available())
+        except Exception:
+            available = False
+        results[name] = {
+            "available": available,
+            "versions": _package_versions(engine.packages),
+            "probe_seconds": round(time.perf_counter() - started, 3),
+        }
+    return results
+
+
+def _probe_subprocess() -> Optional[Dict[str, Dict[str, Any]]]:
+    """在子进程中探测，避免把 torch 等重量级依赖导入 API 进程"""
+    if getattr(sys, "frozen", False):
+        return None
+    try:
+        proc = subprocess.run(
+            [sys.executable, "-m", "app.engines.probe"],
+            cwd=BASE_DIR, capture_output=True, text=True,
+            timeout=PROBE_TIMEOUT_SECONDS,
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        print(f"[引擎探测] 子进程探测失败: {e}")
+        return None
+    if proc.returncode != 0:
+        print(f"[引擎探测] 子进程探测失败: {proc.stderr.strip()[-500:]}")
+        return None
+    # 引擎库可能向 stdout 打印日志，结果在最后一行
+    lines = [line for line in proc.stdout.splitlines() if line.strip()]
+    try:
+        return json.loads(lines[-1]) if lines else None
+    except ValueError:
+        return None
+
+
+class EngineProbe:
+    """引擎能力探测结果的缓存。启动时在后台线程中执行，调用方按需等待结果。"""
+
+    def __init__(self, cache_path: str = PROBE_CACHE_PATH):
+        self._cache_path = cache_path
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._results: Dict[str, Dict[str, Any]] = {}
+        self.source = ""
+        self.probed_at = 0.0
+        self.elapsed = 0.0
+
+    def start(self, force: bool = False):
+        """启动后台探测（已在进行中时不重复启动）"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if self._ready.is_set() and not force:
+                return
+            self._ready.clear()
+            self._thread = threading.Thread(
+                target=self._run, args=(force,), name="engine-probe", daemon=True
+            )
+            self._thread.start()
+
+    def _load_cached(self, fingerprint: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        try:
+            with open(self._cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("fingerprint") != fingerprint:
+            return None
+        self.probed_at = data.get("probed_at", 0.0)
+        return data.get("engines")
+
+    def _save_cached(self, fingerprint: str, results: Dict[str, Dict[str, Any]]):
+        tmp_path = self._cache_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({
+                    "fingerprint": fingerprint,
+                    "probed_at": self.probed_at,
+                    "engines": results,
+                }, f, ensure_ascii=False)
+            os.replace(tmp_path, self._cache_path)
+        except OSError as e:
+            print(f"[引擎探测] 缓存写入失败: {e}")
+
+    def _run(self, force: bool):
+        started = time.perf_counter()
+        try:
+            fingerprint = _fingerprint()
+            results = None if force else self._load_cached(fingerprint)
+            if results is not None:
+                self.source = "cache"
+            else:
+                results = _probe_subprocess()
+                self.source = "subprocess"
+                if results is None:
+                    results = probe_in_process()
+                    self.source = "in-process"
+                self.probed_at = time.time()
+                self._save_cached(fingerprint, results)
+            self._results = results
+        except Exception as e:
+            print(f"[引擎探测] 失败: {e}")
+            self._results = {}
+            self.source = "error"
+        finally:
+            self.elapsed = time.perf_counter() - started
+            self._ready.set()
+        available = [n for n, r in self._results.items() if r.get("available")]
+        print(f"[引擎探测] 可用引擎: {', '.join(available) or '无'}"
+              f"（来源: {self.source}，{self.elapsed:.2f}s）")
+
+    def wait(self, timeout: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        self.start()
+        self._ready.wait(timeout)
+        return self._results
+
+    def is_available(self, name: str) -> bool:
+        return bool(self.wait().get(name, {}).get("available"))
+
+    def describe(self) -> List[Dict[str, Any]]:
+        """与旧版 get_available_engines() 相同的结构，附带依赖包版本"""
+        results = self.wait()
+        engines = []
+        for name, engine in get_all_engines().items():
+            info = results.get(name, {})
+            available = bool(info.get("available"))
+            engines.append({
+                "name": engine.name,
+                "display_name": engine.display_name,
+                "description": engine.description,
+                "available": available,
+                "versions": info.get("versions", {}),
+                "models": engine.get_models() if available else [],
+            })
+        return engines
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self._ready.is_set(),
+            "source": self.source,
+            "probed_at": self.probed_at,
+            "elapsed": round(self.elapsed, 3),
+        }
+
+
+# 全局单例
+engine_probe = EngineProbe()
+
+
+if __name__ == "__main__":
+    print(json.dumps(probe_in_process(), ensure_ascii=False))
@@ -1,20 +1,108 @@
 """Whisper 转录引擎"""
 import os
+import sys
+import types
+import threading
 from typing import Dict, List, Any, Optional
 
 from app.engines.base import (
     BaseEngine, TranscriptionResult, TranscriptionSegment, register_engine
 )
+from app.engines.model_cache import model_cache
 from app.config import MODEL_CACHE_DIR
 
+# whisper 梅尔频谱每秒帧数（HOP_LENGTH = 160 @ 16kHz）
+_FRAMES_PER_SECOND = 100
+
+# 当前线程正在进行的转录的窗口回调
+_progress_local = threading.local()
+
+# 窗口回调依赖 whisper.transcribe 的内部实现（模块级的 tqdm 与局部变量 all_segments），
+# requirements.txt 固定了验证过的 whisper 版本范围；实现不符时只在日志中提示一次，转录照常进行
+_original_tqdm = None
+_hook_warned = False
+
+
+def _warn_hook_once(reason: str):
+    global _hook_warned
+    if not _hook_warned:
+        _hook_warned = True
+        print(f"[Whisper] 无法在转录过程中输出部分结果（{reason}），完成后仍返回完整结果；"
+              f"请使用 requirements.txt 中固定的 openai-whisper 版本")
+
+
+class _WhisperProgress:
+    """替换 whisper.transcribe 中的 tqdm 进度条。
+
+    whisper 每解码完一个 30 秒窗口调用一次 update(已处理帧数)；进度条创建前
+    all_segments 列表已经存在且之后只做 extend，因此可以在 update 时取出新增片段。
+    """
+
+    def __init__(self, callback, segments: Optional[list], total: int):
+        self.total = total or 0
+        self.n = 0
+        self._callback = callback
+        self._segments = segments
+        self._emitted = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def update(self, n=1):
+        self.n += n
+        _progress_local.called = True
+        new_segments = []
+        if self._segments is not None:
+            new_segments = self._segments[self._emitted:]
+            self._emitted = len(self._segments)
+        self._callback(new_segments, self.n / _FRAMES_PER_SECOND, self.total / _FRAMES_PER_SECOND)
+
+
+def _make_progress(*args, **kwargs):
+    """whisper.transcribe 中 tqdm.tqdm(...) 的替代；当前线程没有本引擎发起的转录时使用原来的 tqdm"""
+    callback = getattr(_progress_local, "callback", None)
+    if callback is None:
+        return _original_tqdm(*args, **kwargs)
+    # 调用方是 whisper.transcribe.transcribe 的栈帧
+    segments = sys._getframe(1).f_locals.get("all_segments")
+    if not isinstance(segments, list):
+        _warn_hook_once("whisper.transcribe 中未找到 all_segments")
+        segments = None
+    return _WhisperProgress(callback, segments, kwargs.get("total") or 0)
+
+
+def _install_progress_hook():
+    global _original_tqdm
+    module = sys.modules.get("whisper.transcribe")
+    tqdm_module = getattr(module, "tqdm", None)
+    current = getattr(tqdm_module, "tqdm", None)
+    if current is _make_progress:
+        return
+    if not callable(current):
+        _warn_hook_once("whisper.transcribe 中未找到 tqdm")
+        return
+    _original_tqdm = current
+    module.tqdm = types.SimpleNamespace(tqdm=_make_progress)
+
 
 class WhisperEngine(BaseEngine):
     name = "whisper"
     display_name = "OpenAI Whisper"
     description = "OpenAI开源语音识别模型，支持多语言，精度高"
     supported_languages = ["auto", "zh", "en", "ja", "ko", "fr", "de", "es", "ru"]
+    packages = ["openai-whisper", "torch"]
 
-    _model_cache = {}
+    # 各模型的内存占用预估（字节），加载前用于提前在模型缓存中腾出空间
+    _size_hints = {
+        "tiny": 75 * 1024 * 1024,
+        "base": 145 * 1024 * 1024,
+        "small": 480 * 1024 * 1024,
+        "medium": 1500 * 1024 * 1024,
+        "large": 3000 * 1024 * 1024,
+    }
 
     def is_available(self) -> bool:
         try:
@@ -33,18 +121,37 @@ class WhisperEngine(BaseEngine):
         ]
 
     def _load_model(self, model_name: str):
-        if model_name not in self._model_cache:
-            import whisper
-            download_root = os.path.join(MODEL_CACHE_DIR, "whisper")
-            os.makedirs(download_root, exist_ok=True)
-            self._model_cache[model_name] = whisper.load_model(
-                model_name, download_root=download_root
-            )
-        return self._model_cache[model_name]
+        """从磁盘加载模型（不经过缓存）"""
+        import whisper
+        download_root = os.path.join(MODEL_CACHE_DIR, "whisper")
+        os.makedirs(download_root, exist_ok=True)
+        return whisper.load_model(model_name, download_root=download_root)
+
+    def _use_model(self, model_name: str):
+        return model_cache.use(
+            f"whisper:{model_name}",
+            lambda: self._load_model(model_name),
+            size_hint=self._size_hints.get(model_name, 0),
+        )
+
+    def preload(self, model_name: str = ""):
+        with self._use_model(model_name or "base"):
+            pass
+
+    @staticmethod
+    def _to_segment(seg: Dict[str, Any]) -> TranscriptionSegment:
+        return TranscriptionSegment(
+            start=seg["start"],
+            end=seg["end"],
+            text=seg["text"],
+            confidence=seg.get("avg_logprob", 0),
+            speaker=seg.get("speaker", ""),
+        )
 
     def transcribe(self, audio_path: str, model_name: str = "base",
                    language: Optional[str] = None,
-                   progress_callback=None) -> TranscriptionResult:
+                   progress_callback=None,
+                   segment_callback=None) -> TranscriptionResult:
         import whisper
 
         if not model_name:
@@ -53,29 +160,39 @@ class WhisperEngine(BaseEngine):
         if progress_callback:
             progress_callback(0.1, "正在加载Whisper模型...")
 
-        model = self._load_model(model_name)
-
-        if progress_callback:
-            progress_callback(0.3, "模型加载完成，开始转录...")
-
         options = {"verbose": False}
         if language and language != "auto":
             options["language"] = language
 
-        result = model.transcribe(audio_path, **options)
+        with self._use_model(model_name) as model:
+            if progress_callback:
+                progress_callback(0.3, "模型加载完成，开始转录...")
+
+            def on_window(new_segments, processed, total):
+                if segment_callback and new_segments:
+                    decoded = [self._to_segment(s) for s in new_segments if s["text"].strip()]
+                    if decoded:
+                        segment_callback(decoded, processed)
+                if progress_callback and total > 0:
+                    progress_callback(
+                        0.3 + 0.6 * min(1.0, processed / total),
+                        f"正在转录 {processed:.0f}/{total:.0f} 秒",
+                    )
+
+            _install_progress_hook()
+            _progress_local.callback = on_window
+            _progress_local.called = False
+            try:
+                result = model.transcribe(audio_path, **options)
+                if not _progress_local.called and result.get("segments"):
+                    _warn_hook_once("whisper.transcribe 未调用进度条")
+            finally:
+                _progress_local.callback = None
 
         if progress_callback:
             progress_callback(0.9, "转录完成，正在处理结果...")
 
-        segments = []
-        for seg in result.get("segments", []):
-            segments.append(TranscriptionSegment(
-                start=seg["start"],
-                end=seg["end"],
-                text=seg["text"],
-                confidence=seg.get("avg_logprob", 0),
-                speaker=seg.get("speaker", ""),
-            ))
+        segments = [self._to_segment(seg) for seg in result.get("segments", [])]
 
         detected_lang = result.get("language", language or "")
 
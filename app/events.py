@@ -0,0 +1,80 @@
+"""任务事件推送 - 任务进度、完成与失败事件经 Server-Sent Events 推送给前端"""
+import json
+import asyncio
+import threading
+from typing import Any, Dict, Optional, Set
+
+from app.config import EVENT_QUEUE_SIZE
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """格式化为一条 SSE 消息"""
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+class Subscription:
+    """一个 SSE 连接的订阅。事件在发布线程中格式化，经 call_soon_threadsafe 送入连接所在事件循环的队列"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxsize: int):
+        self.loop = loop
+        self.queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def _put(self, message: str):
+        # 在事件循环线程中执行；客户端读取过慢导致队列满时断开连接，由客户端重连后重新获取快照
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class EventBus:
+    """进程内事件总线，可从任意线程发布"""
+
+    def __init__(self, maxsize: int = EVENT_QUEUE_SIZE):
+        self._subs: Set[Subscription] = set()
+        self._lock = threading.Lock()
+        self._maxsize = maxsize
+        self.published = 0
+
+    def subscribe(self) -> Subscription:
+        """在事件循环中调用"""
+        sub = Subscription(asyncio.get_running_loop(), self._maxsize)
+        with self._lock:
+            self._subs.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            self._subs.discard(sub)
+
+    def has_subscribers(self) -> bool:
+        return bool(self._subs)
+
+    def publish(self, event: str, data: Dict[str, Any]):
+        """发布事件；没有订阅者时不做任何序列化，每个事件只序列化一次"""
+        with self._lock:
+            subs = list(self._subs)
+        if not subs:
+            return
+        message = format_sse(event, data)
+        self.published += 1
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(sub._put, message)
+            except RuntimeError:
+                # 事件循环已关闭
+                self.unsubscribe(sub)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"subscribers": len(self._subs), "published": self.published}
+
+
+# 全局单例
+event_bus = EventBus()
@@ -0,0 +1,278 @@
+"""转录结果导出 - 以生成器逐段渲染 SRT / VTT / TXT / JSON，按结果版本缓存渲染好的文件，
+并支持把多个任务的导出文件流式打包为 ZIP"""
+import os
+import json
+import uuid
+import shutil
+import zipfile
+import threading
+from typing import Callable, Dict, Any, Iterable, Iterator, Optional, Tuple
+
+from app.config import EXPORT_CACHE_DIR, EXPORT_CACHE_MAX_MB
+
+# 格式 -> (扩展名, Content-Type)
+EXPORT_FORMATS = {
+    "srt": (".srt", "text/srt"),
+    "vtt": (".vtt", "text/vtt"),
+    "txt": (".txt", "text/plain"),
+    "json": (".json", "application/json"),
+}
+
+# 渲染与传输时每块的大致字节数
+_CHUNK_SIZE = 64 * 1024
+
+
+# ----------------------------------------------------------------
+# 渲染：每种格式一个生成器，逐片段产出文本
+# ----------------------------------------------------------------
+
+def _format_time_srt(seconds: float) -> str:
+    h = int(seconds // 3600)
+    m = int((seconds % 3600) // 60)
+    s = int(seconds % 60)
+    ms = int((seconds % 1) * 1000)
+    return f"{h:02d}:{m:02d}:{s:02d},{ms:03d}"
+
+
+def _format_time_vtt(seconds: float) -> str:
+    h = int(seconds // 3600)
+    m = int((seconds % 3600) // 60)
+    s = int(seconds % 60)
+    ms = int((seconds % 1) * 1000)
+    return f"{h:02d}:{m:02d}:{s:02d}.{ms:03d}"
+
+
+def _iter_srt(result: Dict[str, Any]) -> Iterator[str]:
+    for i, seg in enumerate(result.get("segments", []), 1):
+        start = _format_time_srt(seg["start"])
+        end = _format_time_srt(seg["end"])
+        speaker = seg.get("speaker", "")
+        text = f"[{speaker}] {seg['text']}" if speaker else seg["text"]
+        if i > 1:
+            yield "\n"
+        yield f"{i}\n{start} --> {end}\n{text}\n"
+
+
+def _iter_vtt(result: Dict[str, Any]) -> Iterator[str]:
+    yield "WEBVTT\n"
+    for seg in result.get("segments", []):
+        start = _format_time_vtt(seg["start"])
+        end = _format_time_vtt(seg["end"])
+        speaker = seg.get("speaker", "")
+        text = f"<v {speaker}>{seg['text']}" if speaker else seg["text"]
+        yield f"\n{start} --> {end}\n{text}\n"
+
+
+def _iter_txt(result: Dict[str, Any]) -> Iterator[str]:
+    yield result.get("full_text", "")
+
+
+def _iter_json(result: Dict[str, Any]) -> Iterator[str]:
+    yield from json.JSONEncoder(ensure_ascii=False, indent=2).iterencode(result)
+
+
+_RENDERERS = {
+    "srt": _iter_srt,
+    "vtt": _iter_vtt,
+    "txt": _iter_txt,
+    "json": _iter_json,
+}
+
+
+def iter_export(result: Dict[str, Any], fmt: str) -> Iterator[bytes]:
+    """按格式渲染转录结果，产出约 64KB 的 UTF-8 数据块"""
+    buf, size = [], 0
+    for text in _RENDERERS[fmt](result):
+        data = text.encode("utf-8")
+        buf.append(data)
+        size += len(data)
+        if size >= _CHUNK_SIZE:
+            yield b"".join(buf)
+            buf, size = [], 0
+    if buf:
+        yield b"".join(buf)
+
+
+def export_filename(filename: str, fmt: str) -> str:
+    return os.path.splitext(filename)[0] + EXPORT_FORMATS[fmt][0]
+
+
+# ----------------------------------------------------------------
+# 缓存：EXPORT_CACHE_DIR/{task_id}/{结果版本}.{扩展名}
+# ----------------------------------------------------------------
+
+class ExportCache:
+    """渲染好的导出文件缓存。
+
+    文件名包含结果版本号（结果完成、编辑或重新转录时改变），旧版本的文件不会被读取；
+    同一任务写入新版本时删除旧版本文件。总大小超过上限时按最近使用时间淘汰。
+    """
+
+    def __init__(self, cache_dir: str = EXPORT_CACHE_DIR,
+                 max_bytes: int = EXPORT_CACHE_MAX_MB * 1024 * 1024):
+        self._dir = cache_dir
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _task_dir(self, task_id: str) -> str:
+        return os.path.join(self._dir, task_id)
+
+    def _path(self, task_id: str, version: str, fmt: str) -> str:
+        return os.path.join(self._task_dir(task_id), f"{version}{EXPORT_FORMATS[fmt][0]}")
+
+    def get(self, task_id: str, version: str, fmt: str) -> Optional[str]:
+        """已缓存的导出文件路径，不存在返回 None"""
+        path = self._path(task_id, version, fmt)
+        try:
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def render(self, task_id: str, version: str, fmt: str, result: Dict[str, Any],
+               is_current: Callable[[], bool]) -> Iterator[bytes]:
+        """渲染并产出导出数据，同时写入缓存。
+
+        写完后结果版本已变化（渲染期间被编辑）时丢弃缓存文件；生成器未消费完
+        （如客户端断开）时删除临时文件。
+        """
+        path = self._path(task_id, version, fmt)
+        task_dir = os.path.dirname(path)
+        os.makedirs(task_dir, exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        completed = False
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in iter_export(result, fmt):
+                    f.write(chunk)
+                    yield chunk
+            completed = True
+        finally:
+            if not completed:
+                _remove(tmp_path)
+        if not is_current():
+            _remove(tmp_path)
+            return
+        try:
+            os.replace(tmp_path, path)
+            # 同一任务的旧版本文件不再会被读取
+            for name in os.listdir(task_dir):
+                if not name.startswith(version + ".") and not name.endswith(".tmp"):
+                    _remove(os.path.join(task_dir, name))
+        except OSError:
+            # 任务目录已被并发删除
+            _remove(tmp_path)
+            return
+        self._evict()
+
+    def iter_cached(self, task_id: str, version: str, fmt: str, result: Dict[str, Any],
+                    is_current: Callable[[], bool]) -> Iterator[bytes]:
+        """有缓存时读取缓存文件，否则渲染（并写入缓存）"""
+        path = self.get(task_id, version, fmt)
+        if path is None:
+            yield from self.render(task_id, version, fmt, result, is_current)
+            return
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+    def invalidate(self, task_id: str):
+        """删除任务的全部导出缓存（任务被删除或结果被替换时调用）"""
+        task_dir = self._task_dir(task_id)
+        if os.path.isdir(task_dir):
+            shutil.rmtree(task_dir, ignore_errors=True)
+
+    def _evict(self):
+        with self._lock:
+            files, total = [], 0
+            for entry in _scan_files(self._dir):
+                st = entry.stat()
+                files.append((st.st_mtime, entry.path, st.st_size))
+                total += st.st_size
+            if total <= self._max_bytes:
+                return
+            files.sort()
+            for _, path, size in files:
+                if total <= self._max_bytes:
+                    break
+                _remove(path)
+                total -= size
+
+    def stats(self) -> Dict[str, Any]:
+        files = list(_scan_files(self._dir)) if os.path.isdir(self._dir) else []
+        return {
+            "files": len(files),
+            "bytes": sum(e.stat().st_size for e in files),
+            "max_bytes": self._max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def _scan_files(root: str) -> Iterator[os.DirEntry]:
+    if not os.path.isdir(root):
+        return
+    for task_entry in os.scandir(root):
+        if task_entry.is_dir():
+            for entry in os.scandir(task_entry.path):
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    yield entry
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# ----------------------------------------------------------------
+# ZIP 打包：边压缩边输出，不在内存或磁盘中生成完整压缩包
+# ----------------------------------------------------------------
+
+class _ZipSink:
+    """zipfile 的输出目标：只追加、不可定位，写入的数据由生成器取走"""
+
+    def __init__(self):
+        self._parts = []
+        self.size = 0
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        self.size = 0
+        return data
+
+
+def iter_zip(entries: Iterable[Tuple[str, Iterable[bytes]]]) -> Iterator[bytes]:
+    """将 (压缩包内文件名, 数据块迭代器) 依次写入 ZIP 并产出压缩后的数据块"""
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for arcname, chunks in entries:
+            with zf.open(arcname, "w") as dest:
+                for chunk in chunks:
+                    dest.write(chunk)
+                    if sink.size >= _CHUNK_SIZE:
+                        yield sink.take()
+            if sink.size:
+                yield sink.take()
+    yield sink.take()
+
+
+# 全局单例
+export_cache = ExportCache()
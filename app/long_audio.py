@@ -0,0 +1,271 @@
+"""长音频模式 - 在静音处切分 16kHz WAV，多进程并行转录后拼接"""
+import os
+import wave
+import shutil
+import tempfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Any, Optional, Tuple
+
+from app.config import (
+    LONG_AUDIO_CHUNK_SECONDS, LONG_AUDIO_OVERLAP_SECONDS, UPLOAD_DIR,
+)
+from app.audio_utils import wav_pcm_layout
+from app.engines.base import TranscriptionResult, TranscriptionSegment
+
+# 能量 VAD 参数
+_FRAME_SECONDS = 0.03
+_MIN_SILENCE_SECONDS = 0.3
+# 静音阈值下限（int16 幅度 RMS，约 -50 dBFS）
+_MIN_SILENCE_RMS = 100.0
+# 静音至少比响亮部分（能量 90 分位）低 20 dB，没有停顿的连续音频不会被当成静音切开
+_MAX_SILENCE_RATIO = 0.1
+
+
+class AudioChunk:
+    """切分出的一段音频。
+
+    [core_start, core_end) 是该片段负责的区间；[audio_start, audio_end)
+    是实际送去转录的区间，切分点不在静音中时会向两侧扩展重叠部分。
+    """
+    def __init__(self, index: int, core_start: float, core_end: float,
+                 audio_start: float, audio_end: float):
+        self.index = index
+        self.core_start = core_start
+        self.core_end = core_end
+        self.audio_start = audio_start
+        self.audio_end = audio_end
+        self.path = ""
+
+
+def _frame_energies(wav_path: str):
+    """以内存映射方式分块计算每帧 RMS 能量，返回 (能量数组, 帧长秒数)"""
+    import numpy as np
+
+    offset, n_samples, rate = wav_pcm_layout(wav_path)
+    frame_len = max(1, int(rate * _FRAME_SECONDS))
+    n_frames = n_samples // frame_len
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32), frame_len / rate
+
+    pcm = np.memmap(wav_path, dtype="<i2", mode="r", offset=offset,
+                    shape=(n_frames * frame_len,))
+    energies = np.empty(n_frames, dtype=np.float32)
+    block = 2000  # 每次处理约 60 秒
+    for i in range(0, n_frames, block):
+        j = min(n_frames, i + block)
+        x = pcm[i * frame_len:j * frame_len].astype(np.float32).reshape(-1, frame_len)
+        energies[i:j] = np.sqrt(np.mean(x * x, axis=1))
+    del pcm
+    return energies, frame_len / rate
+
+
+def _silence_runs(silent, lo: int, hi: int) -> List[Tuple[int, int]]:
+    """返回 [lo, hi) 中连续静音帧区间列表"""
+    runs = []
+    start = None
+    for i in range(lo, hi):
+        if silent[i]:
+            if start is None:
+                start = i
+        elif start is not None:
+            runs.append((start, i))
+            start = None
+    if start is not None:
+        runs.append((start, hi))
+    return runs
+
+
+def plan_chunks(wav_path: str, max_chunk_seconds: float = LONG_AUDIO_CHUNK_SECONDS,
+                overlap_seconds: float = LONG_AUDIO_OVERLAP_SECONDS) -> List[AudioChunk]:
+    """在静音处规划切分点，每段不超过 max_chunk_seconds。
+
+    在每段后半部分寻找最长的静音区间并在其中点切分；找不到足够长的静音时
+    在能量最低的帧处切分，并让相邻片段重叠 overlap_seconds。
+    """
+    import numpy as np
+
+    energies, frame_seconds = _frame_energies(wav_path)
+    n_frames = len(energies)
+    total = n_frames * frame_seconds
+    if n_frames == 0 or total <= max_chunk_seconds:
+        return [AudioChunk(0, 0.0, total, 0.0, total)]
+
+    noise_floor, loud = (float(v) for v in np.percentile(energies, [10, 90]))
+    threshold = min(noise_floor * 3.0, loud * _MAX_SILENCE_RATIO)
+    silent = energies < max(threshold, _MIN_SILENCE_RMS)
+    min_run = max(1, int(_MIN_SILENCE_SECONDS / frame_seconds))
+    max_frames = int(max_chunk_seconds / frame_seconds)
+
+    cuts = [(0, True)]
+    pos = 0
+    while n_frames - pos > max_frames:
+        lo = pos + max_frames // 2
+        hi = pos + max_frames
+        runs = [r for r in _silence_runs(silent, lo, hi) if r[1] - r[0] >= min_run]
+        if runs:
+            # 最长的静音区间，长度相同时取靠后的
+            a, b = max(runs, key=lambda r: (r[1] - r[0], r[0]))
+            cut, clean = (a + b) // 2, True
+        else:
+            cut, clean = lo + int(np.argmin(energies[lo:hi])), False
+        cuts.append((cut, clean))
+        pos = cut
+    cuts.append((n_frames, True))
+
+    chunks = []
+    for i in range(len(cuts) - 1):
+        (a, a_clean), (b, b_clean) = cuts[i], cuts[i + 1]
+        core_start, core_end = a * frame_seconds, b * frame_seconds
+        audio_start = core_start if a_clean else max(0.0, core_start - overlap_seconds)
+        audio_end = core_end if b_clean else min(total, core_end + overlap_seconds)
+        chunks.append(AudioChunk(i, core_start, core_end, audio_start, audio_end))
+    return chunks
+
+
+def _write_chunks(wav_path: str, chunks: List[AudioChunk], out_dir: str):
+    with wave.open(wav_path, "rb") as src:
+        rate = src.getframerate()
+        params = src.getparams()
+        for chunk in chunks:
+            start = int(chunk.audio_start * rate)
+            end = int(chunk.audio_end * rate)
+            src.setpos(start)
+            chunk.path = os.path.join(out_dir, f"chunk_{chunk.index:05d}.wav")
+            with wave.open(chunk.path, "wb") as dst:
+                dst.setparams(params)
+                remaining = end - start
+                while remaining > 0:
+                    frames = src.readframes(min(remaining, rate * 30))
+                    if not frames:
+                        break
+                    dst.writeframesraw(frames)
+                    remaining -= len(frames) // (params.sampwidth * params.nchannels)
+
+
+# ----------------------------------------------------------------
+# 片段转录：交给常驻的引擎工作进程（与普通任务共用进程、模型缓存与内存预算）
+# ----------------------------------------------------------------
+
+def _transcribe_chunk(engine_name: str, chunk_path: str, model_name: str,
+                      language: Optional[str]) -> Dict[str, Any]:
+    """转录单个片段：启用引擎工作进程时在工作进程中执行，否则在当前进程内执行"""
+    from app.engines.base import get_engine
+    from app.engine_worker import engine_workers
+
+    if engine_workers.enabled:
+        result = engine_workers.transcribe(
+            engine_name=engine_name, audio_path=chunk_path, model_name=model_name, language=language,
+        )
+        return result.to_dict()
+    engine = get_engine(engine_name)
+    if not engine:
+        raise RuntimeError(f"引擎 {engine_name} 不可用")
+    result = engine.transcribe(audio_path=chunk_path, model_name=model_name, language=language)
+    return result.to_dict()
+
+
+def _parallelism() -> int:
+    """同时转录的片段数：引擎工作进程数（默认随 CPU 核数增加）；未启用工作进程时在当前进程内逐段转录"""
+    from app.engine_worker import engine_workers
+    return engine_workers.size if engine_workers.enabled else 1
+
+
+def stitch_segments(chunks: List[AudioChunk],
+                    chunk_results: Dict[int, Dict[str, Any]]) -> List[TranscriptionSegment]:
+    """将各片段结果平移到全局时间轴并拼接。
+
+    每个片段只保留中点落在其负责区间内的句子，重叠区域因此只出现一次；
+    边界处仍重复出现的相同文本再做一次合并。
+    """
+    segments: List[TranscriptionSegment] = []
+    last = len(chunks) - 1
+    for chunk in chunks:
+        result = chunk_results.get(chunk.index) or {}
+        for seg in result.get("segments", []):
+            start = seg["start"] + chunk.audio_start
+            end = seg["end"] + chunk.audio_start
+            mid = (start + end) / 2
+            if mid < chunk.core_start or (mid >= chunk.core_end and chunk.index != last):
+                continue
+            segments.append(TranscriptionSegment(
+                start=start,
+                end=end,
+                text=seg.get("text", ""),
+                confidence=seg.get("confidence", 1.0),
+                speaker=seg.get("speaker", ""),
+            ))
+
+    segments.sort(key=lambda s: s.start)
+    deduped: List[TranscriptionSegment] = []
+    for seg in segments:
+        if not seg.text:
+            continue
+        if deduped and seg.text == deduped[-1].text and seg.start < deduped[-1].end:
+            deduped[-1].end = max(deduped[-1].end, seg.end)
+            continue
+        deduped.append(seg)
+    return deduped
+
+
+def transcribe_long_audio(engine_name: str, wav_path: str, model_name: str,
+                          language: Optional[str], progress_callback=None,
+                          segment_callback=None) -> TranscriptionResult:
+    """切分长音频并由引擎工作进程并行转录。
+
+    segment_callback 按时间顺序接收已完成片段的句子：前面的片段全部完成后才输出后面的片段。
+    注意：FunASR 的说话人编号只在单个片段内有效，跨片段不保证一致。
+    """
+    if progress_callback:
+        progress_callback(0.1, "正在分析静音位置并切分长音频...")
+
+    chunks = plan_chunks(wav_path)
+    work_dir = tempfile.mkdtemp(prefix="chunks_", dir=UPLOAD_DIR)
+    try:
+        _write_chunks(wav_path, chunks, work_dir)
+        total_seconds = sum(c.audio_end - c.audio_start for c in chunks) or 1.0
+
+        if progress_callback:
+            progress_callback(0.15, f"已切分为 {len(chunks)} 段，开始并行转录...")
+
+        pool = ThreadPoolExecutor(max_workers=_parallelism(), thread_name_prefix="long-audio")
+        futures = {
+            pool.submit(_transcribe_chunk, engine_name, c.path, model_name, language): c
+            for c in chunks
+        }
+        chunk_results: Dict[int, Dict[str, Any]] = {}
+        done_seconds = 0.0
+        next_emit = 0
+        try:
+            for fut in as_completed(futures):
+                chunk = futures[fut]
+                chunk_results[chunk.index] = fut.result()
+                done_seconds += chunk.audio_end - chunk.audio_start
+                if segment_callback:
+                    while next_emit in chunk_results:
+                        emit = chunks[next_emit]
+                        new_segments = stitch_segments(chunks, {emit.index: chunk_results[emit.index]})
+                        if new_segments:
+                            segment_callback(new_segments, emit.core_end)
+                        next_emit += 1
+                if progress_callback:
+                    progress_callback(
+                        0.15 + 0.75 * done_seconds / total_seconds,
+                        f"已完成 {len(chunk_results)}/{len(chunks)} 段",
+                    )
+        finally:
+            # 出错时取消尚未开始的片段，并等待正在转录的片段结束后再删除片段文件
+            pool.shutdown(wait=True, cancel_futures=True)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    segments = stitch_segments(chunks, chunk_results)
+
+    # 自动检测语言时各片段可能不同，取出现最多的
+    languages = Counter(r.get("language", "") for r in chunk_results.values() if r.get("language"))
+    detected_lang = languages.most_common(1)[0][0] if languages else (language or "")
+    engine_label = next(
+        (r.get("engine") for r in chunk_results.values() if r.get("engine")),
+        f"{engine_name}-{model_name}",
+    )
+    return TranscriptionResult(segments=segments, language=detected_lang, engine=engine_label)
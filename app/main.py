@@ -1,21 +1,62 @@
 """FastAPI 主应用"""
 import os
-import threading
-from typing import Optional
-
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+import time
+import asyncio
+import hashlib
+from urllib.parse import quote
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+_MODULE_STARTED = time.perf_counter()
+
+# 启动阶段各组件的导入与初始化耗时（毫秒），启动时打印并通过 /api/system 返回
+STARTUP_TIMES = {}
+
+
+@contextmanager
+def _timed_step(name: str):
+    started = time.perf_counter()
+    yield
+    STARTUP_TIMES[name] = round((time.perf_counter() - started) * 1000, 1)
+
+
+with _timed_step("fastapi"):
+    from fastapi import FastAPI, Form, HTTPException, Request
+    from fastapi.concurrency import run_in_threadpool
+    from starlette.requests import ClientDisconnect
+    from fastapi.staticfiles import StaticFiles
+    from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, Response
+    from pydantic import BaseModel
+
+with _timed_step("app.config"):
+    from app.config import (
+        UPLOAD_DIR, STATIC_DIR, SUPPORTED_FORMATS, MAX_FILE_SIZE_MB, SYSTEM_INFO,
+        UPLOAD_CHUNK_SIZE, EVENT_KEEPALIVE_SECONDS, TASK_LIST_MAX_LIMIT,
+        SEGMENT_WINDOW_MAX, EDIT_BATCH_MAX, WAVEFORM_MAX_BUCKETS, BATCH_MAX_FILES,
+    )
 
-from app.config import (
-    UPLOAD_DIR, STATIC_DIR, SUPPORTED_FORMATS, MAX_FILE_SIZE_MB, SYSTEM_INFO
-)
-from app.audio_utils import convert_to_wav, get_audio_duration
-from app.task_manager import task_manager, run_transcription
+with _timed_step("app.audio_utils"):
+    from app.audio_utils import probe_media
+
+with _timed_step("app.task_manager"):
+    from app.task_manager import TaskBusyError, task_manager
+    from app.result_cache import result_cache
+    from app.blob_store import blob_store
+    from app.storage import storage_manager
+    from app.batches import BatchError, batch_manager
+    from app.uploads import MultipartUpload, UploadError
+    from app.exporters import EXPORT_FORMATS, export_cache, export_filename, iter_zip
+    from app.playback import playback_proxy
+    from app.waveform import (
+        compute_peaks, decode_window, peaks_path, pick_level, read_header, read_window,
+    )
+    from app.events import event_bus, format_sse
+    from app import metrics
 
-import app.engines.whisper_engine
-import app.engines.funasr_engine
-from app.engines.base import get_available_engines
+# 引擎模块在首次使用时才导入，whisper / funasr / torch 只在探测子进程和工作进程中加载
+with _timed_step("app.engines"):
+    from app.engines.base import get_available_engines
+    from app.engines.probe import engine_probe
 
 app = FastAPI(title="AITranscriber", version="1.0.0")
 
@@ -24,8 +65,23 @@ app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
 @app.on_event("startup")
 async def startup_event():
-    """启动时从磁盘加载历史任务"""
-    task_manager.load_history()
+    """启动时从磁盘加载历史任务，并在后台探测引擎能力"""
+    engine_probe.start()
+    with _timed_step("load_history"):
+        task_manager.load_history()
+        batch_manager.load()
+    storage_manager.start()
+    ready_ms = (time.perf_counter() - _MODULE_STARTED) * 1000
+    detail = ", ".join(f"{k} {v:.0f}ms" for k, v in STARTUP_TIMES.items())
+    print(f"[启动] 就绪耗时 {ready_ms:.0f}ms（{detail}）")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """关闭引擎工作进程与任务数据库"""
+    from app.engine_worker import engine_workers
+    engine_workers.shutdown()
+    task_manager.close()
 
 
 def _safe_status(status) -> str:
@@ -41,65 +97,293 @@ async def index():
 
 @app.get("/api/engines")
 async def list_engines():
-    """获取可用转录引擎列表"""
-    engines = get_available_engines()
-    return {"engines": engines}
+    """获取可用转录引擎列表（首次探测完成前会等待）"""
+    engines = await run_in_threadpool(get_available_engines)
+    return {"engines": engines, "probe": engine_probe.stats()}
+
+
+@app.post("/api/engines/refresh")
+async def refresh_engines():
+    """重新探测引擎（安装或升级依赖后使用）"""
+    engine_probe.start(force=True)
+    engines = await run_in_threadpool(get_available_engines)
+    return {"engines": engines, "probe": engine_probe.stats()}
 
 
 @app.get("/api/system")
 async def system_info():
     """系统信息"""
-    return {"system": SYSTEM_INFO}
+    return {
+        "system": SYSTEM_INFO,
+        "startup": {"steps_ms": STARTUP_TIMES},
+        "engine_probe": engine_probe.stats(),
+    }
 
 
-@app.post("/api/upload")
-async def upload_file(
-    file: UploadFile = File(...),
-    engine: str = Form("whisper"),
-    model: str = Form("base"),
-    language: str = Form("auto"),
-):
-    """上传文件并开始转录"""
-    if not file.filename:
-        raise HTTPException(400, "未选择文件")
+@app.get("/api/workers")
+async def workers_info():
+    """转录队列与引擎工作进程状态"""
+    from app.engine_worker import engine_workers
+    return {
+        "queue": task_manager.queue_stats(),
+        "engine_workers": engine_workers.stats(),
+        "events": event_bus.stats(),
+        "persistence": task_manager.persistence_stats(),
+        "playback_proxy": playback_proxy.stats(),
+        "batch_ingest": batch_manager.stats(),
+    }
+
+
+@app.get("/api/models/loaded")
+async def loaded_models():
+    """列出各进程中已加载的模型及其内存占用"""
+    from app.engines.model_cache import model_cache
+    from app.engine_worker import engine_workers
+
+    processes = [{"worker": None, "pid": os.getpid(), **model_cache.stats()}]
+    if engine_workers.enabled:
+        processes.extend(await run_in_threadpool(engine_workers.model_stats))
+    total = sum(p.get("total_bytes", 0) for p in processes)
+    return {"total_bytes": total, "processes": processes}
+
+
+def _collect_queue() -> dict:
+    stats = task_manager.queue_stats()
+    return {("queued",): stats["queued"], ("running",): stats["running"]}
+
+
+def _collect_model_bytes() -> dict:
+    from app.engines.model_cache import model_cache
+    from app.engine_worker import engine_workers
+
+    values = {("api",): model_cache.stats()["total_bytes"]}
+    for p in engine_workers.last_model_stats():
+        values[(f"worker-{p['worker']}",)] = p.get("total_bytes", 0)
+    return values
+
+
+def _collect_result_cache() -> dict:
+    stats = result_cache.stats()
+    return {(k,): stats[k] for k in ("entries", "bytes", "hits", "misses")}
+
+
+def _collect_storage() -> dict:
+    return {(k,): v for k, v in storage_manager.last_usage.items()}
+
+
+metrics.Gauge("aitranscriber_queue_tasks", "调度器中排队 / 运行中的任务数", ["state"],
+              collect=_collect_queue)
+metrics.Gauge("aitranscriber_model_cache_bytes", "各进程模型缓存占用（字节，工作进程为最近一次上报值）",
+              ["process"], collect=_collect_model_bytes)
+metrics.Gauge("aitranscriber_result_cache", "转录结果缓存统计", ["field"],
+              collect=_collect_result_cache)
+metrics.Gauge("aitranscriber_storage_bytes", "数据目录各类别占用（字节，最近一次后台清理时统计）",
+              ["category"], collect=_collect_storage)
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus 文本格式的运行指标"""
+    body = await run_in_threadpool(metrics.render)
+    return Response(body, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/api/storage")
+async def storage_usage():
+    """数据目录各类别的磁盘占用、配额、磁盘剩余空间与最近一次清理结果"""
+    return await run_in_threadpool(storage_manager.usage)
+
+
+@app.post("/api/storage/cleanup")
+async def storage_cleanup():
+    """立即清理孤立文件，超出配额时淘汰最久未播放任务的派生文件"""
+    result = await run_in_threadpool(storage_manager.run)
+    return {"message": "清理完成", **result}
+
+
+def _cache_stats() -> dict:
+    return {"cache": result_cache.stats(), "exports": export_cache.stats(), "media": blob_store.stats()}
+
+
+@app.get("/api/cache")
+async def cache_stats():
+    """转录结果缓存、导出文件缓存与媒体存储统计（条目数、占用、命中/去重次数）"""
+    # 统计需要遍历缓存与媒体存储目录，放到线程池中执行
+    return await run_in_threadpool(_cache_stats)
+
+
+@app.delete("/api/cache")
+async def clear_cache():
+    """清空转录结果缓存"""
+    await run_in_threadpool(result_cache.clear)
+    return {"message": "缓存已清空"}
+
+
+def _check_content_length(request: Request):
+    """请求体声明的长度明显超限时直接拒绝，不读取请求体（预留 1MB 给表单字段等开销）"""
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit():
+        declared_mb = int(content_length) / (1024 * 1024)
+        if declared_mb > MAX_FILE_SIZE_MB + 1:
+            raise HTTPException(400, f"文件大小 {declared_mb:.1f}MB 超过限制 {MAX_FILE_SIZE_MB}MB")
 
-    ext = os.path.splitext(file.filename)[1].lower()
-    if ext not in SUPPORTED_FORMATS:
-        raise HTTPException(400, f"不支持的文件格式: {ext}。支持: {', '.join(sorted(SUPPORTED_FORMATS))}")
 
-    save_path = os.path.join(UPLOAD_DIR, f"{os.urandom(8).hex()}{ext}")
+async def _receive_multipart(request: Request, upload: MultipartUpload):
+    """将请求体逐块交给流式解析器，文件内容直接写入上传目录。
+
+    按 UPLOAD_CHUNK_SIZE 攒批后在线程池中解析写盘；出错或客户端断开时删除已写入的文件。
+    """
+    buf = bytearray()
     try:
-        content = await file.read()
-        size_mb = len(content) / (1024 * 1024)
-        if size_mb > MAX_FILE_SIZE_MB:
-            raise HTTPException(400, f"文件大小 {size_mb:.1f}MB 超过限制 {MAX_FILE_SIZE_MB}MB")
-
-        with open(save_path, "wb") as f:
-            f.write(content)
-    except HTTPException:
-        raise
-    except Exception as e:
+        async for chunk in request.stream():
+            buf += chunk
+            if len(buf) >= UPLOAD_CHUNK_SIZE:
+                await run_in_threadpool(upload.write, bytes(buf))
+                buf.clear()
+        if buf:
+            await run_in_threadpool(upload.write, bytes(buf))
+        await run_in_threadpool(upload.finish)
+    except UploadError as e:
+        await run_in_threadpool(upload.discard)
+        raise HTTPException(400, str(e))
+    except ClientDisconnect:
+        await run_in_threadpool(upload.discard)
+        raise HTTPException(400, "上传已中断")
+    except OSError as e:
+        await run_in_threadpool(upload.discard)
         raise HTTPException(500, f"文件保存失败: {e}")
+    except BaseException:
+        upload.discard()
+        raise
+
 
-    task_id = task_manager.create_task(
+@app.post("/api/upload")
+async def upload_file(request: Request):
+    """上传文件并开始转录。
+
+    表单字段：file（必填）、engine（默认 whisper）、model（默认 base）、language（默认 auto）。
+    请求体不经临时文件缓冲，边接收边写入上传目录。
+    """
+    _check_content_length(request)
+    try:
+        upload = MultipartUpload(request.headers.get("content-type", ""))
+    except UploadError as e:
+        raise HTTPException(400, str(e))
+    await _receive_multipart(request, upload)
+
+    file = next((f for f in upload.files if f.field == "file"), None)
+    for extra in upload.files:
+        if extra is not file:
+            await run_in_threadpool(os.remove, extra.path)
+    if file is None:
+        raise HTTPException(400, "未选择文件")
+    engine = upload.fields.get("engine", "whisper")
+    model = upload.fields.get("model", "base")
+    language = upload.fields.get("language", "auto")
+    save_path, file_size, content_hash = file.path, file.size, file.content_hash
+    metrics.UPLOADS.inc()
+    metrics.UPLOAD_BYTES.inc(file_size)
+
+    # 上传时探测一次媒体信息（只读文件头），结果随任务持久化
+    media_info = await run_in_threadpool(probe_media, save_path)
+    if not media_info.get("probe_error") and not media_info.get("has_audio"):
+        try:
+            os.remove(save_path)
+        except OSError:
+            pass
+        raise HTTPException(400, "文件中未找到音频流")
+
+    # 上传的临时文件被移入按内容寻址的媒体存储（相同内容只保存一份）
+    task_id = await run_in_threadpool(
+        task_manager.create_task,
         filename=file.filename,
         engine=engine,
         model=model,
         language=language,
         file_path=save_path,
+        content_hash=content_hash,
+        file_size=file_size,
+        media_info=media_info,
     )
+    task_manager.submit(task_id)
+
+    return {
+        "task_id": task_id,
+        "message": "任务已创建",
+        "queue_position": task_manager.queue_position(task_id),
+    }
+
+
+@app.post("/api/batch")
+async def create_batch(request: Request):
+    """批量上传：一次提交多个文件，以相同的引擎/模型/语言创建一个批次。
+
+    表单字段：files（可重复）、engine、model、language；请求体边接收边写入上传目录。
+    文件保存后立即返回批次 ID，媒体探测与任务创建在后台进行，任务逐个进入转录队列；
+    不支持或超出大小限制的文件被跳过并记录原因。
+    """
+    try:
+        upload = MultipartUpload(
+            request.headers.get("content-type", ""), strict=False, max_files=BATCH_MAX_FILES,
+        )
+    except UploadError as e:
+        raise HTTPException(400, str(e))
+    await _receive_multipart(request, upload)
+    if not upload.files and not upload.skipped:
+        raise HTTPException(400, "未选择文件")
+
+    uploads = []
+    for f in upload.files:
+        metrics.UPLOADS.inc()
+        metrics.UPLOAD_BYTES.inc(f.size)
+        uploads.append((f.path, f.filename, f.content_hash, f.size))
+    batch_id = await run_in_threadpool(
+        batch_manager.create_from_uploads, uploads, upload.skipped,
+        upload.fields.get("engine", "whisper"),
+        upload.fields.get("model", "base"),
+        upload.fields.get("language", "auto"),
+    )
+    return {"batch_id": batch_id, "batch": batch_manager.get(batch_id, include_tasks=False)}
 
-    def process():
-        try:
-            wav_path = convert_to_wav(save_path)
-            run_transcription(task_id, wav_path, engine, model, language)
-        except Exception as e:
-            task_manager.fail_task(task_id, str(e))
 
-    thread = threading.Thread(target=process, daemon=True)
-    thread.start()
+@app.post("/api/batch/folder")
+async def create_folder_batch(
+    path: str = Form(...),
+    include: str = Form(""),
+    exclude: str = Form(""),
+    recursive: bool = Form(True),
+    engine: str = Form("whisper"),
+    model: str = Form("base"),
+    language: str = Form("auto"),
+):
+    """从服务器本地目录批量导入（目录须位于 BATCH_INGEST_ROOTS 之内）。
 
-    return {"task_id": task_id, "message": "任务已创建"}
+    include / exclude 为逗号分隔的通配符（如 "*.mp3,2024/*"），匹配相对路径或文件名；
+    文件被复制进媒体存储，原目录不受影响。
+    """
+    try:
+        batch_id = await run_in_threadpool(
+            batch_manager.create_from_folder, path, include, exclude, recursive,
+            engine, model, language,
+        )
+    except BatchError as e:
+        raise HTTPException(400, str(e))
+    return {"batch_id": batch_id, "batch": batch_manager.get(batch_id, include_tasks=False)}
+
+
+@app.get("/api/batches")
+async def list_batches():
+    """所有批次的进度汇总"""
+    return {"batches": batch_manager.list_batches()}
+
+
+@app.get("/api/batch/{batch_id}")
+async def get_batch(batch_id: str):
+    """批次详情：进度汇总、各任务状态与跳过的文件"""
+    batch = batch_manager.get(batch_id)
+    if not batch:
+        raise HTTPException(404, "批次不存在")
+    return {"batch": batch}
 
 
 @app.post("/api/task/{task_id}/retranscribe")
@@ -110,40 +394,38 @@ async def retranscribe_task(
     language: str = Form("auto"),
 ):
     """使用已有媒体文件重新转录"""
-    task = task_manager.get_task(task_id)
+    # 只检查媒体文件，不加载转录结果
+    task = await run_in_threadpool(task_manager.get_task, task_id, False)
     if not task:
         raise HTTPException(404, "任务不存在")
 
-    # 检查当前是否正在处理
-    status_str = _safe_status(task["status"])
-    if status_str in ("pending", "processing"):
-        raise HTTPException(400, "任务正在处理中，请等待完成后再重新转录")
-
-    media_path = _find_media(task)
+    media_path = await run_in_threadpool(_find_media, task)
     if not media_path:
         raise HTTPException(400, "媒体文件不存在，无法重新转录")
 
-    # 重置任务状态
-    if not task_manager.reset_task_for_retranscribe(task_id, engine, model, language):
-        raise HTTPException(500, "重置任务失败")
-
-    def process():
-        try:
-            wav_path = convert_to_wav(media_path)
-            run_transcription(task_id, wav_path, engine, model, language)
-        except Exception as e:
-            task_manager.fail_task(task_id, str(e))
-
-    thread = threading.Thread(target=process, daemon=True)
-    thread.start()
+    # 重置任务状态（正在处理中的任务在任务锁内被拒绝，重复提交只有一次生效）
+    try:
+        reset = await run_in_threadpool(
+            task_manager.reset_task_for_retranscribe, task_id, engine, model, language,
+        )
+    except TaskBusyError:
+        raise HTTPException(400, "任务正在处理中，请等待完成后再重新转录")
+    if not reset:
+        raise HTTPException(404, "任务不存在")
+    task_manager.submit(task_id, media_path)
 
-    return {"task_id": task_id, "message": "已开始重新转录"}
+    return {
+        "task_id": task_id,
+        "message": "已开始重新转录",
+        "queue_position": task_manager.queue_position(task_id),
+    }
 
 
 @app.get("/api/task/{task_id}")
-async def get_task(task_id: str):
-    """获取任务状态"""
-    task = task_manager.get_task(task_id)
+async def get_task(task_id: str, include_result: bool = True):
+    """获取任务状态（include_result=false 时不返回转录结果，可配合片段窗口接口使用）"""
+    # 结果不在内存中时要从数据库读取，放到线程池中执行
+    task = await run_in_threadpool(task_manager.get_task, task_id, include_result)
     if not task:
         raise HTTPException(404, "任务不存在")
 
@@ -156,7 +438,14 @@ async def get_task(task_id: str):
         "status": _safe_status(task["status"]),
         "progress": task["progress"],
         "message": task["message"],
-        "result": task["result"],
+        "queue_position": task_manager.queue_position(task_id),
+        "duration": (task.get("media_info") or {}).get("duration"),
+        "media_info": task.get("media_info"),
+        "conversion": task.get("conversion"),
+        "result": task["result"] if include_result else None,
+        "partial_count": len(task.get("partial_segments") or []),
+        "processed_seconds": task.get("processed_seconds"),
+        "has_result": bool(task.get("has_result")),
         "error": task["error"],
         "created_at": task["created_at"],
         "completed_at": task["completed_at"],
@@ -164,10 +453,93 @@ async def get_task(task_id: str):
     return {"task": safe_task}
 
 
+def _read_result(task_id: str, reader, *args):
+    """检查任务存在后读取转录结果（在线程池中执行：获取任务锁、按需从数据库加载结果）。
+
+    任务不存在返回 404，没有转录结果返回 400。
+    """
+    if task_manager.get_task(task_id, include_result=False) is None:
+        raise HTTPException(404, "任务不存在")
+    value = reader(task_id, *args)
+    if value is None:
+        raise HTTPException(400, "转录结果不存在")
+    return value
+
+
+@app.get("/api/task/{task_id}/summary")
+async def get_result_summary(task_id: str):
+    """转录结果概要：片段数、时长、语言、说话人数"""
+    return await run_in_threadpool(_read_result, task_id, task_manager.result_summary)
+
+
+@app.get("/api/task/{task_id}/segments")
+async def get_segments(task_id: str, start: int = 0, end: Optional[int] = None,
+                       t0: Optional[float] = None, t1: Optional[float] = None,
+                       limit: int = SEGMENT_WINDOW_MAX):
+    """按序号范围 [start, end) 或时间范围 [t0, t1)（秒）分段读取转录片段。
+
+    返回 total（总片段数）与本次窗口的 [start, end)，片段序号与编辑接口一致。
+    """
+    limit = max(1, min(limit, SEGMENT_WINDOW_MAX))
+    return await run_in_threadpool(
+        _read_result, task_id, task_manager.get_segments, start, end, t0, t1, limit,
+    )
+
+
+@app.get("/api/task/{task_id}/segment_at")
+async def get_segment_at(task_id: str, t: float):
+    """查找 t 秒处的片段（不在任何片段内时 index 为 null）"""
+    return await run_in_threadpool(_read_result, task_id, task_manager.segment_at, t)
+
+
+def _split_param(value: Optional[str]) -> Optional[list]:
+    if not value:
+        return None
+    items = [v.strip() for v in value.split(",") if v.strip()]
+    return items or None
+
+
+def _encode_cursor(after: Tuple[float, str]) -> str:
+    return f"{after[0]!r}:{after[1]}"
+
+
+def _decode_cursor(cursor: str) -> Tuple[float, str]:
+    created_at, sep, task_id = cursor.partition(":")
+    try:
+        if not sep or not task_id:
+            raise ValueError(cursor)
+        return float(created_at), task_id
+    except ValueError:
+        raise HTTPException(400, "无效的分页游标")
+
+
 @app.get("/api/tasks")
-async def list_tasks():
-    """获取所有任务（含历史）"""
-    tasks = task_manager.get_all_tasks()
+async def list_tasks(request: Request, status: Optional[str] = None, engine: Optional[str] = None,
+                     since: Optional[float] = None, until: Optional[float] = None,
+                     prefix: str = "", cursor: Optional[str] = None, limit: int = 100):
+    """分页获取任务列表（含历史），按创建时间倒序。
+
+    - status / engine：逗号分隔的多个值
+    - since / until：创建时间范围（Unix 时间戳，含 since 不含 until）
+    - prefix：文件名前缀（不区分大小写）
+    - cursor：上一页返回的 next_cursor
+    列表未变化时按 If-None-Match 返回 304。
+    """
+    # 先取版本号再查询：期间若有变化，下次请求的 ETag 必然不同
+    version = task_manager.list_version
+    etag = 'W/"{}-{}"'.format(
+        version, hashlib.sha1(str(request.query_params).encode("utf-8")).hexdigest()[:16]
+    )
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    limit = max(1, min(limit, TASK_LIST_MAX_LIMIT))
+    after = _decode_cursor(cursor) if cursor else None
+    tasks, next_after = await run_in_threadpool(
+        task_manager.list_tasks, _split_param(status), _split_param(engine),
+        since, until, prefix, after, limit,
+    )
+    positions = task_manager.queue_positions()
     safe_tasks = []
     for task in tasks:
         safe_tasks.append({
@@ -178,18 +550,60 @@ async def list_tasks():
             "status": _safe_status(task["status"]),
             "progress": task["progress"],
             "message": task["message"],
-            "has_result": task.get("result") is not None,
-            "has_media": bool(_find_media(task)),
+            "queue_position": positions.get(task["id"]),
+            "duration": (task.get("media_info") or {}).get("duration"),
+            "media_info": task.get("media_info"),
+            "has_result": bool(task.get("has_result")),
+            "has_media": bool(task.get("has_media")),
             "created_at": task["created_at"],
             "completed_at": task["completed_at"],
         })
-    return {"tasks": safe_tasks}
+    return JSONResponse({
+        "tasks": safe_tasks,
+        "next_cursor": _encode_cursor(next_after) if next_after else None,
+        "queue": task_manager.queue_stats(),
+    }, headers={"ETag": etag})
+
+
+@app.get("/api/events")
+async def task_events(request: Request):
+    """任务事件流（SSE）。
+
+    连接建立时先发送 snapshot（排队中与处理中任务的状态），之后推送：
+    progress（只含变化的字段）、queue（排队位置）、completed（含完整结果，仅一次）、
+    failed、deleted。
+    """
+    # 先订阅再取快照，避免两者之间的事件丢失
+    sub = event_bus.subscribe()
+    snapshot = task_manager.active_snapshot()
+
+    async def stream():
+        try:
+            yield f"retry: 3000\n{format_sse('snapshot', {'tasks': snapshot})}"
+            while True:
+                try:
+                    message = await asyncio.wait_for(sub.queue.get(), EVENT_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                if message is None:
+                    break
+                yield message
+        finally:
+            event_bus.unsubscribe(sub)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
 
 
 @app.delete("/api/task/{task_id}")
 async def delete_task(task_id: str):
     """删除任务（同时删除媒体文件和转录结果）"""
-    if task_manager.delete_task(task_id):
+    if await run_in_threadpool(task_manager.delete_task, task_id):
         return {"message": "任务已删除"}
     raise HTTPException(404, "任务不存在")
 
@@ -212,47 +626,122 @@ def _find_playback_wav(task: dict) -> str:
         return wav
 
     # 检查任务目录下是否有 audio.wav（历史恢复时可能存在但未加载到内存）
-    from app.config import HISTORY_DIR
-    wav_in_dir = os.path.join(HISTORY_DIR, task["id"], "audio.wav")
-    if os.path.isfile(wav_in_dir):
+    wav_in_dir = task_manager.existing_wav(task["id"])
+    if wav_in_dir:
         return wav_in_dir
 
-    # 从原始媒体转换
+    # 从原始媒体转换，直接写入任务目录
     media = _find_media(task)
     if not media:
         return ""
 
     try:
-        wav_path = convert_to_wav(media)
-        # 持久化到任务目录
-        persisted = task_manager.persist_wav(task["id"], wav_path)
-        # 清理临时 WAV
-        if os.path.abspath(wav_path) != os.path.abspath(persisted):
-            try:
-                os.remove(wav_path)
-            except OSError:
-                pass
-        return persisted
+        return task_manager.persist_wav(task["id"], task_manager.convert_wav(task["id"], media))
     except Exception as e:
         print(f"[播放] WAV 转换失败: {e}")
         return ""
 
 
-@app.get("/api/audio/{task_id}")
-async def get_audio(task_id: str):
-    """获取任务的音频文件用于播放（始终返回 WAV 以确保时间线一致）"""
-    task = task_manager.get_task(task_id)
+# 原始媒体文件扩展名 -> Content-Type（没有可用的 WAV 时直接播放原文件）
+_MEDIA_TYPES = {
+    ".mp3": "audio/mpeg",
+    ".m4a": "audio/mp4",
+    ".wav": "audio/wav",
+    ".flac": "audio/flac",
+    ".ogg": "audio/ogg",
+    ".aac": "audio/aac",
+    ".wma": "audio/x-ms-wma",
+    ".mp4": "video/mp4",
+    ".mkv": "video/x-matroska",
+    ".avi": "video/x-msvideo",
+    ".mov": "video/quicktime",
+    ".webm": "video/webm",
+    ".flv": "video/x-flv",
+}
+
+# 按字节范围发送文件时每次读取的字节数
+_RANGE_CHUNK_SIZE = 256 * 1024
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """解析单个 "bytes=起-止" 范围，返回闭区间 (start, end)。
+
+    格式无法识别或包含多个范围时返回 None（按完整文件响应）；范围超出文件时抛出 ValueError。
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            # "bytes=-N"：最后 N 个字节
+            start = max(0, size - int(last))
+            end = size - 1
+    except ValueError:
+        return None
+    end = min(end, size - 1)
+    if start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def _iter_file_range(path: str, start: int, end: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(_RANGE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _media_response(request: Request, path: str, media_type: str, filename: str):
+    """支持 Range 请求的文件响应：浏览器拖动进度条时只请求需要的字节"""
+    stat = os.stat(path)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f"inline; filename*=utf-8''{quote(filename)}",
+    }
+    range_header = request.headers.get("range")
+    try:
+        byte_range = _parse_range(range_header, stat.st_size) if range_header else None
+    except ValueError:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{stat.st_size}"})
+    if byte_range is None:
+        return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        _iter_file_range(path, start, end),
+        status_code=206,
+        media_type=media_type,
+        headers=headers,
+    )
+
+
+def _locate_audio(task_id: str) -> Tuple[str, str, str]:
+    """查找播放用的音频文件并记录播放时间，返回 (路径, 媒体类型, 下载文件名)（在线程池中执行）"""
+    task = task_manager.get_task(task_id, include_result=False)
     if not task:
         raise HTTPException(404, "任务不存在")
 
-    # 优先返回 WAV（与转录时间戳一致）
+    task_manager.mark_played(task_id)
+    base_name = os.path.splitext(task["filename"])[0]
     wav_path = _find_playback_wav(task)
     if wav_path:
-        return FileResponse(
-            wav_path,
-            media_type="audio/wav",
-            filename=os.path.splitext(task["filename"])[0] + ".wav",
-        )
+        proxy_path = playback_proxy.get(wav_path)
+        if proxy_path:
+            ext = os.path.splitext(proxy_path)[1]
+            return proxy_path, playback_proxy.media_type, base_name + ext
+        return wav_path, "audio/wav", base_name + ".wav"
 
     # 回退到原始文件
     file_path = _find_media(task)
@@ -260,132 +749,244 @@ async def get_audio(task_id: str):
         raise HTTPException(404, "媒体文件不存在")
 
     ext = os.path.splitext(file_path)[1].lower()
-    media_types = {
-        ".mp3": "audio/mpeg",
-        ".m4a": "audio/mp4",
-        ".wav": "audio/wav",
-        ".flac": "audio/flac",
-        ".ogg": "audio/ogg",
-        ".aac": "audio/aac",
-        ".wma": "audio/x-ms-wma",
-        ".mp4": "video/mp4",
-        ".mkv": "video/x-matroska",
-        ".avi": "video/x-msvideo",
-        ".mov": "video/quicktime",
-        ".webm": "video/webm",
-        ".flv": "video/x-flv",
-    }
-    media_type = media_types.get(ext, "application/octet-stream")
+    return file_path, _MEDIA_TYPES.get(ext, "application/octet-stream"), task["filename"]
 
-    return FileResponse(
-        file_path,
-        media_type=media_type,
-        filename=task["filename"],
+
+@app.get("/api/audio/{task_id}")
+async def get_audio(task_id: str, request: Request):
+    """获取任务的音频用于播放（支持 Range 请求）。
+
+    优先返回由转录用 WAV 编码的低码率播放代理，时间线与转录时间戳一致；
+    代理尚未生成时返回 WAV 并在后台生成代理，没有 WAV 时回退到原始文件。
+    """
+    path, media_type, filename = await run_in_threadpool(_locate_audio, task_id)
+    return _media_response(request, path, media_type, filename)
+
+
+def _load_peaks(task: dict) -> str:
+    """任务的波形峰值文件路径；缺失或早于 WAV 时（旧任务）从 WAV 重新计算"""
+    wav_path = _find_playback_wav(task)
+    if not wav_path:
+        return ""
+    path = peaks_path(wav_path)
+    try:
+        if os.path.getmtime(path) >= os.path.getmtime(wav_path):
+            return path
+    except OSError:
+        pass
+    try:
+        return compute_peaks(wav_path)
+    except Exception as e:
+        print(f"[波形] 计算峰值失败 {task['id']}: {e}")
+        return ""
+
+
+def _read_peaks(task_id: str, start: float, end: Optional[float], level: Optional[int], width: int):
+    """读取峰值文件中请求的窗口，返回 (采样率, 采样帧数, 各级别, 所选级别, 起始桶, 数据)。
+
+    峰值文件可能在读取前被存储配额淘汰，此时返回 404（下次请求会重新计算）。
+    """
+    task = task_manager.get_task(task_id, include_result=False)
+    if not task:
+        raise HTTPException(404, "任务不存在")
+    path = _load_peaks(task)
+    if not path:
+        raise HTTPException(404, "音频文件不存在")
+    try:
+        rate, n_frames, levels = read_header(path)
+        duration = n_frames / rate if rate else 0.0
+        start = max(0.0, start)
+        end = duration if end is None else min(end, duration)
+        if level is None:
+            chosen = pick_level(levels, rate, max(0.0, end - start), max(1, width))
+        elif 0 <= level < len(levels):
+            chosen = levels[level]
+        else:
+            raise HTTPException(400, f"级别无效: {level}（共 {len(levels)} 级）")
+
+        spb = chosen.samples_per_bucket
+        first = int(start * rate) // spb
+        count = max(0, -(-int(end * rate) // spb) - first)
+        if count > WAVEFORM_MAX_BUCKETS:
+            raise HTTPException(400, f"单次最多返回 {WAVEFORM_MAX_BUCKETS} 个桶，请缩小时间窗口或使用更粗的级别")
+        data = read_window(path, chosen, first, count)
+    except FileNotFoundError:
+        raise HTTPException(404, "波形峰值文件不存在")
+    return rate, n_frames, levels, chosen, first, data
+
+
+@app.get("/api/peaks/{task_id}")
+async def get_peaks(task_id: str, start: float = 0.0, end: Optional[float] = None,
+                    level: Optional[int] = None, width: int = 1000, format: str = "json"):
+    """获取波形峰值（每桶 int16 最小值与最大值）。
+
+    - start / end：时间窗口（秒），默认整段音频
+    - level：金字塔级别（0 最细）；不指定时按 width 选择窗口内桶数不少于 width 的最粗级别
+    - format：json 返回元数据与交错的 [min, max, ...] 列表；binary 返回交错的 int16 小端数据，
+      元数据在 X-Peaks-* 响应头中
+    """
+    if format not in ("json", "binary"):
+        raise HTTPException(400, f"不支持的格式: {format}")
+    rate, n_frames, levels, chosen, first, data = await run_in_threadpool(
+        _read_peaks, task_id, start, end, level, width,
     )
+    duration = n_frames / rate if rate else 0.0
+    spb = chosen.samples_per_bucket
+    window_start = first * spb / rate if rate else 0.0
+
+    if format == "binary":
+        return Response(data, media_type="application/octet-stream", headers={
+            "X-Peaks-Level": str(chosen.index),
+            "X-Peaks-Sample-Rate": str(rate),
+            "X-Peaks-Samples-Per-Bucket": str(spb),
+            "X-Peaks-Start": f"{window_start:.6f}",
+            "X-Peaks-Duration": f"{duration:.6f}",
+        })
+    return {
+        "level": chosen.index,
+        "sample_rate": rate,
+        "samples_per_bucket": spb,
+        "seconds_per_bucket": spb / rate if rate else 0.0,
+        "start": window_start,
+        "duration": duration,
+        "levels": [lv.to_dict(rate) for lv in levels],
+        "peaks": decode_window(data),
+    }
+
+
+class SegmentEdit(BaseModel):
+    index: int
+    text: str
+
+
+class SegmentEditBatch(BaseModel):
+    edits: List[SegmentEdit]
+
+
+def _apply_edits(task_id: str, edits: List[tuple]) -> int:
+    if task_manager.get_task(task_id, include_result=False) is None:
+        raise HTTPException(404, "任务不存在")
+    try:
+        total = task_manager.edit_segments(task_id, edits)
+    except IndexError as e:
+        raise HTTPException(400, f"片段索引无效: {e.args[0]}")
+    if total is None:
+        raise HTTPException(400, "转录结果不存在")
+    return total
 
 
 @app.post("/api/result/{task_id}/edit")
 async def edit_segment(task_id: str, segment_index: int = Form(...), text: str = Form(...)):
     """编辑转录结果中的某个片段"""
-    task = task_manager.get_task(task_id)
-    if not task:
-        raise HTTPException(404, "任务不存在")
-    if not task.get("result"):
-        raise HTTPException(400, "转录结果不存在")
+    await run_in_threadpool(_apply_edits, task_id, [(segment_index, text)])
+    return {"message": "已更新"}
+
+
+@app.post("/api/result/{task_id}/edits")
+async def edit_segments(task_id: str, batch: SegmentEditBatch):
+    """批量编辑片段文本：{"edits": [{"index": 片段序号, "text": 新文本}, ...]}。
+
+    任一序号无效时整批不生效；同一片段出现多次时以最后一次为准。
+    """
+    if len(batch.edits) > EDIT_BATCH_MAX:
+        raise HTTPException(400, f"单次最多编辑 {EDIT_BATCH_MAX} 个片段")
+    edits = [(e.index, e.text) for e in batch.edits]
+    total = await run_in_threadpool(_apply_edits, task_id, edits)
+    return {"message": "已更新", "applied": len(edits), "segment_count": total}
+
+
+def _attachment(filename: str) -> dict:
+    """下载响应头；文件名按 RFC 5987 编码以支持中文"""
+    return {"Content-Disposition": f"attachment; filename*=utf-8''{quote(filename)}"}
+
+
+def _check_export_format(fmt: str):
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(400, f"不支持的导出格式: {fmt}")
+
 
-    with task_manager._lock:
-        real_task = task_manager._tasks.get(task_id)
-        if real_task and real_task.get("result"):
-            segments = real_task["result"].get("segments", [])
-            if 0 <= segment_index < len(segments):
-                segments[segment_index]["text"] = text
-                real_task["result"]["full_text"] = " ".join(s["text"] for s in segments)
-                # 编辑后持久化到磁盘
-                task_manager._save_result(task_id)
-                return {"message": "已更新"}
-    raise HTTPException(400, "片段索引无效")
+def _is_current(task_id: str, version: str):
+    """渲染完成后检查结果是否仍是该版本（渲染期间被编辑时不写入缓存）"""
+    return lambda: task_manager.result_version(task_id) == version
 
 
 @app.get("/api/export/{task_id}")
 async def export_result(task_id: str, format: str = "srt"):
-    """导出转录结果"""
-    task = task_manager.get_task(task_id)
-    if not task or not task.get("result"):
+    """以文件下载的形式导出转录结果（srt / vtt / txt / json）。
+
+    渲染结果按结果版本缓存在磁盘上，同一版本的重复导出直接发送缓存文件；
+    未缓存时边渲染边发送，不在内存中拼接完整文件。
+    """
+    _check_export_format(format)
+    source = await run_in_threadpool(task_manager.export_source, task_id)
+    if source is None:
         raise HTTPException(404, "无可导出的结果")
-
-    segments = task["result"].get("segments", [])
-
-    if format == "srt":
-        content = _to_srt(segments)
-        media_type = "text/srt"
-        ext = ".srt"
-    elif format == "txt":
-        content = task["result"].get("full_text", "")
-        media_type = "text/plain"
-        ext = ".txt"
-    elif format == "json":
-        import json
-        content = json.dumps(task["result"], ensure_ascii=False, indent=2)
-        media_type = "application/json"
-        ext = ".json"
-    elif format == "vtt":
-        content = _to_vtt(segments)
-        media_type = "text/vtt"
-        ext = ".vtt"
-    else:
-        raise HTTPException(400, f"不支持的导出格式: {format}")
-
-    filename = os.path.splitext(task["filename"])[0] + ext
-    return JSONResponse(
-        content={"content": content, "filename": filename},
-        media_type="application/json",
+    result, version, filename = source
+    name = export_filename(filename, format)
+    media_type = EXPORT_FORMATS[format][1] + "; charset=utf-8"
+
+    path = export_cache.get(task_id, version, format)
+    if path is not None:
+        return FileResponse(path, media_type=media_type, headers=_attachment(name))
+    return StreamingResponse(
+        export_cache.render(task_id, version, format, result, _is_current(task_id, version)),
+        media_type=media_type,
+        headers=_attachment(name),
     )
 
 
-def _to_srt(segments) -> str:
-    lines = []
-    for i, seg in enumerate(segments, 1):
-        start = _format_time_srt(seg["start"])
-        end = _format_time_srt(seg["end"])
-        lines.append(f"{i}")
-        lines.append(f"{start} --> {end}")
-        speaker = seg.get("speaker", "")
-        text = seg["text"]
-        if speaker:
-            lines.append(f"[{speaker}] {text}")
-        else:
-            lines.append(text)
-        lines.append("")
-    return "\n".join(lines)
-
-
-def _to_vtt(segments) -> str:
-    lines = ["WEBVTT", ""]
-    for seg in segments:
-        start = _format_time_vtt(seg["start"])
-        end = _format_time_vtt(seg["end"])
-        lines.append(f"{start} --> {end}")
-        speaker = seg.get("speaker", "")
-        text = seg["text"]
-        if speaker:
-            lines.append(f"<v {speaker}>{text}")
-        else:
-            lines.append(text)
-        lines.append("")
-    return "\n".join(lines)
-
-
-def _format_time_srt(seconds: float) -> str:
-    h = int(seconds // 3600)
-    m = int((seconds % 3600) // 60)
-    s = int(seconds % 60)
-    ms = int((seconds % 1) * 1000)
-    return f"{h:02d}:{m:02d}:{s:02d},{ms:03d}"
+def _zip_task_ids(ids: Optional[str], status: Optional[str], engine: Optional[str],
+                  since: Optional[float], until: Optional[float], prefix: str) -> List[str]:
+    """批量导出的任务：指定 ids 时按给定顺序，否则按列表过滤条件分页查询全部匹配任务"""
+    if ids:
+        return _split_param(ids)
+    task_ids, after = [], None
+    while True:
+        tasks, after = task_manager.list_tasks(
+            _split_param(status), _split_param(engine), since, until, prefix,
+            after, TASK_LIST_MAX_LIMIT,
+        )
+        task_ids.extend(t["id"] for t in tasks if t.get("has_result"))
+        if after is None:
+            return task_ids
+
+
+def _zip_entries(task_ids: List[str], fmt: str):
+    """逐个任务产出 (压缩包内文件名, 数据块)；结果只在写入该任务时读取"""
+    used = set()
+    for task_id in task_ids:
+        source = task_manager.export_source(task_id)
+        if source is None:
+            continue
+        result, version, filename = source
+        name = export_filename(filename, fmt)
+        if name in used:
+            base, ext = os.path.splitext(name)
+            name = f"{base} ({task_id}){ext}"
+        used.add(name)
+        yield name, export_cache.iter_cached(
+            task_id, version, fmt, result, _is_current(task_id, version),
+        )
 
 
-def _format_time_vtt(seconds: float) -> str:
-    h = int(seconds // 3600)
-    m = int((seconds % 3600) // 60)
-    s = int(seconds % 60)
-    ms = int((seconds % 1) * 1000)
-    return f"{h:02d}:{m:02d}:{s:02d}.{ms:03d}"
+@app.get("/api/exports/zip")
+async def export_zip(format: str = "srt", ids: Optional[str] = None,
+                     status: Optional[str] = "completed", engine: Optional[str] = None,
+                     since: Optional[float] = None, until: Optional[float] = None,
+                     prefix: str = ""):
+    """将多个任务的导出文件打包为 ZIP 下载。
+
+    - ids：逗号分隔的任务 ID；不指定时按 status / engine / since / until / prefix
+      过滤（含义同 /api/tasks，status 默认 completed）
+    压缩包边生成边发送，各任务的导出文件优先取自缓存。
+    """
+    _check_export_format(format)
+    task_ids = await run_in_threadpool(_zip_task_ids, ids, status, engine, since, until, prefix)
+    if not task_ids:
+        raise HTTPException(404, "无可导出的结果")
+    name = time.strftime("transcripts-%Y%m%d-%H%M%S.zip")
+    return StreamingResponse(
+        iter_zip(_zip_entries(task_ids, format)),
+        media_type="application/zip",
+        headers=_attachment(name),
+    )
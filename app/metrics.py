@@ -0,0 +1,181 @@
+"""运行指标 - 计数器、仪表与直方图，以 Prometheus 文本格式输出（不依赖 prometheus_client）"""
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+_registry: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(ABC):
+    """指标基类，子类实现 samples() 输出样本行"""
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """Prometheus 文本格式的样本行（不含 HELP / TYPE）"""
+        pass
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """仪表：在输出时调用 collect 函数取当前值，返回 {标签值元组: 数值}"""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 collect: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        super().__init__(name, help_text, labelnames)
+        self.collect = collect
+
+    def samples(self) -> List[str]:
+        if self.collect is None:
+            return []
+        try:
+            values = self.collect()
+        except Exception as e:
+            print(f"[指标] 采集 {self.name} 失败: {e}")
+            return []
+        return [
+            f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}"
+            for k, v in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    """直方图（累积桶 + 总和 + 计数）"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = (0.1, 0.5, 1, 5, 10, 60)):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # 标签值 -> [各桶计数（非累积）, 总和, 计数]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def render() -> str:
+    """所有指标的 Prometheus 文本格式"""
+    return "\n".join(m.render() for m in _registry) + "\n"
+
+
+# ----------------------------------------------------------------
+# 转录流水线指标
+# ----------------------------------------------------------------
+
+TRANSCRIPTION_RTF = Histogram(
+    "aitranscriber_transcription_rtf",
+    "转录实时率（处理耗时 / 音频时长）",
+    ["engine", "model"],
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 5),
+)
+TRANSCRIPTION_AUDIO_SECONDS = Counter(
+    "aitranscriber_transcribed_audio_seconds_total",
+    "引擎转录的音频秒数（不含结果缓存命中）",
+    ["engine", "model"],
+)
+TASK_OUTCOMES = Counter(
+    "aitranscriber_tasks_total",
+    "按结果统计的已结束任务数（completed / failed）",
+    ["engine", "outcome"],
+)
+MODEL_LOAD_SECONDS = Histogram(
+    "aitranscriber_model_load_seconds",
+    "模型加载耗时（秒）",
+    ["model"],
+    buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300),
+)
+FFMPEG_SECONDS = Histogram(
+    "aitranscriber_ffmpeg_conversion_seconds",
+    "ffmpeg 转换为 16kHz WAV 的耗时（秒）",
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+FFMPEG_AUDIO_SECONDS = Counter(
+    "aitranscriber_ffmpeg_audio_seconds_total",
+    "ffmpeg 转换输出的音频秒数",
+)
+UPLOADS = Counter(
+    "aitranscriber_uploads_total",
+    "成功上传的文件数",
+)
+UPLOAD_BYTES = Counter(
+    "aitranscriber_upload_bytes_total",
+    "成功上传的字节数",
+)
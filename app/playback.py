@@ -0,0 +1,125 @@
+"""播放代理 - 将任务的 16kHz WAV 压缩为低码率音频供浏览器播放，在后台逐个生成"""
+import os
+import uuid
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+from app.config import PLAYBACK_PROXY_CODEC, PLAYBACK_PROXY_BITRATE
+from app.audio_utils import PLAYBACK_FORMATS, encode_playback_proxy
+
+
+class PlaybackProxy:
+    """播放代理文件的查找与生成。
+
+    代理文件由任务目录中的 audio.wav（即引擎转录的同一份 PCM）编码而来，保存在同一目录下，
+    随任务一起删除；WAV 比代理文件新（重新持久化过）时重新生成。生成在单个后台线程中
+    排队执行，尚未生成时调用方回退到 WAV。
+    """
+
+    def __init__(self, codec: str = PLAYBACK_PROXY_CODEC, bitrate: str = PLAYBACK_PROXY_BITRATE):
+        self._codec = codec if codec in PLAYBACK_FORMATS else "aac"
+        self._bitrate = bitrate
+        self._cond = threading.Condition()
+        # 待生成的 WAV 路径（按提交顺序）与正在生成的路径
+        self._queue: "OrderedDict[str, None]" = OrderedDict()
+        self._current: Optional[str] = None
+        self._thread: Optional[threading.Thread] = None
+        # 生成失败的 WAV 路径 -> 失败时 WAV 的修改时间，WAV 未变化时不再重试
+        self._failed: Dict[str, float] = {}
+        self.generated = 0
+        self.failures = 0
+
+    @property
+    def media_type(self) -> str:
+        return PLAYBACK_FORMATS[self._codec][1]
+
+    def proxy_path(self, wav_path: str) -> str:
+        return os.path.join(os.path.dirname(wav_path), "playback" + PLAYBACK_FORMATS[self._codec][0])
+
+    def _is_fresh(self, wav_path: str, path: str) -> bool:
+        try:
+            return os.path.getmtime(path) >= os.path.getmtime(wav_path)
+        except OSError:
+            return False
+
+    def get(self, wav_path: str) -> Optional[str]:
+        """已生成的代理文件路径；尚未生成时加入生成队列并返回 None"""
+        path = self.proxy_path(wav_path)
+        if self._is_fresh(wav_path, path):
+            return path
+        self.schedule(wav_path)
+        return None
+
+    def schedule(self, wav_path: str):
+        """将 WAV 加入生成队列（已排队、正在生成或此前对同一文件失败过时忽略）"""
+        try:
+            mtime = os.path.getmtime(wav_path)
+        except OSError:
+            return
+        with self._cond:
+            if wav_path in self._queue or wav_path == self._current:
+                return
+            if self._failed.get(wav_path) == mtime:
+                return
+            self._queue[wav_path] = None
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="playback-proxy", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                wav_path, _ = self._queue.popitem(last=False)
+                self._current = wav_path
+            try:
+                self._generate(wav_path)
+            finally:
+                with self._cond:
+                    self._current = None
+
+    def _generate(self, wav_path: str):
+        path = self.proxy_path(wav_path)
+        if self._is_fresh(wav_path, path):
+            return
+        try:
+            mtime = os.path.getmtime(wav_path)
+        except OSError:
+            return
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            encode_playback_proxy(wav_path, tmp_path, self._codec, self._bitrate)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            # 任务在生成期间被删除时目录已不存在，同样走到这里
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            if os.path.isfile(wav_path):
+                self.failures += 1
+                with self._cond:
+                    self._failed[wav_path] = mtime
+                print(f"[播放] 生成播放代理失败 {wav_path}: {e}")
+            return
+        self.generated += 1
+        print(f"[播放] 已生成播放代理 {path}（{size / 1024 / 1024:.1f}MB）")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            pending = len(self._queue) + (1 if self._current else 0)
+        return {
+            "codec": self._codec,
+            "bitrate": self._bitrate,
+            "pending": pending,
+            "generated": self.generated,
+            "failures": self.failures,
+        }
+
+
+# 全局单例
+playback_proxy = PlaybackProxy()
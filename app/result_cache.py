@@ -0,0 +1,125 @@
+"""转录结果缓存 - 以 (PCM 哈希, 引擎, 模型, 语言) 为键的磁盘缓存"""
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+from app.config import RESULT_CACHE_DIR, RESULT_CACHE_MAX_MB
+
+
+class ResultCache:
+    """内容寻址的转录结果缓存。
+
+    每个条目保存为 {key}.json，内容为 TranscriptionResult.to_dict()。
+    总大小超过上限时按最近使用时间（LRU，以文件 mtime 持久化）淘汰。
+    """
+
+    def __init__(self, cache_dir: str = RESULT_CACHE_DIR,
+                 max_bytes: int = RESULT_CACHE_MAX_MB * 1024 * 1024):
+        self._dir = cache_dir
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: Optional["OrderedDict[str, int]"] = None
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(pcm_hash: str, engine: str, model: str, language: str) -> str:
+        language = language or "auto"
+        raw = f"{pcm_hash}|{engine}|{model}|{language}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._dir, f"{key}.json")
+
+    def _load_index(self):
+        # 调用方需持有 self._lock；首次使用时按 mtime 从旧到新建立 LRU 顺序
+        if self._entries is not None:
+            return
+        os.makedirs(self._dir, exist_ok=True)
+        items = []
+        for entry in os.scandir(self._dir):
+            if entry.is_file() and entry.name.endswith(".json"):
+                st = entry.stat()
+                items.append((st.st_mtime, entry.name[:-5], st.st_size))
+        items.sort()
+        self._entries = OrderedDict((key, size) for _, key, size in items)
+        self._total_bytes = sum(size for _, _, size in items)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._load_index()
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            path = self._path(key)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    result = json.load(f)
+                os.utime(path)
+            except (OSError, ValueError):
+                self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key: str, result: Dict[str, Any]):
+        data = json.dumps(result, ensure_ascii=False).encode("utf-8")
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with self._lock:
+            self._load_index()
+            try:
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"[结果缓存] 写入失败: {e}")
+                return
+            self._total_bytes -= self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._total_bytes += len(data)
+            self._evict()
+
+    def _drop(self, key: str):
+        self._total_bytes -= self._entries.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        while self._total_bytes > self._max_bytes and len(self._entries) > 1:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._load_index()
+            for key in list(self._entries):
+                self._drop(key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._load_index()
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self._max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+# 全局单例
+result_cache = ResultCache()
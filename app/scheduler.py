@@ -0,0 +1,164 @@
+"""转录调度器 - 有界工作线程池 + 按引擎/模型限流的任务队列"""
+import time
+import threading
+import traceback
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Any
+
+from app.config import (
+    MAX_CONCURRENT_TASKS, ENGINE_CONCURRENCY, DEFAULT_ENGINE_CONCURRENCY, BATCH_MAX_RUNNING,
+)
+
+
+class TranscriptionJob:
+    """队列中的一个转录作业"""
+    def __init__(self, task_id: str, media_path: str, engine: str,
+                 model: str, language: str, duration: float = 0.0, batch_id: str = ""):
+        self.task_id = task_id
+        self.media_path = media_path
+        self.engine = engine
+        self.model = model
+        self.language = language
+        # 媒体时长（秒，来自上传时的探测），用于估算排队工作量
+        self.duration = duration or 0.0
+        # 所属批次，同一批次同时执行的作业数受 BATCH_MAX_RUNNING 限制
+        self.batch_id = batch_id or ""
+        self.enqueued_at = time.time()
+
+    @property
+    def slot(self) -> str:
+        """并发限额所属的槽位：优先使用 "引擎:模型" 的单独配置，否则按引擎"""
+        key = f"{self.engine}:{self.model}"
+        if key in ENGINE_CONCURRENCY:
+            return key
+        return self.engine
+
+
+def _slot_limit(slot: str) -> int:
+    return max(1, int(ENGINE_CONCURRENCY.get(slot, DEFAULT_ENGINE_CONCURRENCY)))
+
+
+class TranscriptionScheduler:
+    """固定数量的工作线程从 FIFO 队列中取作业执行。
+
+    工作线程总是取队列中第一个所属槽位仍有空闲额度的作业，
+    因此某个引擎/模型排满时，其他引擎的作业不会被它阻塞；同一批次的作业同时最多执行
+    batch_limit 个，批次中排在后面的作业不会阻塞之后单独提交的作业。
+    """
+
+    def __init__(self, runner: Callable[[TranscriptionJob], None],
+                 max_workers: int = MAX_CONCURRENT_TASKS, batch_limit: int = BATCH_MAX_RUNNING):
+        self._runner = runner
+        self._max_workers = max(1, int(max_workers))
+        self._queue: Deque[TranscriptionJob] = deque()
+        self._running: Dict[str, TranscriptionJob] = {}
+        self._slot_usage: Dict[str, int] = {}
+        self._batch_limit = max(0, int(batch_limit))
+        self._batch_usage: Dict[str, int] = {}
+        self._cond = threading.Condition()
+        self._workers = []
+
+    def _ensure_workers(self):
+        # 调用方需持有 self._cond
+        if self._workers:
+            return
+        for i in range(self._max_workers):
+            t = threading.Thread(
+                target=self._worker_loop, name=f"transcribe-worker-{i}", daemon=True
+            )
+            t.start()
+            self._workers.append(t)
+
+    def submit(self, job: TranscriptionJob):
+        """加入队列尾部；同一任务已在队列中时替换为新作业"""
+        with self._cond:
+            self._ensure_workers()
+            self._remove_queued(job.task_id)
+            self._queue.append(job)
+            self._cond.notify_all()
+
+    def cancel(self, task_id: str) -> bool:
+        """从队列中移除尚未开始的作业（正在执行的作业不受影响）"""
+        with self._cond:
+            return self._remove_queued(task_id)
+
+    def _remove_queued(self, task_id: str) -> bool:
+        for job in self._queue:
+            if job.task_id == task_id:
+                self._queue.remove(job)
+                return True
+        return False
+
+    def position(self, task_id: str) -> Optional[int]:
+        """任务在队列中的位置（从 1 开始）；不在队列中返回 None"""
+        with self._cond:
+            for i, job in enumerate(self._queue, 1):
+                if job.task_id == task_id:
+                    return i
+        return None
+
+    def positions(self) -> Dict[str, int]:
+        """所有排队任务的位置快照"""
+        with self._cond:
+            return {job.task_id: i for i, job in enumerate(self._queue, 1)}
+
+    def is_running(self, task_id: str) -> bool:
+        with self._cond:
+            return task_id in self._running
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "workers": self._max_workers,
+                "queued": len(self._queue),
+                "running": len(self._running),
+                "queued_audio_seconds": round(sum(j.duration for j in self._queue), 1),
+                "running_audio_seconds": round(sum(j.duration for j in self._running.values()), 1),
+                "slots": dict(self._slot_usage),
+                "batches": dict(self._batch_usage),
+            }
+
+    def _batch_full(self, job: TranscriptionJob) -> bool:
+        return bool(job.batch_id and self._batch_limit
+                    and self._batch_usage.get(job.batch_id, 0) >= self._batch_limit)
+
+    def _take_next(self) -> TranscriptionJob:
+        with self._cond:
+            while True:
+                for job in self._queue:
+                    # 同一任务的上一个作业仍在执行时先跳过，避免两个作业同时处理一个任务
+                    if job.task_id in self._running:
+                        continue
+                    slot = job.slot
+                    if self._slot_usage.get(slot, 0) < _slot_limit(slot) and not self._batch_full(job):
+                        self._queue.remove(job)
+                        self._slot_usage[slot] = self._slot_usage.get(slot, 0) + 1
+                        if job.batch_id:
+                            self._batch_usage[job.batch_id] = self._batch_usage.get(job.batch_id, 0) + 1
+                        self._running[job.task_id] = job
+                        return job
+                self._cond.wait()
+
+    def _release(self, job: TranscriptionJob):
+        with self._cond:
+            slot = job.slot
+            self._slot_usage[slot] = max(0, self._slot_usage.get(slot, 0) - 1)
+            if job.batch_id:
+                remaining = self._batch_usage.get(job.batch_id, 0) - 1
+                if remaining > 0:
+                    self._batch_usage[job.batch_id] = remaining
+                else:
+                    self._batch_usage.pop(job.batch_id, None)
+            if self._running.get(job.task_id) is job:
+                del self._running[job.task_id]
+            self._cond.notify_all()
+
+    def _worker_loop(self):
+        while True:
+            job = self._take_next()
+            try:
+                self._runner(job)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                self._release(job)
@@ -0,0 +1,47 @@
+"""转录片段时间索引 - 按时间二分查找片段，支持按序号或时间范围窗口读取"""
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Any, Optional, Tuple
+
+
+class SegmentIndex:
+    """基于片段开始时间与结束时间前缀最大值的索引。
+
+    片段按开始时间排序（各引擎输出即为此顺序）；结束时间前缀最大值单调不减，
+    因此"与 [t0, t1) 相交的片段"可以用两次二分查找定位。
+    """
+
+    def __init__(self, segments: List[Dict[str, Any]]):
+        self.starts: List[float] = []
+        self.ends: List[float] = []
+        self.max_ends: List[float] = []
+        max_end = 0.0
+        for seg in segments:
+            start = float(seg.get("start", 0.0))
+            end = float(seg.get("end", start))
+            max_end = max(max_end, end)
+            self.starts.append(start)
+            self.ends.append(end)
+            self.max_ends.append(max_end)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    @property
+    def duration(self) -> float:
+        return self.max_ends[-1] if self.max_ends else 0.0
+
+    def time_range(self, t0: float, t1: float) -> Tuple[int, int]:
+        """与 [t0, t1) 相交的片段序号范围 [lo, hi)"""
+        lo = bisect_right(self.max_ends, t0)
+        hi = bisect_left(self.starts, t1)
+        return lo, max(lo, hi)
+
+    def at(self, t: float) -> Optional[int]:
+        """t 时刻所在片段的序号，不在任何片段内返回 None"""
+        i = bisect_right(self.starts, t) - 1
+        # 片段可能重叠：向前查找仍覆盖 t 的片段（前缀最大值保证可提前终止）
+        while i >= 0 and self.max_ends[i] > t:
+            if self.ends[i] > t:
+                return i
+            i -= 1
+        return None
@@ -0,0 +1,318 @@
+"""磁盘存储管理 - 按类别统计数据目录占用，超出配额时淘汰可重新生成的派生文件，定期清理孤立文件"""
+import os
+import time
+import shutil
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.config import (
+    UPLOAD_DIR, RESULT_DIR, HISTORY_DIR, RESULT_CACHE_DIR, EXPORT_CACHE_DIR, MEDIA_BLOB_DIR, TRASH_DIR,
+    STORAGE_QUOTA_MB, STORAGE_MIN_FREE_MB, STORAGE_SWEEP_INTERVAL_SECONDS,
+    STORAGE_ORPHAN_GRACE_SECONDS,
+)
+from app.blob_store import blob_store
+from app.task_manager import task_manager
+from app.waveform import PEAKS_FILENAME
+
+# 占用统计的类别：
+#   media         原始媒体（内容寻址存储与任务目录中的媒体文件，硬链接只计一次）
+#   derived       可由原始媒体重新生成的派生文件：audio.wav、播放代理、波形峰值
+#   database      任务数据库
+#   result_cache  转录结果缓存      exports  导出文件缓存
+#   uploads       上传目录          results  旧版 results/*.json
+#   trash         待删除的回收目录  other    其他文件（临时文件、旧版元数据等）
+CATEGORIES = (
+    "media", "derived", "database", "result_cache", "exports",
+    "uploads", "results", "trash", "other",
+)
+
+
+def _is_derived(name: str) -> bool:
+    if name.endswith(".tmp"):
+        return False
+    return name == "audio.wav" or name == PEAKS_FILENAME or name.startswith("playback.")
+
+
+def _walk_files(root: str):
+    """递归列出目录下的文件，返回 (路径, stat) 迭代器"""
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            try:
+                yield path, os.lstat(path)
+            except OSError:
+                pass
+
+
+def _remove(path: str):
+    try:
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+    except OSError:
+        pass
+
+
+class _Scan:
+    """一次目录扫描的结果"""
+
+    def __init__(self):
+        self.usage = {c: {"bytes": 0, "files": 0} for c in CATEGORIES}
+        # 任务 ID -> ([派生文件路径], 字节数)
+        self.derived: Dict[str, Tuple[List[str], int]] = {}
+        # (路径, 字节数, 是否为 blob)
+        self.orphans: List[Tuple[str, int, bool]] = []
+        self._inodes = set()
+
+    def add(self, category: str, st: os.stat_result):
+        # 硬链接（任务目录中的媒体文件与 blob）只计一次
+        key = (st.st_dev, st.st_ino)
+        if key in self._inodes:
+            return
+        self._inodes.add(key)
+        self.usage[category]["bytes"] += st.st_size
+        self.usage[category]["files"] += 1
+
+    @property
+    def total(self) -> int:
+        return sum(u["bytes"] for u in self.usage.values())
+
+
+class StorageManager:
+    """数据目录的容量管理。
+
+    总占用超过 STORAGE_QUOTA_MB 或磁盘剩余空间低于 STORAGE_MIN_FREE_MB 时，按任务最近播放时间
+    （没播放过的按完成时间）从旧到新删除派生文件，直到满足要求；派生文件在下次播放或重新转录时
+    从原始媒体重新生成。孤立文件（不属于任何任务的任务目录、上传残留、没有引用的 blob、
+    已导入数据库的旧版结果文件）在后台定期清理。
+    """
+
+    def __init__(self, quota_mb: int = STORAGE_QUOTA_MB, min_free_mb: int = STORAGE_MIN_FREE_MB,
+                 interval: float = STORAGE_SWEEP_INTERVAL_SECONDS,
+                 orphan_grace: float = STORAGE_ORPHAN_GRACE_SECONDS):
+        self._quota = quota_mb * 1024 * 1024
+        self._min_free = min_free_mb * 1024 * 1024
+        self._interval = interval
+        self._orphan_grace = orphan_grace
+        # 同一时刻只进行一次清理
+        self._run_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.last_run: Dict[str, Any] = {}
+        # 最近一次清理前各类别的字节数（供指标采集，避免每次采集都扫描目录）
+        self.last_usage: Dict[str, int] = {}
+        self.evicted_bytes = 0
+        self.orphan_bytes = 0
+
+    # ---- 扫描 ----
+
+    def _scan(self, tasks: Dict[str, Dict[str, Any]]) -> _Scan:
+        scan = _Scan()
+        now = time.time()
+        referenced_media = {t["media_file"] for t in tasks.values() if t["media_file"]}
+        referenced_files = {os.path.abspath(t["file_path"]) for t in tasks.values() if t["file_path"]}
+
+        def expired(st: os.stat_result) -> bool:
+            return now - st.st_mtime > self._orphan_grace
+
+        if os.path.isdir(HISTORY_DIR):
+            for entry in os.scandir(HISTORY_DIR):
+                if entry.is_file():
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    scan.add("database" if entry.name.startswith("tasks.db") else "other", st)
+                elif entry.path == MEDIA_BLOB_DIR:
+                    self._scan_blobs(scan, referenced_media, expired)
+                elif entry.path == TRASH_DIR:
+                    for _, st in _walk_files(entry.path):
+                        scan.add("trash", st)
+                elif entry.name in tasks:
+                    self._scan_task_dir(scan, entry.name, entry.path)
+                else:
+                    # 不属于任何已知任务的目录
+                    self._scan_entry(scan, "other", entry.path, orphan=True)
+
+        if os.path.isdir(UPLOAD_DIR):
+            for entry in os.scandir(UPLOAD_DIR):
+                referenced = os.path.abspath(entry.path) in referenced_files
+                self._scan_entry(scan, "uploads", entry.path, orphan=not referenced)
+
+        if os.path.isdir(RESULT_DIR):
+            for entry in os.scandir(RESULT_DIR):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                scan.add("results", st)
+                task = tasks.get(os.path.splitext(entry.name)[0])
+                # 结果已在数据库中的旧版副本可直接删除，未知任务的文件过了保留期再删除
+                if (task and task["has_result"]) or (task is None and expired(st)):
+                    scan.orphans.append((entry.path, st.st_size, False))
+
+        for path, st in _walk_files(RESULT_CACHE_DIR):
+            in_exports = os.path.commonpath([path, EXPORT_CACHE_DIR]) == EXPORT_CACHE_DIR
+            scan.add("exports" if in_exports else "result_cache", st)
+        return scan
+
+    def _scan_blobs(self, scan: _Scan, referenced: set, expired):
+        for path, st in _walk_files(MEDIA_BLOB_DIR):
+            scan.add("media", st)
+            # 只剩存储自身一个链接、也没有任务直接引用的 blob 已无人使用
+            if st.st_nlink <= 1 and path not in referenced and expired(st):
+                scan.orphans.append((path, st.st_size, True))
+
+    def _scan_task_dir(self, scan: _Scan, task_id: str, task_dir: str):
+        paths, size = [], 0
+        for entry in os.scandir(task_dir):
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            if not entry.is_file(follow_symlinks=False):
+                for _, sub_st in _walk_files(entry.path):
+                    scan.add("other", sub_st)
+            elif entry.name.startswith("media."):
+                scan.add("media", st)
+            elif _is_derived(entry.name):
+                scan.add("derived", st)
+                paths.append(entry.path)
+                size += st.st_size
+            else:
+                scan.add("other", st)
+        if paths:
+            scan.derived[task_id] = (paths, size)
+
+    def _scan_entry(self, scan: _Scan, category: str, path: str, orphan: bool):
+        """统计文件或目录的占用；orphan=True 且其中最新的文件也已超过保留期时记为孤立文件"""
+        if os.path.isdir(path):
+            files = list(_walk_files(path))
+            try:
+                newest = max([os.stat(path).st_mtime] + [st.st_mtime for _, st in files])
+            except OSError:
+                return
+        else:
+            try:
+                st = os.lstat(path)
+            except OSError:
+                return
+            files, newest = [(path, st)], st.st_mtime
+        for _, st in files:
+            scan.add(category, st)
+        if orphan and time.time() - newest > self._orphan_grace:
+            scan.orphans.append((path, sum(st.st_size for _, st in files), False))
+
+    # ---- 清理 ----
+
+    def _bytes_to_free(self, total: int) -> int:
+        need = 0
+        if self._quota > 0:
+            need = total - self._quota
+        if self._min_free > 0:
+            try:
+                free = shutil.disk_usage(HISTORY_DIR).free
+            except OSError:
+                free = self._min_free
+            need = max(need, self._min_free - free)
+        return need
+
+    def _evict(self, scan: _Scan, tasks: Dict[str, Dict[str, Any]], need: int) -> Tuple[int, int]:
+        """按最近使用时间从旧到新删除派生文件，返回 (任务数, 释放字节数)"""
+        candidates = sorted(
+            (tasks[tid]["last_used"], tid) for tid in scan.derived
+            if tid in tasks and not tasks[tid]["active"]
+        )
+        count = freed = 0
+        for _, task_id in candidates:
+            if freed >= need:
+                break
+            paths, size = scan.derived[task_id]
+            if task_manager.evict_derived(task_id, paths):
+                count += 1
+                freed += size
+        return count, freed
+
+    def run(self) -> Dict[str, Any]:
+        """清理孤立文件，超出配额时淘汰派生文件，返回本次清理的统计"""
+        with self._run_lock:
+            started = time.perf_counter()
+            tasks = task_manager.storage_snapshot()
+            scan = self._scan(tasks)
+
+            orphan_count = orphan_bytes = 0
+            for path, size, is_blob in scan.orphans:
+                if is_blob:
+                    blob_store.release(path)
+                    if os.path.exists(path):
+                        continue
+                else:
+                    _remove(path)
+                orphan_count += 1
+                orphan_bytes += size
+
+            need = self._bytes_to_free(scan.total - orphan_bytes)
+            evicted, evicted_bytes = (0, 0)
+            if need > 0:
+                evicted, evicted_bytes = self._evict(scan, tasks, need)
+                if evicted_bytes < need:
+                    print(f"[存储] 派生文件已全部淘汰，仍需释放 {(need - evicted_bytes) / 1024 / 1024:.0f}MB")
+
+            self.last_usage = {c: u["bytes"] for c, u in scan.usage.items()}
+            self.orphan_bytes += orphan_bytes
+            self.evicted_bytes += evicted_bytes
+            self.last_run = {
+                "at": time.time(),
+                "elapsed": round(time.perf_counter() - started, 3),
+                "orphans_removed": orphan_count,
+                "orphan_bytes": orphan_bytes,
+                "evicted_tasks": evicted,
+                "evicted_bytes": evicted_bytes,
+            }
+            if orphan_count or evicted:
+                print(f"[存储] 清理孤立文件 {orphan_count} 个（{orphan_bytes / 1024 / 1024:.1f}MB），"
+                      f"淘汰 {evicted} 个任务的派生文件（{evicted_bytes / 1024 / 1024:.1f}MB）")
+            return dict(self.last_run)
+
+    def usage(self) -> Dict[str, Any]:
+        """各类别占用、配额与磁盘剩余空间"""
+        scan = self._scan(task_manager.storage_snapshot())
+        try:
+            disk = shutil.disk_usage(HISTORY_DIR)
+            disk_info = {"total": disk.total, "used": disk.used, "free": disk.free}
+        except OSError:
+            disk_info = {}
+        return {
+            "categories": scan.usage,
+            "total_bytes": scan.total,
+            "quota_bytes": self._quota,
+            "min_free_bytes": self._min_free,
+            "disk": disk_info,
+            "orphans": {
+                "files": len(scan.orphans),
+                "bytes": sum(size for _, size, _ in scan.orphans),
+            },
+            "last_run": self.last_run,
+            "evicted_bytes_total": self.evicted_bytes,
+            "orphan_bytes_total": self.orphan_bytes,
+        }
+
+    def start(self):
+        """启动后台定期清理（服务启动时调用）"""
+        if self._thread is not None or self._interval <= 0:
+            return
+
+        def loop():
+            while True:
+                time.sleep(self._interval)
+                try:
+                    self.run()
+                except Exception as e:
+                    print(f"[存储] 清理失败: {e}")
+
+        self._thread = threading.Thread(target=loop, name="storage-sweeper", daemon=True)
+        self._thread.start()
+
+
+# 全局单例
+storage_manager = StorageManager()
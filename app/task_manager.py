@@ -1,16 +1,29 @@
 """任务管理器 - 管理转录任务的生命周期，支持磁盘持久化"""
 import os
-import json
-import glob
 import uuid
 import time
 import shutil
 import threading
 import traceback
-from typing import Dict, Any, Optional, List
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, Optional, List
 from enum import Enum
 
-from app.config import UPLOAD_DIR, RESULT_DIR, HISTORY_DIR
+from app.config import (
+    UPLOAD_DIR, RESULT_DIR, HISTORY_DIR, TRASH_DIR, LONG_AUDIO_MODE, LONG_AUDIO_MIN_SECONDS,
+    EVENT_PROGRESS_STEP, EDIT_COMPACT_DELAY_SECONDS, EDIT_COMPACT_MAX_PENDING,
+)
+from app.events import event_bus
+from app.scheduler import TranscriptionScheduler, TranscriptionJob
+from app.result_cache import result_cache
+from app.task_store import TaskStore, apply_segment_edits
+from app.task_writer import TaskWriter
+from app.exporters import export_cache
+from app.playback import playback_proxy
+from app.waveform import compute_peaks
+from app.blob_store import blob_store, hash_file
+from app.segment_index import SegmentIndex
+from app import metrics
 
 
 class TaskStatus(str, Enum):
@@ -20,6 +33,10 @@ class TaskStatus(str, Enum):
     FAILED = "failed"
 
 
+class TaskBusyError(Exception):
+    """任务正在排队或转录中，不能执行需要任务空闲的操作"""
+
+
 def _status_str(status) -> str:
     """将 TaskStatus 转为纯字符串"""
     if hasattr(status, "value"):
@@ -28,79 +45,151 @@ def _status_str(status) -> str:
 
 
 class TaskManager:
-    """转录任务管理器（带磁盘持久化）"""
+    """转录任务管理器（带磁盘持久化）。
+
+    锁的划分：
+      - self._lock 只保护 _tasks / _task_locks 两个字典的增删，持有时间极短；
+      - 每个任务有自己的锁（通过 self._task(task_id) 获取），任务字段的读写都在其中完成；
+      - 加锁顺序固定为 任务锁 -> self._lock，文件删除、数据库写入等慢操作不在任何锁内进行。
+    """
 
     def __init__(self):
         self._tasks: Dict[str, Dict[str, Any]] = {}
+        self._task_locks: Dict[str, threading.Lock] = {}
         self._lock = threading.Lock()
+        self._version_lock = threading.Lock()
+        self._scheduler = TranscriptionScheduler(self._run_job)
+        self._store = TaskStore()
+        # 数据库写入由后台线程合并执行，持有任务锁时只提交快照，不等待磁盘
+        self._writer = TaskWriter(self._store)
+        # 每个任务最近一次推送的 (progress, message)，用于合并细碎的进度事件
+        self._last_pushed: Dict[str, tuple] = {}
+        # 转录结果的片段时间索引：task_id -> (result 对象, SegmentIndex)，result 被替换后自动重建
+        self._segment_indexes: Dict[str, tuple] = {}
+        # 任务列表版本号，任何任务变化时递增，用作 /api/tasks 的 ETag
+        self.list_version = 0
+        # 尚未合并进数据库结果的片段编辑：task_id -> {"count": 条数, "due": 合并时间}
+        self._pending_edits: Dict[str, Dict[str, Any]] = {}
+        # 片段被编辑后 full_text 尚未重建的任务（读取结果时重建）
+        self._stale_text: set = set()
+        # 保护 _pending_edits
+        self._compact_cond = threading.Condition()
+        self._compactor: Optional[threading.Thread] = None
+
+    @contextmanager
+    def _task(self, task_id: str):
+        """持有单个任务的锁并返回任务字典；任务不存在或已被删除时返回 None"""
+        lock = self._task_locks.get(task_id)
+        if lock is None:
+            yield None
+            return
+        with lock:
+            yield self._tasks.get(task_id)
+
+    def _register(self, task: Dict[str, Any]):
+        with self._lock:
+            self._task_locks.setdefault(task["id"], threading.Lock())
+            self._tasks[task["id"]] = task
+
+    def _all_tasks(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._tasks.values())
+
+    def _bump_version(self):
+        with self._version_lock:
+            self.list_version += 1
+
+    @staticmethod
+    def _new_result_version() -> str:
+        """结果在内存中被替换或编辑后的版本号（用于导出缓存）"""
+        return uuid.uuid4().hex[:12]
+
+    @staticmethod
+    def _stored_result_version(updated_at: float, replayed: int) -> str:
+        """从数据库读取的结果的版本号：相同的数据库内容在服务重启后得到相同的版本号"""
+        return f"{int(updated_at * 1000):x}-{replayed}"
 
     # ----------------------------------------------------------------
-    # 持久化：每个任务在 HISTORY_DIR/{task_id}/ 下保存
-    #   - meta.json   : 任务元数据（不含 result）
-    #   - result.json  : 转录结果
-    #   - 原始音视频文件（拷贝或移动到该目录）
+    # 持久化：
+    #   - 任务元数据与转录结果保存在 SQLite 数据库（HISTORY_DIR/tasks.db），
+    #     由 TaskWriter 在后台合并写入，服务关闭时写完全部变更
+    #   - 原始音视频与播放用 WAV 保存在 HISTORY_DIR/{task_id}/ 下
     # ----------------------------------------------------------------
 
     def _task_dir(self, task_id: str) -> str:
         return os.path.join(HISTORY_DIR, task_id)
 
-    def _save_meta(self, task_id: str):
-        """保存任务元数据到磁盘"""
-        task = self._tasks.get(task_id)
-        if not task:
-            return
-        task_dir = self._task_dir(task_id)
-        os.makedirs(task_dir, exist_ok=True)
-
-        meta = {
-            "id": task["id"],
-            "filename": task["filename"],
-            "engine": task["engine"],
-            "model": task["model"],
-            "language": task["language"],
-            "media_file": task.get("media_file", ""),
-            "status": _status_str(task["status"]),
-            "progress": task["progress"],
-            "message": task["message"],
-            "error": task["error"],
-            "created_at": task["created_at"],
-            "completed_at": task["completed_at"],
-        }
-        meta_path = os.path.join(task_dir, "meta.json")
-        with open(meta_path, "w", encoding="utf-8") as f:
-            json.dump(meta, f, ensure_ascii=False, indent=2)
+    def _save_meta(self, task: Dict[str, Any], drop_result: bool = False):
+        """提交任务元数据快照，由后台线程写入数据库（调用方需持有该任务的锁）"""
+        self._writer.save_task(task.copy(), drop_result=drop_result)
+        self._bump_version()
 
-    def _save_result(self, task_id: str):
-        """保存转录结果到磁盘"""
-        task = self._tasks.get(task_id)
-        if not task or not task.get("result"):
+    def _save_result(self, task: Dict[str, Any]):
+        """提交转录结果与任务元数据，同一事务写入（调用方需持有该任务的锁）"""
+        if not task.get("result"):
             return
-        task_dir = self._task_dir(task_id)
-        os.makedirs(task_dir, exist_ok=True)
+        self._writer.save_result(task.copy(), task["result"])
+        self._discard_pending_edits(task["id"])
+        self._stale_text.discard(task["id"])
+        self._bump_version()
 
-        result_path = os.path.join(task_dir, "result.json")
-        with open(result_path, "w", encoding="utf-8") as f:
-            json.dump(task["result"], f, ensure_ascii=False, indent=2)
+    def _persist_media(self, task_id: str, src_path: str, content_hash: str) -> str:
+        """将原始媒体放入按内容寻址的存储，并在任务目录中创建 media{ext} 硬链接，返回任务引用的路径。
 
-        # 同时保存到旧的 results/ 目录（兼容导出等功能）
-        compat_path = os.path.join(RESULT_DIR, f"{task_id}.json")
-        with open(compat_path, "w", encoding="utf-8") as f:
-            json.dump(task["result"], f, ensure_ascii=False, indent=2)
-
-    def _persist_media(self, task_id: str, src_path: str) -> str:
-        """将上传的原始媒体文件持久化到任务目录，返回新路径"""
+        上传目录中的临时文件直接移动（不再复制），相同内容的媒体只保存一份；
+        其他位置的文件复制一份，不改动原文件。
+        """
         task_dir = self._task_dir(task_id)
         os.makedirs(task_dir, exist_ok=True)
 
-        ext = os.path.splitext(src_path)[1]
+        ext = os.path.splitext(src_path)[1].lower()
         dest_path = os.path.join(task_dir, f"media{ext}")
-
-        if os.path.abspath(src_path) != os.path.abspath(dest_path):
-            shutil.copy2(src_path, dest_path)
+        return blob_store.add(src_path, content_hash, dest_path, move=_in_upload_dir(src_path))
+
+    def _media_blob(self, task: Dict[str, Any]) -> str:
+        """任务媒体文件在内容寻址存储中的路径（旧版任务没有）"""
+        media_file = task.get("media_file", "")
+        if not media_file or not task.get("content_hash"):
+            return ""
+        return blob_store.path(task["content_hash"], os.path.splitext(media_file)[1])
+
+    def _release_blob(self, blob: str):
+        """任务删除后释放其媒体 blob：仍有任务引用时保留（不支持硬链接时任务直接引用 blob 路径）"""
+        if any(t.get("media_file") == blob for t in self._all_tasks()):
+            return
+        blob_store.release(blob)
+
+    def wav_path(self, task_id: str) -> str:
+        """任务的播放/转录用 WAV 在任务目录中的路径"""
+        return os.path.join(self._task_dir(task_id), "audio.wav")
+
+    def existing_wav(self, task_id: str) -> str:
+        """任务目录中已转换好的 WAV（由同一媒体文件转换而来，可直接复用），没有返回空字符串"""
+        path = self.wav_path(task_id)
+        return path if os.path.isfile(path) else ""
+
+    def convert_wav(self, task_id: str, media_path: str,
+                    stats: Optional[Dict[str, Any]] = None) -> str:
+        """将媒体转换为 16kHz WAV，直接写到任务目录中的最终位置（先写临时文件再改名）"""
+        from app.audio_utils import convert_to_wav
+
+        dest_path = self.wav_path(task_id)
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        tmp_path = f"{dest_path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            convert_to_wav(media_path, output_path=tmp_path, stats=stats)
+            os.replace(tmp_path, dest_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
         return dest_path
 
     def persist_wav(self, task_id: str, wav_path: str) -> str:
-        """将转录用的 WAV 文件持久化到任务目录，供播放使用（确保时间线一致）"""
+        """将转录用的 WAV 文件持久化到任务目录，供播放使用（确保时间线一致），
+        同时计算波形峰值文件并安排生成播放代理"""
         task_dir = self._task_dir(task_id)
         os.makedirs(task_dir, exist_ok=True)
 
@@ -108,99 +197,489 @@ class TaskManager:
         if os.path.abspath(wav_path) != os.path.abspath(dest_path):
             shutil.copy2(wav_path, dest_path)
 
-        with self._lock:
-            if task_id in self._tasks:
-                self._tasks[task_id]["wav_file"] = dest_path
+        with self._task(task_id) as task:
+            if task:
+                task["wav_file"] = dest_path
+        if task:
+            try:
+                compute_peaks(dest_path)
+            except Exception as e:
+                print(f"[波形] 计算峰值失败 {task_id}: {e}")
+            # 在后台提前生成播放代理，首次播放时通常已就绪
+            playback_proxy.schedule(dest_path)
+            return dest_path
+        # 复制期间任务已被删除
+        _remove_in_background([task_dir])
         return dest_path
 
-    def load_history(self):
-        """从磁盘加载所有历史任务"""
-        if not os.path.isdir(HISTORY_DIR):
-            return
+    def close(self):
+        """合并剩余的片段编辑，写完全部待写入变更后关闭任务数据库（服务关闭时调用）"""
+        with self._compact_cond:
+            pending = list(self._pending_edits)
+        for task_id in pending:
+            self._compact_edits(task_id)
+        self._writer.close()
+        self._store.close()
 
-        loaded = 0
-        for entry in sorted(os.listdir(HISTORY_DIR)):
-            task_dir = os.path.join(HISTORY_DIR, entry)
-            if not os.path.isdir(task_dir):
-                continue
+    def persistence_stats(self) -> Dict[str, Any]:
+        return self._writer.stats()
+
+    # ----------------------------------------------------------------
+    # 存储管理：供 app.storage 统计占用、清理孤立文件与淘汰派生文件
+    # ----------------------------------------------------------------
 
-            meta_path = os.path.join(task_dir, "meta.json")
-            if not os.path.isfile(meta_path):
+    def mark_played(self, task_id: str):
+        """记录最近播放时间（磁盘配额按此淘汰派生文件）；一分钟内的重复请求不再写库"""
+        now = time.time()
+        with self._task(task_id) as task:
+            if not task or now - (task.get("last_played_at") or 0) < 60:
+                return
+            task["last_played_at"] = now
+            # 不影响任务列表内容，不更新列表版本号
+            self._writer.save_task(task.copy())
+
+    def storage_snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """各任务与存储相关的字段：{task_id: {media_file, file_path, active, last_used}}"""
+        snapshot = {}
+        for task in self._all_tasks():
+            snapshot[task["id"]] = {
+                "media_file": task.get("media_file", ""),
+                "file_path": task.get("file_path", ""),
+                "has_result": bool(task.get("has_result")),
+                "active": _status_str(task["status"]) in ("pending", "processing"),
+                "last_used": task.get("last_played_at") or task.get("completed_at")
+                or task.get("created_at") or 0,
+            }
+        return snapshot
+
+    def save_batch(self, batch: Dict[str, Any]):
+        """写入批次记录（批次很少更新，直接写库，不经后台合并）"""
+        self._store.save_batch(batch)
+
+    def load_batches(self) -> List[Dict[str, Any]]:
+        return self._store.load_batches()
+
+    def batch_tasks(self, batch_ids: Optional[set] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """按批次分组的任务状态：{batch_id: [{id, filename, status, progress, error}]}，
+        batch_ids 为 None 时返回所有批次"""
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for task in self._all_tasks():
+            batch_id = task.get("batch_id")
+            if not batch_id or (batch_ids is not None and batch_id not in batch_ids):
                 continue
+            groups.setdefault(batch_id, []).append({
+                "id": task["id"],
+                "filename": task["filename"],
+                "status": _status_str(task["status"]),
+                "progress": task.get("progress", 0.0),
+                "error": task.get("error"),
+                "created_at": task.get("created_at", 0),
+            })
+        return groups
+
+    def evict_derived(self, task_id: str, paths: List[str]) -> bool:
+        """删除任务的派生文件（可由原始媒体重新生成）。
+
+        排队或转录中的任务、原始媒体已不存在的任务不删除。文件在任务锁内移入回收目录，
+        不会与同时开始的重新转录交错，再由后台线程删除。
+        """
+        with self._task(task_id) as task:
+            if not task or _status_str(task["status"]) in ("pending", "processing"):
+                return False
+            media = task.get("media_file", "")
+            if not (media and os.path.isfile(media)):
+                return False
+            trash = os.path.join(TRASH_DIR, f"{task_id}-derived-{uuid.uuid4().hex[:6]}")
+            os.makedirs(trash, exist_ok=True)
+            for path in paths:
+                try:
+                    os.rename(path, os.path.join(trash, os.path.basename(path)))
+                except OSError:
+                    pass
+            if task.get("wav_file") and not os.path.isfile(task["wav_file"]):
+                task["wav_file"] = ""
+                self._writer.save_task(task.copy())
+        _remove_in_background([trash])
+        return True
+
+    # ----------------------------------------------------------------
+    # 历史加载：启动时从数据库读取所有任务元数据，转录结果在首次访问任务时才加载。
+    # 旧版 HISTORY_DIR/{task_id}/meta.json + result.json 格式的任务会被导入数据库。
+    # ----------------------------------------------------------------
 
+    def _task_from_row(self, row: Dict[str, Any], requeue: List) -> Dict[str, Any]:
+        task_id = row["id"]
+        media_file = row.get("media_file", "")
+        has_result = bool(row.get("has_result"))
+
+        status_str = row.get("status", "completed")
+        # 未完成的历史任务：有结果视为完成，有媒体文件则重新排队，否则标记为失败
+        message = row.get("message") or "从历史记录恢复"
+        if status_str in ("pending", "processing"):
+            if has_result:
+                status_str = "completed"
+            elif media_file and os.path.isfile(media_file):
+                status_str = "pending"
+                message = "等待处理（服务重启后重新排队）..."
+                requeue.append((row.get("created_at", 0), task_id, media_file))
+            else:
+                status_str = "failed"
+
+        return {
+            "id": task_id,
+            "filename": row.get("filename", "unknown"),
+            "engine": row.get("engine", ""),
+            "model": row.get("model", ""),
+            "language": row.get("language", ""),
+            "file_path": media_file,
+            "media_file": media_file,
+            "content_hash": row.get("content_hash", ""),
+            "file_size": row.get("file_size", 0),
+            "media_info": row.get("media_info"),
+            "conversion": row.get("conversion"),
+            "wav_file": row.get("wav_file", ""),
+            "has_media": bool(media_file and os.path.isfile(media_file)),
+            "status": status_str,
+            "progress": 1.0 if status_str == "completed" else 0.0,
+            "message": message,
+            "result": None,
+            "has_result": has_result,
+            "error": row.get("error"),
+            "created_at": row.get("created_at", 0),
+            "completed_at": row.get("completed_at"),
+            "last_played_at": row.get("last_played_at"),
+            "batch_id": row.get("batch_id") or "",
+        }
+
+    def load_history(self):
+        """从数据库加载所有任务"""
+        started = time.perf_counter()
+        imported = self._store.import_legacy_dirs(HISTORY_DIR, self._store.task_ids())
+        if imported:
+            print(f"[历史加载] 已将 {imported} 条旧版历史任务导入数据库")
+
+        requeue = []
+        tasks = {}
+        changed = []
+        for row in self._store.load_tasks():
             try:
-                with open(meta_path, "r", encoding="utf-8") as f:
-                    meta = json.load(f)
-
-                task_id = meta["id"]
-
-                # 恢复媒体文件路径
-                media_file = meta.get("media_file", "")
-                file_path = ""
-                if media_file and os.path.isfile(media_file):
-                    file_path = media_file
-                else:
-                    # 尝试查找 task_dir 下的 media.* 文件
-                    media_files = glob.glob(os.path.join(task_dir, "media.*"))
-                    if media_files:
-                        file_path = media_files[0]
-
-                # 恢复 WAV 播放文件路径
-                wav_file = ""
-                wav_path_candidate = os.path.join(task_dir, "audio.wav")
-                if os.path.isfile(wav_path_candidate):
-                    wav_file = wav_path_candidate
-
-                # 加载转录结果
-                result = None
-                result_path = os.path.join(task_dir, "result.json")
-                if os.path.isfile(result_path):
-                    with open(result_path, "r", encoding="utf-8") as f:
-                        result = json.load(f)
-
-                # 构建任务对象
-                status_str = meta.get("status", "completed")
-                # 未完成的历史任务标记为失败（因为进程已重启）
-                if status_str in ("pending", "processing"):
-                    if result:
-                        status_str = "completed"
-                    else:
-                        status_str = "failed"
-
-                task = {
-                    "id": task_id,
-                    "filename": meta.get("filename", "unknown"),
-                    "engine": meta.get("engine", ""),
-                    "model": meta.get("model", ""),
-                    "language": meta.get("language", ""),
-                    "file_path": file_path,
-                    "media_file": file_path,
-                    "wav_file": wav_file,
-                    "status": status_str,
-                    "progress": 1.0 if status_str == "completed" else 0.0,
-                    "message": meta.get("message", "从历史记录恢复"),
-                    "result": result,
-                    "error": meta.get("error"),
-                    "created_at": meta.get("created_at", 0),
-                    "completed_at": meta.get("completed_at"),
+                task = self._task_from_row(row, requeue)
+            except Exception as e:
+                print(f"[历史加载] 跳过 {row.get('id')}: {e}")
+                continue
+            tasks[task["id"]] = task
+            if task["status"] != row.get("status"):
+                changed.append(task["id"])
+
+        for task in tasks.values():
+            self._register(task)
+        # 恢复时修正了状态的任务写回数据库，保证按状态查询的结果一致
+        for task_id in changed:
+            with self._task(task_id) as task:
+                if task:
+                    self._save_meta(task)
+        _remove_in_background([TRASH_DIR])
+
+        if tasks:
+            print(f"[历史加载] 已恢复 {len(tasks)} 条历史任务"
+                  f"（{(time.perf_counter() - started) * 1000:.0f}ms）")
+
+        # 按创建顺序恢复未完成任务的队列
+        for _, task_id, media_path in sorted(requeue):
+            self.submit(task_id, media_path)
+        if requeue:
+            print(f"[历史加载] {len(requeue)} 条未完成任务已重新排队")
+
+    def _ensure_result_loaded(self, task_id: str):
+        """按需从数据库加载转录结果（读库时不持有锁）"""
+        with self._task(task_id) as task:
+            if not task or task.get("result") is not None or not task.get("has_result"):
+                return
+        try:
+            loaded = self._store.load_result(task_id)
+        except Exception as e:
+            print(f"[历史加载] 读取结果失败 {task_id}: {e}")
+            return
+        if loaded is None:
+            return
+        result, replayed, updated_at = loaded
+        with self._task(task_id) as task:
+            if task and task.get("result") is None and task.get("has_result"):
+                task["result"] = result
+                task["result_version"] = self._stored_result_version(updated_at, replayed)
+                # 上次未来得及合并的编辑日志已应用到 result，稍后合并进数据库
+                if replayed:
+                    self._schedule_compaction(task_id, replayed)
+
+    # ----------------------------------------------------------------
+    # 片段编辑：编辑立即应用到内存中的结果，并作为编辑日志追加写入数据库，
+    # 写入量只与编辑条数有关；后台线程定期把日志合并进完整结果，
+    # 合并前崩溃时读取结果会重放日志。
+    # ----------------------------------------------------------------
+
+    def edit_segments(self, task_id: str, edits: List[tuple]) -> Optional[int]:
+        """批量修改片段文本 [(片段序号, 新文本)]，返回结果的片段总数。
+
+        任务或结果不存在返回 None；任一序号越界时抛出 IndexError，且不应用任何编辑。
+        """
+        self._ensure_result_loaded(task_id)
+        with self._task(task_id) as task:
+            result = task.get("result") if task else None
+            if not result:
+                return None
+            segments = result.get("segments", [])
+            for index, _ in edits:
+                if not 0 <= index < len(segments):
+                    raise IndexError(index)
+            if not edits:
+                return len(segments)
+            for index, text in edits:
+                segments[index]["text"] = text
+            task["result_version"] = self._new_result_version()
+            self._writer.append_edits(task_id, list(edits))
+            self._stale_text.add(task_id)
+            self._schedule_compaction(task_id, len(edits))
+            self._bump_version()
+            total = len(segments)
+        # 旧版本的导出文件不会再被读取，这里只是尽早释放磁盘空间
+        export_cache.invalidate(task_id)
+        return total
+
+    def _schedule_compaction(self, task_id: str, count: int):
+        # 调用方需持有该任务的锁
+        with self._compact_cond:
+            pending = self._pending_edits.get(task_id)
+            if pending is None:
+                pending = self._pending_edits[task_id] = {
+                    "count": 0, "due": time.time() + EDIT_COMPACT_DELAY_SECONDS,
                 }
+            pending["count"] += count
+            if pending["count"] >= EDIT_COMPACT_MAX_PENDING:
+                pending["due"] = 0.0
+            if self._compactor is None:
+                self._compactor = threading.Thread(
+                    target=self._compact_loop, name="edit-compactor", daemon=True
+                )
+                self._compactor.start()
+            self._compact_cond.notify()
+
+    def _discard_pending_edits(self, task_id: str):
+        with self._compact_cond:
+            self._pending_edits.pop(task_id, None)
+
+    def _compact_loop(self):
+        while True:
+            with self._compact_cond:
+                while True:
+                    now = time.time()
+                    due = [tid for tid, p in self._pending_edits.items() if p["due"] <= now]
+                    if due:
+                        break
+                    next_due = min((p["due"] for p in self._pending_edits.values()), default=None)
+                    self._compact_cond.wait(None if next_due is None else next_due - now)
+            for task_id in due:
+                self._compact_edits(task_id)
+
+    def _compact_edits(self, task_id: str):
+        """将内存中已编辑的结果写回数据库，并删除已包含的编辑日志"""
+        with self._task(task_id) as task:
+            with self._compact_cond:
+                pending = self._pending_edits.pop(task_id, None)
+            result = task.get("result") if task else None
+            if not pending or not result:
+                return
+            # 快照与提交都在任务锁内完成，保证写入线程中合并发生在此前追加的日志之后、
+            # 之后追加的日志之前；序列化与写入由写入线程完成
+            snapshot = dict(result, segments=[dict(s) for s in result.get("segments", [])])
+            apply_segment_edits(snapshot, ())
+            self._writer.compact(task_id, snapshot)
+
+    # ----------------------------------------------------------------
+    # 事件推送：状态变化发布到 event_bus，由 /api/events 以 SSE 推送给前端。
+    # 进度事件只携带变化的字段，转录结果只在 completed 事件中发送一次。
+    # ----------------------------------------------------------------
+
+    @staticmethod
+    def _delta(task: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "id": task["id"],
+            "status": _status_str(task["status"]),
+            "progress": round(task["progress"], 3),
+            "message": task["message"],
+        }
 
-                with self._lock:
-                    self._tasks[task_id] = task
-                loaded += 1
+    def _publish_state(self, task_id: str):
+        """推送任务当前状态（状态切换时调用，调用方不得持有该任务的锁）"""
+        with self._task(task_id) as task:
+            if not task:
+                return
+            delta = self._delta(task)
+            self._last_pushed[task_id] = (task["progress"], task["message"])
+        event_bus.publish("progress", delta)
+
+    def _publish_queue(self):
+        if event_bus.has_subscribers():
+            event_bus.publish("queue", {"positions": self._scheduler.positions()})
+
+    def active_snapshot(self) -> List[Dict[str, Any]]:
+        """排队中与处理中任务的精简状态（SSE 连接建立时发送）"""
+        positions = self._scheduler.positions()
+        snapshot = []
+        for task in self._all_tasks():
+            # 逐个读取字段，不加任务锁（单个字段的读取是原子的，最多读到略旧的进度）
+            if _status_str(task["status"]) in ("pending", "processing"):
+                delta = self._delta(task)
+                delta["queue_position"] = positions.get(task["id"])
+                snapshot.append(delta)
+        return snapshot
 
-            except Exception as e:
-                print(f"[历史加载] 跳过 {entry}: {e}")
+    # ----------------------------------------------------------------
+    # 片段窗口读取：长转录结果按序号或时间范围分段返回，不必整体下发
+    # ----------------------------------------------------------------
 
-        if loaded > 0:
-            print(f"[历史加载] 已恢复 {loaded} 条历史任务")
+    def _segment_index(self, task: Optional[Dict[str, Any]]) -> Optional[tuple]:
+        """返回 (segments, SegmentIndex, 是否为转录中的部分结果)；调用方需持有该任务的锁。
+
+        没有最终结果时使用转录过程中已输出的片段。
+        """
+        if not task:
+            return None
+        task_id = task["id"]
+        result = task.get("result")
+        if result:
+            source, segments, partial = result, result.get("segments", []), False
+        elif task.get("partial_segments"):
+            source = segments = task["partial_segments"]
+            partial = True
+        else:
+            return None
+        cached = self._segment_indexes.get(task_id)
+        if cached is None or cached[0] is not source or len(cached[1]) != len(segments):
+            cached = (source, SegmentIndex(segments))
+            self._segment_indexes[task_id] = cached
+        return segments, cached[1], partial
+
+    def result_summary(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """转录结果概要（片段数、时长、语言等），没有结果返回 None"""
+        self._ensure_result_loaded(task_id)
+        with self._task(task_id) as task:
+            found = self._segment_index(task)
+            if found is None:
+                return None
+            segments, index, partial = found
+            result = task["result"] or {}
+            speakers = {seg.get("speaker") for seg in segments if seg.get("speaker")}
+            return {
+                "segment_count": len(index),
+                "duration": index.duration,
+                "language": result.get("language", ""),
+                "engine": result.get("engine", ""),
+                "speakers": len(speakers),
+                "partial": partial,
+            }
+
+    def get_segments(self, task_id: str, start: int = 0, end: Optional[int] = None,
+                     t0: Optional[float] = None, t1: Optional[float] = None,
+                     limit: int = 0) -> Optional[Dict[str, Any]]:
+        """按序号范围 [start, end) 或时间范围 [t0, t1) 读取片段，没有结果返回 None"""
+        self._ensure_result_loaded(task_id)
+        with self._task(task_id) as task:
+            found = self._segment_index(task)
+            if found is None:
+                return None
+            segments, index, partial = found
+            total = len(index)
+            if t0 is not None or t1 is not None:
+                lo, hi = index.time_range(t0 if t0 is not None else 0.0,
+                                          t1 if t1 is not None else float("inf"))
+            else:
+                lo = max(0, start)
+                hi = total if end is None else max(lo, min(end, total))
+            if limit > 0:
+                hi = min(hi, lo + limit)
+            window = [dict(seg) for seg in segments[lo:hi]]
+        return {"total": total, "start": lo, "end": lo + len(window),
+                "partial": partial, "segments": window}
+
+    def segment_at(self, task_id: str, t: float) -> Optional[Dict[str, Any]]:
+        """t 时刻所在的片段（二分查找），没有结果返回 None"""
+        self._ensure_result_loaded(task_id)
+        with self._task(task_id) as task:
+            found = self._segment_index(task)
+            if found is None:
+                return None
+            segments, index, _ = found
+            i = index.at(t)
+            return {"index": i, "segment": dict(segments[i]) if i is not None else None}
+
+    # ----------------------------------------------------------------
+    # 调度：任务进入队列，由固定数量的工作线程按引擎/模型限额执行
+    # ----------------------------------------------------------------
+
+    def submit(self, task_id: str, media_path: Optional[str] = None) -> bool:
+        """将任务加入转录队列（任务保持 PENDING 状态直到被工作线程取走）；
+        不指定 media_path 时使用任务的媒体文件"""
+        with self._task(task_id) as task:
+            if not task:
+                return False
+            job = TranscriptionJob(
+                task_id=task_id,
+                media_path=media_path or task["media_file"],
+                engine=task["engine"],
+                model=task["model"],
+                language=task["language"],
+                duration=(task.get("media_info") or {}).get("duration", 0.0),
+                batch_id=task.get("batch_id", ""),
+            )
+            task["status"] = TaskStatus.PENDING
+            self._save_meta(task)
+        self._scheduler.submit(job)
+        self._publish_state(task_id)
+        self._publish_queue()
+        return True
+
+    def _run_job(self, job: TranscriptionJob):
+        if job.task_id not in self._tasks:
+            return
+        process_job(job)
+
+    def queue_position(self, task_id: str) -> Optional[int]:
+        """任务在队列中的位置（从 1 开始），不在排队返回 None"""
+        return self._scheduler.position(task_id)
+
+    def queue_positions(self) -> Dict[str, int]:
+        return self._scheduler.positions()
+
+    def queue_stats(self) -> Dict[str, Any]:
+        return self._scheduler.stats()
+
+    def set_conversion_stats(self, task_id: str, stats: Dict[str, Any]):
+        """记录音频转换统计（耗时、ffmpeg 线程与 CPU 时间等）"""
+        with self._task(task_id) as task:
+            if task:
+                task["conversion"] = dict(stats)
+                self._save_meta(task)
+
+    def mark_processing(self, task_id: str, message: str = ""):
+        """工作线程开始处理任务时调用"""
+        with self._task(task_id) as task:
+            if task:
+                task["status"] = TaskStatus.PROCESSING
+                if message:
+                    task["message"] = message
+                self._save_meta(task)
+        self._publish_state(task_id)
+        self._publish_queue()
 
     # ----------------------------------------------------------------
     # CRUD 操作
     # ----------------------------------------------------------------
 
     def create_task(self, filename: str, engine: str, model: str,
-                    language: str, file_path: str) -> str:
+                    language: str, file_path: str,
+                    content_hash: str = "", file_size: int = 0,
+                    media_info: Optional[Dict[str, Any]] = None,
+                    batch_id: str = "") -> str:
         task_id = uuid.uuid4().hex[:12]
 
         task = {
@@ -211,55 +690,178 @@ class TaskManager:
             "language": language,
             "file_path": file_path,
             "media_file": "",
+            "has_media": True,
+            "content_hash": content_hash,
+            "file_size": file_size,
+            "media_info": media_info,
             "status": TaskStatus.PENDING,
             "progress": 0.0,
             "message": "等待处理...",
             "result": None,
+            "has_result": False,
             "error": None,
             "created_at": time.time(),
             "completed_at": None,
+            "last_played_at": None,
+            "batch_id": batch_id,
         }
 
-        # 持久化原始媒体文件
-        media_path = self._persist_media(task_id, file_path)
-        task["media_file"] = media_path
+        # 持久化原始媒体文件（上传的临时文件被移入存储，原路径不再存在）
+        if not content_hash:
+            task["content_hash"] = content_hash = hash_file(file_path)
+        media_path = self._persist_media(task_id, file_path, content_hash)
+        task["file_path"] = task["media_file"] = media_path
 
-        with self._lock:
-            self._tasks[task_id] = task
-            self._save_meta(task_id)
+        self._register(task)
+        with self._task(task_id) as task:
+            self._save_meta(task)
 
         return task_id
 
-    def get_task(self, task_id: str) -> Optional[Dict[str, Any]]:
-        with self._lock:
-            task = self._tasks.get(task_id)
-            if task:
-                return task.copy()
+    def get_task(self, task_id: str, include_result: bool = True) -> Optional[Dict[str, Any]]:
+        """返回任务副本；include_result=False 时不加载也不包含转录结果"""
+        if include_result:
+            self._ensure_result_loaded(task_id)
+        with self._task(task_id) as task:
+            if not task:
+                return None
+            self._refresh_text(task)
+            task = task.copy()
+        if not include_result:
+            task["result"] = None
+        return task
+
+    def _refresh_text(self, task: Dict[str, Any]):
+        """片段被编辑过时重建 full_text（调用方需持有该任务的锁）"""
+        if task["id"] in self._stale_text and task.get("result"):
+            apply_segment_edits(task["result"], ())
+            self._stale_text.discard(task["id"])
+
+    def result_version(self, task_id: str) -> Optional[str]:
+        task = self._tasks.get(task_id)
+        return task.get("result_version") if task else None
+
+    def export_source(self, task_id: str) -> Optional[tuple]:
+        """导出用的 (result, 结果版本号, 原文件名)，没有结果返回 None。
+
+        结果不在内存中时直接从数据库读取且不缓存，批量导出大量任务时内存占用不随任务数增长。
+        """
+        with self._task(task_id) as task:
+            if not task or not task.get("has_result"):
+                return None
+            if task.get("result") is not None:
+                self._refresh_text(task)
+                return task["result"], task.get("result_version", ""), task["filename"]
+            filename = task["filename"]
+        try:
+            loaded = self._store.load_result(task_id)
+        except Exception as e:
+            print(f"[导出] 读取结果失败 {task_id}: {e}")
+            return None
+        if loaded is None:
             return None
+        result, replayed, updated_at = loaded
+        version = self._stored_result_version(updated_at, replayed)
+        with self._task(task_id) as task:
+            if task and task.get("result") is None:
+                task["result_version"] = version
+        return result, version, filename
 
     def get_all_tasks(self) -> List[Dict[str, Any]]:
-        with self._lock:
-            # 按创建时间倒序返回
-            tasks = sorted(
-                self._tasks.values(),
-                key=lambda t: t.get("created_at", 0),
-                reverse=True,
+        # 按创建时间倒序返回
+        tasks = sorted(self._all_tasks(), key=lambda t: t.get("created_at", 0), reverse=True)
+        copies = []
+        for task in tasks:
+            with self._task(task["id"]) as current:
+                if current:
+                    copies.append(current.copy())
+        return copies
+
+    def list_tasks(self, statuses: Optional[List[str]] = None, engines: Optional[List[str]] = None,
+                   since: Optional[float] = None, until: Optional[float] = None,
+                   prefix: str = "", after: Optional[tuple] = None,
+                   limit: int = 100) -> tuple:
+        """分页查询任务列表（按创建时间倒序），返回 (任务副本列表, 下一页游标或 None)。
+
+        过滤与排序在数据库索引上完成，只复制当前页的任务；进度等实时状态取自内存。
+        不等待后台写入：尚未写入数据库的任务（刚创建、状态刚变化或刚删除）按内存中的字段过滤，
+        与数据库中其余任务的查询结果合并。
+        """
+        # 先取未写入的任务再查询；这些任务在数据库中的行不采用，一律按内存中的字段判断
+        dirty = self._writer.dirty_ids()
+        rows = [
+            row for row in self._store.query_ids(
+                statuses, engines, since, until, prefix, after, limit + 1 + len(dirty),
             )
-            return [t.copy() for t in tasks]
+            if row[0] not in dirty
+        ]
+        for task_id in dirty:
+            with self._task(task_id) as task:
+                if task and _task_matches(task, statuses, engines, since, until, prefix, after):
+                    rows.append((task_id, task.get("created_at", 0)))
+        rows.sort(key=lambda r: (r[1], r[0]), reverse=True)
+        rows = rows[:limit + 1]
+        next_after = None
+        if len(rows) > limit:
+            last_id, last_created = rows[limit - 1]
+            next_after = (last_created, last_id)
+        tasks = []
+        for task_id, _ in rows[:limit]:
+            with self._task(task_id) as task:
+                if task:
+                    tasks.append({k: v for k, v in task.items() if k != "result"})
+        return tasks, next_after
+
+    def append_partial_segments(self, task_id: str, segments: List[Dict[str, Any]],
+                                processed_seconds: float):
+        """转录过程中追加引擎已输出的片段（只保存在内存中，任务完成后由最终结果替代）"""
+        if not segments:
+            return
+        with self._task(task_id) as task:
+            if not task:
+                return
+            partial = task.setdefault("partial_segments", [])
+            offset = len(partial)
+            partial.extend(segments)
+            task["processed_seconds"] = processed_seconds
+        event_bus.publish("segments", {
+            "id": task_id,
+            "offset": offset,
+            "processed_seconds": round(processed_seconds, 2),
+            "segments": segments,
+        })
 
     def update_progress(self, task_id: str, progress: float, message: str = ""):
-        with self._lock:
-            if task_id in self._tasks:
-                self._tasks[task_id]["progress"] = progress
-                if message:
-                    self._tasks[task_id]["message"] = message
+        with self._task(task_id) as task:
+            if not task:
+                return
+            task["progress"] = progress
+            if message:
+                task["message"] = message
+            self._bump_version()
+            if not event_bus.has_subscribers():
+                return
+            last_progress, last_message = self._last_pushed.get(task_id, (None, None))
+            if (last_progress is not None and task["message"] == last_message
+                    and abs(progress - last_progress) < EVENT_PROGRESS_STEP):
+                return
+            delta = {"id": task_id, "progress": round(progress, 3)}
+            if task["message"] != last_message:
+                delta["message"] = task["message"]
+            self._last_pushed[task_id] = (progress, task["message"])
+        event_bus.publish("progress", delta)
 
     def reset_task_for_retranscribe(self, task_id: str, engine: str, model: str, language: str) -> bool:
-        """重置任务状态以便重新转录，返回是否成功"""
-        with self._lock:
-            task = self._tasks.get(task_id)
+        """重置任务状态以便重新转录，任务不存在返回 False。
+
+        任务正在排队或转录中时抛出 TaskBusyError；状态检查与重置在同一把任务锁内完成，
+        并发的重复请求只有一个能成功。
+        """
+        with self._task(task_id) as task:
             if not task:
                 return False
+            if _status_str(task["status"]) in ("pending", "processing"):
+                raise TaskBusyError(task_id)
             task["engine"] = engine
             task["model"] = model
             task["language"] = language
@@ -267,128 +869,270 @@ class TaskManager:
             task["progress"] = 0.0
             task["message"] = "等待重新转录..."
             task["result"] = None
+            task["has_result"] = False
+            task.pop("result_version", None)
+            task.pop("partial_segments", None)
+            task.pop("processed_seconds", None)
+            self._segment_indexes.pop(task_id, None)
+            self._discard_pending_edits(task_id)
+            self._stale_text.discard(task_id)
             task["error"] = None
             task["completed_at"] = None
-            self._save_meta(task_id)
-            # 删除旧的 result.json
-            result_path = os.path.join(self._task_dir(task_id), "result.json")
-            if os.path.isfile(result_path):
-                try:
-                    os.remove(result_path)
-                except OSError:
-                    pass
-            return True
+            # 元数据更新与旧结果删除在同一事务中完成
+            self._save_meta(task, drop_result=True)
+        export_cache.invalidate(task_id)
+        return True
 
     def complete_task(self, task_id: str, result: Dict):
-        with self._lock:
-            if task_id in self._tasks:
-                self._tasks[task_id]["status"] = TaskStatus.COMPLETED
-                self._tasks[task_id]["progress"] = 1.0
-                self._tasks[task_id]["message"] = "转录完成"
-                self._tasks[task_id]["result"] = result
-                self._tasks[task_id]["completed_at"] = time.time()
-
-                self._save_result(task_id)
-                self._save_meta(task_id)
+        with self._task(task_id) as task:
+            if not task:
+                return
+            task["status"] = TaskStatus.COMPLETED
+            task["progress"] = 1.0
+            task["message"] = "转录完成"
+            task["result"] = result
+            task["result_version"] = self._new_result_version()
+            task["has_result"] = True
+            task["completed_at"] = time.time()
+            task.pop("partial_segments", None)
+            metrics.TASK_OUTCOMES.inc(engine=task.get("engine", ""), outcome="completed")
+
+            self._save_result(task)
+            event = dict(self._delta(task), result=result, completed_at=task["completed_at"])
+            self._last_pushed.pop(task_id, None)
+        event_bus.publish("completed", event)
 
     def fail_task(self, task_id: str, error: str):
-        with self._lock:
-            if task_id in self._tasks:
-                self._tasks[task_id]["status"] = TaskStatus.FAILED
-                self._tasks[task_id]["message"] = f"失败: {error}"
-                self._tasks[task_id]["error"] = error
+        with self._task(task_id) as task:
+            if not task:
+                return
+            task["status"] = TaskStatus.FAILED
+            task["message"] = f"失败: {error}"
+            task["error"] = error
+            task.pop("partial_segments", None)
+            metrics.TASK_OUTCOMES.inc(engine=task.get("engine", ""), outcome="failed")
+
+            self._save_meta(task)
+            event = dict(self._delta(task), error=error)
+            self._last_pushed.pop(task_id, None)
+        event_bus.publish("failed", event)
+
+    def delete_task(self, task_id: str) -> bool:
+        self._scheduler.cancel(task_id)
+        with self._task(task_id) as task:
+            if not task:
+                return False
+            file_path = task.get("file_path", "")
+            blob = self._media_blob(task)
+            with self._lock:
+                del self._tasks[task_id]
+                del self._task_locks[task_id]
+            self._writer.delete(task_id)
+            self._last_pushed.pop(task_id, None)
+            self._segment_indexes.pop(task_id, None)
+            self._discard_pending_edits(task_id)
+            self._stale_text.discard(task_id)
+            self._bump_version()
+
+        # 文件删除不持有任何锁：任务目录先移入回收目录，再由后台线程删除
+        paths = []
+        # 上传目录中的临时文件
+        if file_path and UPLOAD_DIR in os.path.abspath(file_path):
+            paths.append(file_path)
+        # 旧版遗留的 results/ 文件
+        paths.append(os.path.join(RESULT_DIR, f"{task_id}.json"))
+        export_cache.invalidate(task_id)
+        task_dir = self._task_dir(task_id)
+        if os.path.isdir(task_dir):
+            trash_path = os.path.join(TRASH_DIR, f"{task_id}-{uuid.uuid4().hex[:6]}")
+            try:
+                os.makedirs(TRASH_DIR, exist_ok=True)
+                os.rename(task_dir, trash_path)
+                paths.append(trash_path)
+            except OSError:
+                paths.append(task_dir)
+        # 任务目录中的硬链接删除后再检查 blob 是否还被其他任务使用
+        _remove_in_background(paths, then=(lambda: self._release_blob(blob)) if blob else None)
+
+        event_bus.publish("deleted", {"id": task_id})
+        self._publish_queue()
+        return True
+
+
+def _task_matches(task: Dict[str, Any], statuses: Optional[List[str]], engines: Optional[List[str]],
+                  since: Optional[float], until: Optional[float], prefix: str,
+                  after: Optional[tuple]) -> bool:
+    """内存中的任务是否满足列表过滤条件（与 TaskStore.query_ids 的条件一致）"""
+    created_at = task.get("created_at", 0)
+    if statuses and _status_str(task["status"]) not in statuses:
+        return False
+    if engines and task.get("engine") not in engines:
+        return False
+    if since is not None and created_at < since:
+        return False
+    if until is not None and created_at >= until:
+        return False
+    if prefix and not task.get("filename", "").lower().startswith(prefix.lower()):
+        return False
+    if after is not None and (created_at, task["id"]) >= tuple(after):
+        return False
+    return True
 
-                self._save_meta(task_id)
 
-    def save_edited_result(self, task_id: str):
-        """编辑片段后，将修改后的 result 持久化到磁盘"""
-        with self._lock:
-            if task_id in self._tasks and self._tasks[task_id].get("result"):
-                self._save_result(task_id)
+def _remove_paths(paths: List[str]):
+    for path in paths:
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.isfile(path):
+                os.remove(path)
+        except OSError:
+            pass
 
-    def delete_task(self, task_id: str) -> bool:
-        with self._lock:
-            if task_id in self._tasks:
-                task = self._tasks[task_id]
 
-                # 删除上传目录中的临时文件
-                fp = task.get("file_path", "")
-                if fp and os.path.isfile(fp) and UPLOAD_DIR in os.path.abspath(fp):
-                    try:
-                        os.remove(fp)
-                    except OSError:
-                        pass
+def _remove_in_background(paths: List[str], then: Optional[Callable[[], None]] = None):
+    """在后台线程中删除文件或目录（大目录删除可能耗时数秒），删除完成后调用 then"""
+    paths = [p for p in paths if os.path.exists(p)]
+    if not paths and then is None:
+        return
 
-                # 删除整个历史目录
-                task_dir = self._task_dir(task_id)
-                if os.path.isdir(task_dir):
-                    try:
-                        shutil.rmtree(task_dir)
-                    except OSError:
-                        pass
+    def run():
+        _remove_paths(paths)
+        if then is not None:
+            then()
 
-                # 删除兼容的 results/ 文件
-                compat_path = os.path.join(RESULT_DIR, f"{task_id}.json")
-                if os.path.isfile(compat_path):
-                    try:
-                        os.remove(compat_path)
-                    except OSError:
-                        pass
+    threading.Thread(target=run, name="task-cleanup", daemon=True).start()
 
-                del self._tasks[task_id]
-                return True
-        return False
+
+def _in_upload_dir(path: str) -> bool:
+    return os.path.dirname(os.path.abspath(path)) == os.path.abspath(UPLOAD_DIR)
 
 
 # 全局单例
 task_manager = TaskManager()
 
 
+def process_job(job: TranscriptionJob):
+    """在调度器工作线程中执行：转换音频格式后转录"""
+    try:
+        # 重新转录时复用任务目录中已有的 WAV，不再重复转换
+        wav_path = task_manager.existing_wav(job.task_id)
+        pcm_hash = ""
+        if not wav_path:
+            task_manager.mark_processing(job.task_id, "正在转换音频...")
+            conversion = {}
+            wav_path = task_manager.convert_wav(job.task_id, job.media_path, stats=conversion)
+            task_manager.set_conversion_stats(job.task_id, conversion)
+            pcm_hash = conversion.get("pcm_hash", "")
+        run_transcription(job.task_id, wav_path, job.engine, job.model, job.language,
+                          pcm_hash=pcm_hash)
+    except Exception as e:
+        traceback.print_exc()
+        task_manager.fail_task(job.task_id, str(e))
+
+
 def run_transcription(task_id: str, wav_path: str, engine_name: str,
-                      model_name: str, language: str):
-    """在后台线程中执行转录"""
+                      model_name: str, language: str, pcm_hash: str = ""):
+    """执行转录（由调度器工作线程调用）"""
     from app.engines.base import get_engine
+    from app.engines.probe import engine_probe
+    from app.audio_utils import hash_pcm, get_audio_duration
+    from app.engine_worker import engine_workers
 
     try:
+        task_manager.mark_processing(task_id)
         task_manager.update_progress(task_id, 0.05, "准备开始转录...")
-        with task_manager._lock:
-            if task_id in task_manager._tasks:
-                task_manager._tasks[task_id]["status"] = TaskStatus.PROCESSING
+
+        # 相同音频内容 + 相同设置已转录过时直接返回缓存结果
+        cache_key = ""
+        try:
+            cache_key = result_cache.make_key(
+                pcm_hash or hash_pcm(wav_path), engine_name, model_name, language
+            )
+            cached = result_cache.get(cache_key)
+        except Exception as e:
+            print(f"[结果缓存] 读取失败: {e}")
+            cached = None
+        if cached is not None:
+            task_manager.persist_wav(task_id, wav_path)
+            task_manager.complete_task(task_id, cached)
+            return
 
         engine = get_engine(engine_name)
         if not engine:
             task_manager.fail_task(task_id, f"引擎 {engine_name} 不可用")
             return
 
-        if not engine.is_available():
+        if not engine_probe.is_available(engine_name):
             task_manager.fail_task(
                 task_id,
-                f"引擎 {engine.display_name} 未安装。请运行: pip install {'openai-whisper' if engine_name == 'whisper' else 'funasr'}"
+                f"引擎 {engine.display_name} 未安装。请运行: pip install {' '.join(engine.packages[:1])}"
             )
             return
 
         def progress_cb(progress, message):
             task_manager.update_progress(task_id, progress, message)
 
-        result = engine.transcribe(
-            audio_path=wav_path,
-            model_name=model_name,
-            language=language if language != "auto" else None,
-            progress_callback=progress_cb,
-        )
+        def segments_cb(segments, processed_seconds):
+            task_manager.append_partial_segments(
+                task_id, [seg.to_dict() for seg in segments], processed_seconds
+            )
+
+        audio_seconds = get_audio_duration(wav_path)
+        started = time.time()
+
+        # 长音频在静音处切分后多进程并行转录
+        if LONG_AUDIO_MODE and audio_seconds >= LONG_AUDIO_MIN_SECONDS:
+            from app.long_audio import transcribe_long_audio
+            result = transcribe_long_audio(
+                engine_name=engine_name,
+                wav_path=wav_path,
+                model_name=model_name,
+                language=language if language != "auto" else None,
+                progress_callback=progress_cb,
+                segment_callback=segments_cb,
+            )
+        elif engine_workers.enabled:
+            # 在常驻的引擎工作进程中转录，进度经管道回传
+            result = engine_workers.transcribe(
+                engine_name=engine_name,
+                audio_path=wav_path,
+                model_name=model_name,
+                language=language if language != "auto" else None,
+                progress_callback=progress_cb,
+                segment_callback=segments_cb,
+            )
+        else:
+            result = engine.transcribe(
+                audio_path=wav_path,
+                model_name=model_name,
+                language=language if language != "auto" else None,
+                progress_callback=progress_cb,
+                segment_callback=segments_cb,
+            )
+
+        if audio_seconds > 0:
+            metrics.TRANSCRIPTION_RTF.observe(
+                (time.time() - started) / audio_seconds, engine=engine_name, model=model_name
+            )
+            metrics.TRANSCRIPTION_AUDIO_SECONDS.inc(audio_seconds, engine=engine_name, model=model_name)
 
         # 持久化转录用的 WAV 文件，供播放时使用（保证时间线一致）
         task_manager.persist_wav(task_id, wav_path)
 
-        task_manager.complete_task(task_id, result.to_dict())
+        result_dict = result.to_dict()
+        if cache_key:
+            result_cache.put(cache_key, result_dict)
+        task_manager.complete_task(task_id, result_dict)
 
     except Exception as e:
         traceback.print_exc()
         task_manager.fail_task(task_id, str(e))
     finally:
-        # 清理 WAV 临时转换文件（不是原始上传文件）
-        if wav_path and os.path.exists(wav_path):
-            task = task_manager.get_task(task_id)
+        # 清理任务目录之外的临时 WAV（任务目录中的 WAV 用于播放和重新转录）
+        if wav_path and os.path.exists(wav_path) and \
+                os.path.abspath(wav_path) != os.path.abspath(task_manager.wav_path(task_id)):
+            task = task_manager.get_task(task_id, include_result=False)
             if task:
                 original = task.get("file_path", "")
                 media = task.get("media_file", "")
@@ -0,0 +1,531 @@
+"""任务存储 - 基于 SQLite（WAL 模式）保存任务元数据、状态、进度与转录结果"""
+import os
+import json
+import glob
+import time
+import sqlite3
+import threading
+from typing import Dict, List, Any, Optional, Iterable, Tuple
+
+from app.config import TASK_DB_PATH
+
+SCHEMA_VERSION = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id            TEXT PRIMARY KEY,
+    filename      TEXT NOT NULL,
+    engine        TEXT NOT NULL DEFAULT '',
+    model         TEXT NOT NULL DEFAULT '',
+    language      TEXT NOT NULL DEFAULT '',
+    file_path     TEXT NOT NULL DEFAULT '',
+    media_file    TEXT NOT NULL DEFAULT '',
+    wav_file      TEXT NOT NULL DEFAULT '',
+    content_hash  TEXT NOT NULL DEFAULT '',
+    file_size     INTEGER NOT NULL DEFAULT 0,
+    media_info    TEXT,
+    conversion    TEXT,
+    status        TEXT NOT NULL,
+    progress      REAL NOT NULL DEFAULT 0,
+    message       TEXT NOT NULL DEFAULT '',
+    error         TEXT,
+    has_result    INTEGER NOT NULL DEFAULT 0,
+    created_at    REAL NOT NULL DEFAULT 0,
+    completed_at  REAL,
+    last_played_at REAL,
+    batch_id      TEXT NOT NULL DEFAULT '',
+    updated_at    REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_created ON tasks(created_at);
+CREATE INDEX IF NOT EXISTS idx_tasks_status_created ON tasks(status, created_at);
+CREATE INDEX IF NOT EXISTS idx_tasks_engine_created ON tasks(engine, created_at);
+CREATE INDEX IF NOT EXISTS idx_tasks_filename ON tasks(filename COLLATE NOCASE);
+
+CREATE TABLE IF NOT EXISTS results (
+    task_id     TEXT PRIMARY KEY REFERENCES tasks(id) ON DELETE CASCADE,
+    data        TEXT NOT NULL,
+    updated_at  REAL NOT NULL
+);
+
+-- 片段编辑日志：只追加，由后台压缩合并进 results 后删除
+CREATE TABLE IF NOT EXISTS result_edits (
+    seq            INTEGER PRIMARY KEY AUTOINCREMENT,
+    task_id        TEXT NOT NULL REFERENCES tasks(id) ON DELETE CASCADE,
+    segment_index  INTEGER NOT NULL,
+    text           TEXT NOT NULL,
+    created_at     REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_result_edits_task ON result_edits(task_id, seq);
+
+-- 批量导入：每个批次一行，所含任务由 tasks.batch_id 关联
+CREATE TABLE IF NOT EXISTS batches (
+    id          TEXT PRIMARY KEY,
+    source      TEXT NOT NULL DEFAULT '',
+    engine      TEXT NOT NULL DEFAULT '',
+    model       TEXT NOT NULL DEFAULT '',
+    language    TEXT NOT NULL DEFAULT '',
+    total       INTEGER NOT NULL DEFAULT 0,
+    created     INTEGER NOT NULL DEFAULT 0,
+    skipped     TEXT,
+    state       TEXT NOT NULL DEFAULT '',
+    created_at  REAL NOT NULL DEFAULT 0,
+    ingested_at REAL
+);
+
+CREATE TABLE IF NOT EXISTS store_meta (
+    key    TEXT PRIMARY KEY,
+    value  TEXT NOT NULL
+);
+"""
+
+# 各版本升级时 tasks 表新增的列：版本号 -> {列名: 类型}；
+# 打开数据库时按库中记录的版本依次执行之后各版本的升级
+_MIGRATIONS = {
+    2: {"last_played_at": "REAL"},
+    3: {"batch_id": "TEXT NOT NULL DEFAULT ''"},
+}
+
+# batch_id 列由升级补上，索引在升级之后创建
+_BATCH_INDEX = "CREATE INDEX IF NOT EXISTS idx_tasks_batch ON tasks(batch_id) WHERE batch_id != ''"
+
+# tasks 表中以 JSON 文本保存的字段
+_JSON_COLUMNS = ("media_info", "conversion")
+_COLUMNS = (
+    "id", "filename", "engine", "model", "language", "file_path", "media_file",
+    "wav_file", "content_hash", "file_size", "media_info", "conversion", "status",
+    "progress", "message", "error", "has_result", "created_at", "completed_at",
+    "last_played_at", "batch_id",
+)
+
+
+def _status_str(status) -> str:
+    if hasattr(status, "value"):
+        return str(status.value)
+    return str(status)
+
+
+def apply_segment_edits(result: Dict[str, Any], edits: Iterable[Tuple[int, str]]):
+    """将 [(片段序号, 新文本)] 应用到 result 并重建 full_text（越界序号忽略）"""
+    segments = result.get("segments", [])
+    for index, text in edits:
+        if 0 <= index < len(segments):
+            segments[index]["text"] = text
+    result["full_text"] = " ".join(s["text"] for s in segments)
+
+
+class TaskWrite:
+    """一个任务待写入数据库的合并变更，按 删除 / 元数据 / 删除结果 / 结果 / 合并编辑 / 追加编辑 的顺序执行"""
+    __slots__ = ("task_id", "task", "drop_result", "result", "compact", "edits", "delete")
+
+    def __init__(self, task_id: str):
+        self.task_id = task_id
+        self.task: Optional[Dict[str, Any]] = None
+        self.drop_result = False
+        self.result: Optional[Dict[str, Any]] = None
+        # 已包含全部编辑的完整结果，只覆盖已存在的结果
+        self.compact: Optional[Dict[str, Any]] = None
+        self.edits: List[Tuple[int, str]] = []
+        self.delete = False
+
+
+class TaskStore:
+    """SQLite 任务存储。
+
+    所有写操作都在事务中完成，进程崩溃不会留下写了一半的数据；
+    任务列表可按状态、引擎、创建时间走索引查询。
+    """
+
+    def __init__(self, db_path: str = TASK_DB_PATH):
+        self._db_path = db_path
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # 调用方需持有 self._lock
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self._db_path), exist_ok=True)
+            conn = sqlite3.connect(self._db_path, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            try:
+                self._migrate(conn)
+            except BaseException:
+                conn.close()
+                raise
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection):
+        """按库中记录的版本升级表结构；库的版本高于本程序支持的版本时拒绝打开"""
+        has_meta = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'store_meta'"
+        ).fetchone()
+        row = conn.execute(
+            "SELECT value FROM store_meta WHERE key = 'schema_version'"
+        ).fetchone() if has_meta else None
+        version = int(row[0]) if row else 0
+        if version > SCHEMA_VERSION:
+            raise RuntimeError(
+                f"任务数据库版本 {version} 高于当前程序支持的版本 {SCHEMA_VERSION}，请升级程序后再打开"
+            )
+
+        conn.executescript(_SCHEMA)
+        if version == SCHEMA_VERSION:
+            return
+        # 新建的库已由 _SCHEMA 建好全部列，只有旧库需要补列
+        columns = {r[1] for r in conn.execute("PRAGMA table_info(tasks)")}
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for target in range(version + 1, SCHEMA_VERSION + 1):
+                for col, decl in _MIGRATIONS.get(target, {}).items():
+                    if col not in columns:
+                        conn.execute(f"ALTER TABLE tasks ADD COLUMN {col} {decl}")
+                        columns.add(col)
+            conn.execute(_BATCH_INDEX)
+            conn.execute(
+                "INSERT INTO store_meta(key, value) VALUES ('schema_version', ?) "
+                "ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+                (str(SCHEMA_VERSION),),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if version:
+            print(f"[任务存储] 数据库已从版本 {version} 升级到 {SCHEMA_VERSION}")
+
+    def _transaction(self):
+        return _Transaction(self)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # ---- 行转换 ----
+
+    @staticmethod
+    def _to_row(task: Dict[str, Any]) -> Dict[str, Any]:
+        row = {}
+        for col in _COLUMNS:
+            value = task.get(col)
+            if col in _JSON_COLUMNS:
+                value = json.dumps(value, ensure_ascii=False) if value is not None else None
+            elif col == "status":
+                value = _status_str(value)
+            elif col == "has_result":
+                value = 1 if value else 0
+            elif value is None and col not in ("error", "completed_at", "last_played_at"):
+                value = "" if col not in ("file_size", "progress", "created_at") else 0
+            row[col] = value
+        return row
+
+    @staticmethod
+    def _from_row(row: sqlite3.Row) -> Dict[str, Any]:
+        task = dict(row)
+        for col in _JSON_COLUMNS:
+            if task.get(col):
+                try:
+                    task[col] = json.loads(task[col])
+                except ValueError:
+                    task[col] = None
+        task["has_result"] = bool(task.get("has_result"))
+        task.pop("updated_at", None)
+        return task
+
+    # ---- 写操作 ----
+
+    def _upsert_task(self, conn: sqlite3.Connection, task: Dict[str, Any], has_result: bool = False):
+        row = self._to_row(task)
+        if has_result:
+            row["has_result"] = 1
+        row["updated_at"] = time.time()
+        cols = ", ".join(row)
+        placeholders = ", ".join(f":{c}" for c in row)
+        updates = ", ".join(f"{c}=excluded.{c}" for c in row if c != "id")
+        conn.execute(
+            f"INSERT INTO tasks ({cols}) VALUES ({placeholders}) "
+            f"ON CONFLICT(id) DO UPDATE SET {updates}",
+            row,
+        )
+
+    @staticmethod
+    def _put_result(conn: sqlite3.Connection, task_id: str, result: Dict[str, Any]):
+        data = json.dumps(result, ensure_ascii=False, separators=(",", ":"))
+        conn.execute(
+            "INSERT INTO results(task_id, data, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(task_id) DO UPDATE SET data=excluded.data, updated_at=excluded.updated_at",
+            (task_id, data, time.time()),
+        )
+        conn.execute("DELETE FROM result_edits WHERE task_id = ?", (task_id,))
+
+    @staticmethod
+    def _drop_result(conn: sqlite3.Connection, task_id: str):
+        conn.execute("DELETE FROM results WHERE task_id = ?", (task_id,))
+        conn.execute("DELETE FROM result_edits WHERE task_id = ?", (task_id,))
+
+    @staticmethod
+    def _compact_result(conn: sqlite3.Connection, task_id: str, result: Dict[str, Any]):
+        # 只更新已存在的结果（结果已被删除时不写入），并删除已合并的编辑日志
+        data = json.dumps(result, ensure_ascii=False, separators=(",", ":"))
+        cur = conn.execute(
+            "UPDATE results SET data = ?, updated_at = ? WHERE task_id = ?",
+            (data, time.time(), task_id),
+        )
+        if cur.rowcount:
+            conn.execute("DELETE FROM result_edits WHERE task_id = ?", (task_id,))
+
+    @staticmethod
+    def _append_edits(conn: sqlite3.Connection, task_id: str, edits: List[Tuple[int, str]]):
+        now = time.time()
+        conn.executemany(
+            "INSERT INTO result_edits(task_id, segment_index, text, created_at) VALUES (?, ?, ?, ?)",
+            [(task_id, index, text, now) for index, text in edits],
+        )
+
+    @staticmethod
+    def _delete_task(conn: sqlite3.Connection, task_id: str):
+        conn.execute("DELETE FROM result_edits WHERE task_id = ?", (task_id,))
+        conn.execute("DELETE FROM results WHERE task_id = ?", (task_id,))
+        conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+
+    def save_task(self, task: Dict[str, Any], drop_result: bool = False):
+        """插入或更新任务元数据；drop_result=True 时在同一事务中删除旧结果"""
+        with self._transaction() as conn:
+            self._upsert_task(conn, task)
+            if drop_result:
+                self._drop_result(conn, task["id"])
+
+    def save_result(self, task: Dict[str, Any], result: Dict[str, Any]):
+        """在同一事务中保存转录结果与任务元数据（新结果取代旧的编辑日志）"""
+        with self._transaction() as conn:
+            self._upsert_task(conn, task, has_result=True)
+            self._put_result(conn, task["id"], result)
+
+    def delete_task(self, task_id: str):
+        with self._transaction() as conn:
+            self._delete_task(conn, task_id)
+
+    def write_batch(self, writes: List[TaskWrite]):
+        """在一个事务中执行多个任务的合并写入（见 app.task_writer）"""
+        with self._transaction() as conn:
+            for w in writes:
+                self._apply_write(conn, w)
+
+    def write_one(self, write: TaskWrite):
+        with self._transaction() as conn:
+            self._apply_write(conn, write)
+
+    def _apply_write(self, conn: sqlite3.Connection, w: TaskWrite):
+        if w.delete:
+            self._delete_task(conn, w.task_id)
+            return
+        if w.task is not None:
+            self._upsert_task(conn, w.task, has_result=w.result is not None)
+        if w.drop_result:
+            self._drop_result(conn, w.task_id)
+        if w.result is not None:
+            self._put_result(conn, w.task_id, w.result)
+        elif w.compact is not None:
+            self._compact_result(conn, w.task_id, w.compact)
+        if w.edits:
+            self._append_edits(conn, w.task_id, w.edits)
+
+    # ---- 读操作 ----
+
+    def load_tasks(self) -> List[Dict[str, Any]]:
+        """读取全部任务元数据（不含结果）"""
+        with self._lock:
+            rows = self._connect().execute("SELECT * FROM tasks").fetchall()
+        return [self._from_row(r) for r in rows]
+
+    def task_ids(self) -> set:
+        with self._lock:
+            rows = self._connect().execute("SELECT id FROM tasks").fetchall()
+        return {r[0] for r in rows}
+
+    def load_result(self, task_id: str) -> Optional[Tuple[Dict[str, Any], int, float]]:
+        """读取转录结果并重放尚未合并的编辑日志，返回 (result, 重放的日志条数, 结果写入时间)"""
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT data, updated_at FROM results WHERE task_id = ?", (task_id,)
+            ).fetchone()
+            edits = conn.execute(
+                "SELECT seq, segment_index, text FROM result_edits WHERE task_id = ? ORDER BY seq",
+                (task_id,),
+            ).fetchall() if row else []
+        if not row:
+            return None
+        result = json.loads(row[0])
+        if edits:
+            apply_segment_edits(result, [(e[1], e[2]) for e in edits])
+        return result, len(edits), row[1]
+
+    def query_ids(self, statuses: Optional[List[str]] = None, engines: Optional[List[str]] = None,
+                  since: Optional[float] = None, until: Optional[float] = None,
+                  prefix: str = "", after: Optional[Tuple[float, str]] = None,
+                  limit: int = 100) -> List[Tuple[str, float]]:
+        """按创建时间倒序分页查询任务，返回 [(task_id, created_at)]，最多 limit 条。
+
+        after 为上一页最后一条的 (created_at, id)，用作游标。
+        """
+        where, params = [], []
+        if statuses:
+            where.append(f"status IN ({', '.join('?' * len(statuses))})")
+            params.extend(statuses)
+        if engines:
+            where.append(f"engine IN ({', '.join('?' * len(engines))})")
+            params.extend(engines)
+        if since is not None:
+            where.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("created_at < ?")
+            params.append(until)
+        if prefix:
+            escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            where.append("filename LIKE ? ESCAPE '\\'")
+            params.append(escaped + "%")
+        if after is not None:
+            where.append("(created_at < ? OR (created_at = ? AND id < ?))")
+            params.extend([after[0], after[0], after[1]])
+
+        sql = "SELECT id, created_at FROM tasks"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._connect().execute(sql, params).fetchall()
+        return [(r[0], r[1]) for r in rows]
+
+    def save_batch(self, batch: Dict[str, Any]):
+        """插入或更新批次记录"""
+        row = {
+            "id": batch["id"],
+            "source": batch.get("source", ""),
+            "engine": batch.get("engine", ""),
+            "model": batch.get("model", ""),
+            "language": batch.get("language", ""),
+            "total": batch.get("total", 0),
+            "created": batch.get("created", 0),
+            "skipped": json.dumps(batch.get("skipped") or [], ensure_ascii=False),
+            "state": batch.get("state", ""),
+            "created_at": batch.get("created_at", 0),
+            "ingested_at": batch.get("ingested_at"),
+        }
+        cols = ", ".join(row)
+        placeholders = ", ".join(f":{c}" for c in row)
+        updates = ", ".join(f"{c}=excluded.{c}" for c in row if c != "id")
+        with self._transaction() as conn:
+            conn.execute(
+                f"INSERT INTO batches ({cols}) VALUES ({placeholders}) "
+                f"ON CONFLICT(id) DO UPDATE SET {updates}",
+                row,
+            )
+
+    def load_batches(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._connect().execute("SELECT * FROM batches").fetchall()
+        batches = []
+        for r in rows:
+            batch = dict(r)
+            try:
+                batch["skipped"] = json.loads(batch["skipped"]) if batch["skipped"] else []
+            except ValueError:
+                batch["skipped"] = []
+            batches.append(batch)
+        return batches
+
+    def delete_batch(self, batch_id: str):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM batches WHERE id = ?", (batch_id,))
+
+    def count_by_status(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT status, COUNT(*) FROM tasks GROUP BY status"
+            ).fetchall()
+        return {r[0]: r[1] for r in rows}
+
+    # ---- 旧版数据导入 ----
+
+    def import_legacy_dirs(self, history_dir: str, known_ids: Iterable[str]) -> int:
+        """导入旧版 history/{task_id}/meta.json + result.json 格式的任务（只导入库中没有的）"""
+        if not os.path.isdir(history_dir):
+            return 0
+        known = set(known_ids)
+        imported = 0
+        with os.scandir(history_dir) as it:
+            for de in it:
+                if not de.is_dir() or de.name in known:
+                    continue
+                meta_path = os.path.join(de.path, "meta.json")
+                if not os.path.isfile(meta_path):
+                    continue
+                try:
+                    self._import_legacy_dir(de.path, meta_path)
+                    imported += 1
+                except Exception as e:
+                    print(f"[任务存储] 跳过旧版任务 {de.name}: {e}")
+        return imported
+
+    def _import_legacy_dir(self, task_dir: str, meta_path: str):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+
+        media_file = meta.get("media_file", "")
+        if not (media_file and os.path.isfile(media_file)):
+            media_files = glob.glob(os.path.join(task_dir, "media.*"))
+            media_file = media_files[0] if media_files else ""
+        wav_file = os.path.join(task_dir, "audio.wav")
+
+        task = dict(meta)
+        task["file_path"] = media_file
+        task["media_file"] = media_file
+        task["wav_file"] = wav_file if os.path.isfile(wav_file) else ""
+        task.setdefault("status", "completed")
+        task.setdefault("filename", "unknown")
+
+        result = None
+        result_path = os.path.join(task_dir, "result.json")
+        if os.path.isfile(result_path):
+            with open(result_path, "r", encoding="utf-8") as f:
+                result = json.load(f)
+
+        if result is not None:
+            self.save_result(task, result)
+        else:
+            self.save_task(task)
+
+
+class _Transaction:
+    """持有存储锁并以 BEGIN IMMEDIATE / COMMIT 包裹一组写操作"""
+    def __init__(self, store: TaskStore):
+        self._store = store
+
+    def __enter__(self) -> sqlite3.Connection:
+        self._store._lock.acquire()
+        try:
+            conn = self._store._connect()
+            conn.execute("BEGIN IMMEDIATE")
+        except BaseException:
+            self._store._lock.release()
+            raise
+        self._conn = conn
+        return conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self._conn.execute("COMMIT")
+            else:
+                self._conn.execute("ROLLBACK")
+        finally:
+            self._store._lock.release()
+        return False
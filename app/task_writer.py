@@ -0,0 +1,171 @@
+"""任务持久化写入线程 - 合并同一任务的多次写入，在后台批量提交到 SQLite"""
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple
+
+from app.task_store import TaskStore, TaskWrite
+
+
+class TaskWriter:
+    """后台写入线程。
+
+    调用方在内存中修改任务后提交快照即返回，不等待磁盘；同一任务尚未写入的多次变更
+    合并为一次写入（元数据只保留最新快照），同一批的所有任务在一个事务中提交，
+    进程崩溃不会留下写了一半的数据。flush() 等待此前提交的变更全部写入，
+    close() 写完剩余变更后停止线程。
+    """
+
+    def __init__(self, store: TaskStore):
+        self._store = store
+        self._cond = threading.Condition()
+        self._pending: "OrderedDict[str, TaskWrite]" = OrderedDict()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        # 已从 _pending 取出、正在写入的任务 ID
+        self._writing: set = set()
+        # 已提交 / 已写入的变更序号，flush() 据此等待
+        self._submitted = 0
+        self._written = 0
+        self.batches = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    # ---- 提交变更 ----
+
+    def _entry(self, task_id: str) -> TaskWrite:
+        # 调用方需持有 self._cond
+        write = self._pending.get(task_id)
+        if write is None:
+            write = self._pending[task_id] = TaskWrite(task_id)
+        else:
+            self.coalesced += 1
+        return write
+
+    def _submitted_one(self):
+        # 调用方需持有 self._cond
+        self._submitted += 1
+        if self._closed:
+            # 关闭后（服务退出过程中）仍有写入时同步完成
+            self._write(self._take())
+            self._written = self._submitted
+            return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="task-writer", daemon=True)
+            self._thread.start()
+        self._cond.notify_all()
+
+    def save_task(self, task: Dict[str, Any], drop_result: bool = False):
+        """保存任务元数据快照；drop_result=True 时同时删除旧结果与编辑日志"""
+        with self._cond:
+            write = self._entry(task["id"])
+            write.task = task
+            if drop_result:
+                write.drop_result = True
+                write.result = write.compact = None
+                write.edits = []
+            self._submitted_one()
+
+    def save_result(self, task: Dict[str, Any], result: Dict[str, Any]):
+        """保存任务元数据与新的转录结果（取代旧结果及其编辑日志）"""
+        with self._cond:
+            write = self._entry(task["id"])
+            write.task = task
+            write.result = result
+            write.compact = None
+            write.edits = []
+            self._submitted_one()
+
+    def append_edits(self, task_id: str, edits: List[Tuple[int, str]]):
+        with self._cond:
+            self._entry(task_id).edits.extend(edits)
+            self._submitted_one()
+
+    def compact(self, task_id: str, result: Dict[str, Any]):
+        """用已包含此前全部编辑的结果覆盖保存的结果，并清空编辑日志"""
+        with self._cond:
+            write = self._entry(task_id)
+            if write.result is not None:
+                write.result = result
+            else:
+                write.compact = result
+            write.edits = []
+            self._submitted_one()
+
+    def delete(self, task_id: str):
+        with self._cond:
+            self._pending.pop(task_id, None)
+            self._entry(task_id).delete = True
+            self._submitted_one()
+
+    # ---- 写入 ----
+
+    def _take(self) -> List[TaskWrite]:
+        # 调用方需持有 self._cond
+        batch = list(self._pending.values())
+        self._pending.clear()
+        return batch
+
+    def _write(self, batch: List[TaskWrite]):
+        if not batch:
+            return
+        self.batches += 1
+        try:
+            self._store.write_batch(batch)
+            return
+        except Exception as e:
+            print(f"[任务存储] 批量写入失败，逐个重试: {e}")
+        for write in batch:
+            try:
+                self._store.write_one(write)
+            except Exception as e:
+                self.errors += 1
+                print(f"[任务存储] 写入任务 {write.task_id} 失败: {e}")
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                batch = self._take()
+                upto = self._submitted
+                self._writing = {w.task_id for w in batch}
+            self._write(batch)
+            with self._cond:
+                self._writing = set()
+                self._written = max(self._written, upto)
+                self._cond.notify_all()
+
+    def dirty_ids(self) -> set:
+        """尚未写入数据库（等待写入或正在写入）的任务 ID，数据库中这些任务的行可能已过时"""
+        with self._cond:
+            return set(self._pending) | self._writing
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待此前提交的变更全部写入，超时返回 False"""
+        with self._cond:
+            target = self._submitted
+            return self._cond.wait_for(lambda: self._written >= target, timeout)
+
+    def close(self):
+        """写完剩余变更并停止写入线程"""
+        with self._cond:
+            self._closed = True
+            thread = self._thread
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join()
+        with self._cond:
+            # 线程从未启动或已退出后提交的变更
+            self._write(self._take())
+            self._written = self._submitted
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "batches": self.batches,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+            }
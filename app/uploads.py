@@ -0,0 +1,202 @@
+"""流式上传 - 边接收边解析 multipart/form-data 请求体，文件内容直接写入上传目录"""
+import os
+import hashlib
+from typing import Dict, List, Optional
+
+try:
+    from python_multipart.exceptions import FormParserError
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.exceptions import FormParserError
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from app.config import UPLOAD_DIR, SUPPORTED_FORMATS, MAX_FILE_SIZE_MB
+
+# 普通表单字段（engine / model / language 等）的长度上限
+_MAX_FIELD_BYTES = 64 * 1024
+
+
+class UploadError(Exception):
+    """上传请求无效（格式不支持、文件过大、请求体格式错误等），消息可直接返回给客户端"""
+
+
+class UploadedFile:
+    """已写入上传目录的一个文件"""
+    __slots__ = ("field", "filename", "path", "size", "content_hash")
+
+    def __init__(self, field: str, filename: str, path: str, size: int, content_hash: str):
+        self.field = field
+        self.filename = filename
+        self.path = path
+        self.size = size
+        self.content_hash = content_hash
+
+
+class _Part:
+    """正在接收的一个表单部分"""
+
+    def __init__(self, name: str, filename: Optional[str]):
+        self.name = name
+        self.filename = filename
+        self.data = bytearray()
+        self.path = ""
+        self.file = None
+        self.hasher = None
+        self.size = 0
+        # 跳过的文件（非严格模式下格式不支持或超出大小限制）：后续数据直接丢弃
+        self.skip_reason = ""
+
+
+class MultipartUpload:
+    """multipart/form-data 的增量解析器。
+
+    请求体分块交给 write()，文件部分在到达时直接写入 UPLOAD_DIR 并计算 SHA-256，
+    不经过临时的缓冲文件；单个文件超过 MAX_FILE_SIZE_MB 时立即停止写入。
+    strict=True（单文件上传）时不支持的格式或超限直接报错，整个请求作废；
+    否则（批量上传）跳过该文件并记录原因，继续接收其余文件。
+    write() 会写磁盘，应在线程池中调用；出错或请求中断时调用 discard() 删除已写入的文件。
+    """
+
+    def __init__(self, content_type: str, strict: bool = True, max_files: int = 0):
+        kind, options = parse_options_header(content_type)
+        boundary = options.get(b"boundary")
+        if kind != b"multipart/form-data" or not boundary:
+            raise UploadError("请求必须是 multipart/form-data 格式")
+        self._strict = strict
+        self._max_files = max_files
+        self._max_bytes = MAX_FILE_SIZE_MB * 1024 * 1024
+        self._part: Optional[_Part] = None
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+        self._file_count = 0
+        self.fields: Dict[str, str] = {}
+        self.files: List[UploadedFile] = []
+        # 跳过的文件：[{"file": 文件名, "reason": 原因}]
+        self.skipped: List[Dict[str, str]] = []
+        self._parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    # ---- 接收 ----
+
+    def write(self, data: bytes):
+        try:
+            self._parser.write(data)
+        except FormParserError as e:
+            raise UploadError(f"请求体格式错误: {e}")
+
+    def finish(self):
+        try:
+            self._parser.finalize()
+        except FormParserError as e:
+            raise UploadError(f"请求体格式错误: {e}")
+        if self._part is not None:
+            raise UploadError("请求体不完整")
+
+    def discard(self):
+        """删除已写入的全部文件（包括写了一半的文件）"""
+        part = self._part
+        if part is not None and part.file is not None:
+            part.file.close()
+            _remove(part.path)
+        for f in self.files:
+            _remove(f.path)
+        self.files = []
+
+    # ---- 解析回调 ----
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[bytes(self._header_field).lower()] = bytes(self._header_value)
+        self._header_field.clear()
+        self._header_value.clear()
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        filename = options.get(b"filename")
+        part = _Part(name, filename.decode("utf-8", "replace") if filename is not None else None)
+        self._part = part
+        if part.filename is None:
+            return
+
+        self._file_count += 1
+        if self._max_files and self._file_count > self._max_files:
+            raise UploadError(f"文件数超过单批上限 {self._max_files}")
+        if not part.filename:
+            self._reject(part, "未选择文件")
+            return
+        ext = os.path.splitext(part.filename)[1].lower()
+        if ext not in SUPPORTED_FORMATS:
+            if self._strict:
+                raise UploadError(
+                    f"不支持的文件格式: {ext}。支持: {', '.join(sorted(SUPPORTED_FORMATS))}"
+                )
+            self._reject(part, f"不支持的文件格式: {ext or '无扩展名'}")
+            return
+        part.path = os.path.join(UPLOAD_DIR, f"{os.urandom(8).hex()}{ext}")
+        part.file = open(part.path, "wb")
+        part.hasher = hashlib.sha256()
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        part = self._part
+        if part is None or part.skip_reason:
+            return
+        chunk = data[start:end]
+        if part.filename is None:
+            if len(part.data) + len(chunk) > _MAX_FIELD_BYTES:
+                raise UploadError(f"表单字段 {part.name} 过长")
+            part.data += chunk
+            return
+        part.size += len(chunk)
+        if part.size > self._max_bytes:
+            part.file.close()
+            _remove(part.path)
+            part.file = None
+            reason = f"文件大小超过限制 {MAX_FILE_SIZE_MB}MB"
+            if self._strict:
+                raise UploadError(f"{reason}（已读取 {part.size / (1024 * 1024):.1f}MB）")
+            self._reject(part, reason)
+            return
+        part.hasher.update(chunk)
+        part.file.write(chunk)
+
+    def _on_part_end(self):
+        part, self._part = self._part, None
+        if part is None or part.skip_reason:
+            return
+        if part.filename is None:
+            self.fields[part.name] = part.data.decode("utf-8", "replace")
+            return
+        part.file.close()
+        self.files.append(UploadedFile(
+            part.name, part.filename, part.path, part.size, part.hasher.hexdigest(),
+        ))
+
+    def _reject(self, part: _Part, reason: str):
+        if self._strict:
+            raise UploadError(reason)
+        part.skip_reason = reason
+        self.skipped.append({"file": part.filename, "reason": reason})
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
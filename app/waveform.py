@@ -0,0 +1,153 @@
+"""波形峰值 - 由 16kHz WAV 预先计算多级 (min, max) 峰值金字塔，供前端绘制任意缩放级别与时间窗口的波形"""
+import os
+import sys
+import uuid
+import wave
+import struct
+from array import array
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.config import WAVEFORM_BASE_SAMPLES, WAVEFORM_LEVEL_FACTOR, WAVEFORM_LEVELS
+from app.audio_utils import wav_pcm_layout
+
+# 峰值文件（任务目录下的 peaks.bin）格式，全部小端：
+#   文件头  "PEAK" | 版本 u16 | 级别数 u16 | 采样率 u32 | 采样帧数 u64
+#   级别表  每级一项：每桶采样数 u32 | 桶数 u32
+#   数据    按级别依次存放，每桶 (min, max) 两个 int16
+_MAGIC = b"PEAK"
+_VERSION = 1
+_HEADER = struct.Struct("<4sHHIQ")
+_LEVEL = struct.Struct("<II")
+PEAKS_FILENAME = "peaks.bin"
+
+# 第 0 级按块计算时每块的桶数（256 采样/桶时约 65 秒音频）
+_BLOCK_BUCKETS = 4096
+
+
+class PeakLevel:
+    """峰值文件中的一个级别"""
+    __slots__ = ("index", "samples_per_bucket", "buckets", "offset")
+
+    def __init__(self, index: int, samples_per_bucket: int, buckets: int, offset: int):
+        self.index = index
+        self.samples_per_bucket = samples_per_bucket
+        self.buckets = buckets
+        # 该级别数据在文件中的字节偏移
+        self.offset = offset
+
+    def to_dict(self, sample_rate: int) -> Dict[str, Any]:
+        return {
+            "level": self.index,
+            "samples_per_bucket": self.samples_per_bucket,
+            "seconds_per_bucket": self.samples_per_bucket / sample_rate,
+            "buckets": self.buckets,
+        }
+
+
+def peaks_path(wav_path: str) -> str:
+    return os.path.join(os.path.dirname(wav_path), PEAKS_FILENAME)
+
+
+def compute_peaks(wav_path: str, output_path: Optional[str] = None) -> str:
+    """计算 WAV 的峰值金字塔并写入峰值文件，返回文件路径。
+
+    PCM 以内存映射方式按块读取，第 0 级每块用 reduceat 向量化求桶内最小/最大值，
+    更粗的级别由上一级每 WAVEFORM_LEVEL_FACTOR 个桶合并得到，不再读取 PCM。
+    多声道时取第一个声道。
+    """
+    import numpy as np
+
+    output_path = output_path or peaks_path(wav_path)
+    offset, n_frames, rate = wav_pcm_layout(wav_path)
+    channels = _wav_channels(wav_path)
+    base = WAVEFORM_BASE_SAMPLES
+
+    n_buckets = -(-n_frames // base)
+    mins = np.empty(n_buckets, dtype="<i2")
+    maxs = np.empty(n_buckets, dtype="<i2")
+    if n_frames:
+        pcm = np.memmap(wav_path, dtype="<i2", mode="r", offset=offset,
+                        shape=(n_frames, channels))[:, 0]
+        block = base * _BLOCK_BUCKETS
+        for start in range(0, n_frames, block):
+            x = np.asarray(pcm[start:start + block])
+            starts = np.arange(0, len(x), base)
+            i = start // base
+            mins[i:i + len(starts)] = np.minimum.reduceat(x, starts)
+            maxs[i:i + len(starts)] = np.maximum.reduceat(x, starts)
+        del pcm
+
+    levels = [(base, mins, maxs)]
+    for _ in range(1, WAVEFORM_LEVELS):
+        prev_spb, prev_min, prev_max = levels[-1]
+        if len(prev_min) <= 1:
+            break
+        starts = np.arange(0, len(prev_min), WAVEFORM_LEVEL_FACTOR)
+        levels.append((
+            prev_spb * WAVEFORM_LEVEL_FACTOR,
+            np.minimum.reduceat(prev_min, starts),
+            np.maximum.reduceat(prev_max, starts),
+        ))
+
+    tmp_path = f"{output_path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, len(levels), rate, n_frames))
+            for spb, level_min, _ in levels:
+                f.write(_LEVEL.pack(spb, len(level_min)))
+            for _, level_min, level_max in levels:
+                f.write(np.column_stack((level_min, level_max)).astype("<i2").tobytes())
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return output_path
+
+
+def _wav_channels(wav_path: str) -> int:
+    with wave.open(wav_path, "rb") as w:
+        return w.getnchannels()
+
+
+def read_header(path: str) -> Tuple[int, int, List[PeakLevel]]:
+    """读取峰值文件头，返回 (采样率, 采样帧数, 各级别)"""
+    with open(path, "rb") as f:
+        magic, version, n_levels, rate, n_frames = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"不支持的峰值文件: {path}")
+        table = f.read(_LEVEL.size * n_levels)
+    offset = _HEADER.size + _LEVEL.size * n_levels
+    levels = []
+    for i in range(n_levels):
+        spb, buckets = _LEVEL.unpack_from(table, i * _LEVEL.size)
+        levels.append(PeakLevel(i, spb, buckets, offset))
+        offset += buckets * 4
+    return rate, n_frames, levels
+
+
+def read_window(path: str, level: PeakLevel, first: int, count: int) -> bytes:
+    """读取某级别从第 first 个桶开始的 count 个桶，返回交错的 (min, max) int16 小端数据"""
+    first = max(0, min(first, level.buckets))
+    count = max(0, min(count, level.buckets - first))
+    with open(path, "rb") as f:
+        f.seek(level.offset + first * 4)
+        return f.read(count * 4)
+
+
+def decode_window(data: bytes) -> List[int]:
+    """read_window 返回的数据转为 [min, max, min, max, ...] 整数列表"""
+    values = array("h", data)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values.tolist()
+
+
+def pick_level(levels: List[PeakLevel], rate: int, seconds: float, width: int) -> PeakLevel:
+    """时间窗口内桶数不少于 width 的最粗级别（都不够时取最细级别）"""
+    for level in reversed(levels):
+        if seconds * rate / level.samples_per_bucket >= width:
+            return level
+    return levels[0]
@@ -24,4 +24,7 @@ def main():
     uvicorn.run("app.main:app", host=HOST, port=PORT, reload=not frozen)
 
 if __name__ == "__main__":
+    # 长音频模式使用多进程，打包环境下子进程需要经过 freeze_support
+    import multiprocessing
+    multiprocessing.freeze_support()
     main()
@@ -7,14 +7,22 @@
     // ---- State ----
     const state = {
         engines: [],
-        selectedFile: null,
+        selectedFiles: [],
         currentTaskId: null,
         tasks: [],
+        nextCursor: null,
         pollingTimers: {},
+        trackedTasks: new Set(),
+        refreshingTasks: new Set(),
+        eventSource: null,
+        eventsFailed: false,
         audio: null,
         isPlaying: false,
         activeSegmentIndex: -1,
         editingSegmentIndex: -1,
+        // 尚未提交的片段编辑：taskId -> Map(片段序号 -> 文本)，短时间内的编辑合并为一次批量请求
+        pendingEdits: new Map(),
+        editFlushTimer: null,
         _rafId: null,
     };
 
@@ -49,6 +57,7 @@
         waveformBar: $('#waveformBar'),
         waveformProgress: $('#waveformProgress'),
         waveformCursor: $('#waveformCursor'),
+        waveformCanvas: $('#waveformCanvas'),
         playerFilename: $('#playerFilename'),
         playerEngine: $('#playerEngine'),
         exportBtn: $('#exportBtn'),
@@ -161,15 +170,22 @@
     }
 
     // ---- History ----
-    async function loadHistory() {
+    async function loadHistory(cursor = null) {
         try {
-            const data = await api('/api/tasks');
+            const params = new URLSearchParams({ limit: '100' });
+            if (cursor) params.set('cursor', cursor);
+            const data = await api(`/api/tasks?${params}`);
             const tasks = data.tasks || [];
+            state.nextCursor = data.next_cursor || null;
             for (const task of tasks) {
                 const idx = state.tasks.findIndex(t => t.id === task.id);
                 if (idx < 0) {
                     state.tasks.push(task);
                 }
+                // 排队中或处理中的任务（含服务重启后重新排队的）继续跟踪进度
+                if (task.status === 'pending' || task.status === 'processing') {
+                    trackTask(task.id);
+                }
             }
             renderTaskList();
         } catch (e) {
@@ -193,36 +209,43 @@
         dom.uploadZone.addEventListener('drop', (e) => {
             e.preventDefault();
             dom.uploadZone.classList.remove('dragover');
-            if (e.dataTransfer.files.length) selectFile(e.dataTransfer.files[0]);
+            if (e.dataTransfer.files.length) selectFiles(e.dataTransfer.files);
         });
 
         dom.fileInput.addEventListener('change', () => {
-            if (dom.fileInput.files.length) selectFile(dom.fileInput.files[0]);
+            if (dom.fileInput.files.length) selectFiles(dom.fileInput.files);
         });
 
         dom.removeFile.addEventListener('click', () => {
-            state.selectedFile = null;
-            dom.selectedFile.style.display = 'none';
-            dom.uploadZone.style.display = '';
-            dom.fileInput.value = '';
+            resetUpload();
             updateStartBtn();
         });
 
         dom.startBtn.addEventListener('click', startTranscription);
     }
 
-    function selectFile(file) {
-        state.selectedFile = file;
-        dom.fileName.textContent = file.name;
-        dom.fileSize.textContent = formatFileSize(file.size);
+    function selectFiles(files) {
+        state.selectedFiles = Array.from(files);
+        const totalSize = state.selectedFiles.reduce((sum, f) => sum + f.size, 0);
+        dom.fileName.textContent = state.selectedFiles.length === 1
+            ? state.selectedFiles[0].name
+            : `${state.selectedFiles.length} 个文件`;
+        dom.fileSize.textContent = formatFileSize(totalSize);
         dom.selectedFile.style.display = 'flex';
         dom.uploadZone.style.display = 'none';
         updateStartBtn();
     }
 
+    function resetUpload() {
+        state.selectedFiles = [];
+        dom.selectedFile.style.display = 'none';
+        dom.uploadZone.style.display = '';
+        dom.fileInput.value = '';
+    }
+
     function updateStartBtn() {
         const engine = state.engines.find(e => e.name === dom.engineSelect.value);
-        dom.startBtn.disabled = !state.selectedFile || !engine || !engine.available;
+        dom.startBtn.disabled = !state.selectedFiles.length || !engine || !engine.available;
     }
 
     function formatFileSize(bytes) {
@@ -233,10 +256,13 @@
 
     // ---- Transcription ----
     async function startTranscription() {
-        if (!state.selectedFile) return;
+        if (!state.selectedFiles.length) return;
 
+        const isBatch = state.selectedFiles.length > 1;
         const formData = new FormData();
-        formData.append('file', state.selectedFile);
+        for (const file of state.selectedFiles) {
+            formData.append(isBatch ? 'files' : 'file', file);
+        }
         formData.append('engine', dom.engineSelect.value);
         formData.append('model', dom.modelSelect.value);
         formData.append('language', dom.languageSelect.value);
@@ -245,19 +271,21 @@
         dom.startBtn.innerHTML = '<span class="spinner" style="width:16px;height:16px;border-width:2px;margin:0;"></span> 上传中...';
 
         try {
-            const data = await api('/api/upload', {
+            const data = await api(isBatch ? '/api/batch' : '/api/upload', {
                 method: 'POST',
                 body: formData,
             });
 
-            showToast('文件已上传，开始转录', 'success');
-            startPolling(data.task_id);
-
-            // Reset upload
-            state.selectedFile = null;
-            dom.selectedFile.style.display = 'none';
-            dom.uploadZone.style.display = '';
-            dom.fileInput.value = '';
+            if (isBatch) {
+                const skipped = data.batch.files.skipped;
+                showToast(`已上传 ${state.selectedFiles.length - skipped} 个文件，开始批量转录`
+                    + (skipped ? `（跳过 ${skipped} 个）` : ''), 'success');
+                trackBatch(data.batch_id);
+            } else {
+                showToast('文件已上传，开始转录', 'success');
+                trackTask(data.task_id);
+            }
+            resetUpload();
         } catch (e) {
             showToast('上传失败: ' + e.message, 'error');
         } finally {
@@ -271,25 +299,223 @@
         }
     }
 
-    // ---- Polling ----
+    // ---- Batch ----
+    // 批次中的任务在后台逐个创建：轮询批次详情，把新出现的任务加入列表（进度由事件推送更新），
+    // 不逐个跟踪结果，批次全部结束时提示一次
+    function trackBatch(batchId) {
+        const poll = async () => {
+            let batch;
+            try {
+                batch = (await api(`/api/batch/${batchId}`)).batch;
+            } catch (e) {
+                console.error('Batch poll error:', e);
+                setTimeout(poll, 5000);
+                return;
+            }
+            for (const t of batch.task_list || []) {
+                const task = state.tasks.find(x => x.id === t.id);
+                if (!task) {
+                    updateTaskList({ ...t, engine: batch.engine, model: batch.model, language: batch.language });
+                } else if (!state.eventSource) {
+                    Object.assign(task, { status: t.status, progress: t.progress, error: t.error });
+                    renderTaskList();
+                }
+            }
+            if (batch.status === 'completed') {
+                const { completed, failed } = batch.tasks;
+                const skipped = batch.files.skipped;
+                showToast(`批量转录完成：成功 ${completed} 个` + (failed ? `，失败 ${failed} 个` : '')
+                    + (skipped ? `，跳过 ${skipped} 个` : ''), failed ? 'error' : 'success');
+                return;
+            }
+            setTimeout(poll, batch.status === 'ingesting' ? 1000 : 3000);
+        };
+        poll();
+    }
+
+    // ---- Progress ----
+    // 通过 /api/events (SSE) 接收进度推送；浏览器不支持或连接被关闭时退回轮询
+    function trackTask(taskId) {
+        state.trackedTasks.add(taskId);
+        if (!connectEvents()) {
+            startPolling(taskId);
+            return;
+        }
+        refreshTask(taskId);
+    }
+
+    function connectEvents() {
+        if (state.eventSource) return true;
+        if (!window.EventSource || state.eventsFailed) return false;
+
+        const es = new EventSource('/api/events');
+        state.eventSource = es;
+
+        es.addEventListener('snapshot', (e) => {
+            const data = JSON.parse(e.data);
+            const active = new Set();
+            for (const delta of data.tasks || []) {
+                active.add(delta.id);
+                applyTaskDelta(delta);
+            }
+            // 连接断开期间已结束的任务，补拉一次最终状态
+            for (const taskId of state.trackedTasks) {
+                if (!active.has(taskId)) refreshTask(taskId);
+            }
+        });
+        es.addEventListener('progress', (e) => applyTaskDelta(JSON.parse(e.data)));
+        es.addEventListener('queue', (e) => {
+            const positions = JSON.parse(e.data).positions || {};
+            for (const task of state.tasks) {
+                if (task.status === 'pending') task.queue_position = positions[task.id] || null;
+            }
+            renderTaskList();
+        });
+        es.addEventListener('segments', (e) => appendPartialSegments(JSON.parse(e.data)));
+        es.addEventListener('completed', (e) => finishTask(JSON.parse(e.data)));
+        es.addEventListener('failed', (e) => finishTask(JSON.parse(e.data)));
+        es.addEventListener('deleted', (e) => {
+            const taskId = JSON.parse(e.data).id;
+            state.trackedTasks.delete(taskId);
+            if (state.tasks.some(t => t.id === taskId)) {
+                state.tasks = state.tasks.filter(t => t.id !== taskId);
+                renderTaskList();
+            }
+        });
+        es.onerror = () => {
+            // 浏览器会自动重连；连接被彻底关闭（如服务端不支持）时退回轮询
+            if (es.readyState === EventSource.CLOSED) {
+                state.eventSource = null;
+                state.eventsFailed = true;
+                for (const taskId of state.trackedTasks) startPolling(taskId);
+            }
+        };
+        return true;
+    }
+
+    function applyTaskDelta(delta) {
+        const task = state.tasks.find(t => t.id === delta.id);
+        if (!task) {
+            if (state.trackedTasks.has(delta.id)) refreshTask(delta.id);
+            return;
+        }
+        Object.assign(task, delta);
+        if (task.status !== 'pending') task.queue_position = null;
+        renderTaskList();
+    }
+
+    // 转录中已输出的片段（最终结果到达后被替换）
+    function appendPartialSegments(event) {
+        const task = state.tasks.find(t => t.id === event.id);
+        if (!task) return;
+        const partial = task.partial_segments || [];
+        if (event.offset > partial.length) return;  // 断线期间缺失的部分在打开任务时重新拉取
+        task.partial_segments = partial.slice(0, event.offset).concat(event.segments);
+        task.processed_seconds = event.processed_seconds;
+        if (state.currentTaskId === task.id && task.status !== 'completed') {
+            showPartialResult(task);
+        }
+    }
+
+    async function loadPartialSegments(task) {
+        const segments = [];
+        let start = 0;
+        while (true) {
+            const data = await api(`/api/task/${task.id}/segments?start=${start}`);
+            if (!data.partial) return null;  // 已有最终结果
+            segments.push(...data.segments);
+            if (data.end >= data.total || data.segments.length === 0) break;
+            start = data.end;
+        }
+        task.partial_segments = segments;
+        return segments;
+    }
+
+    function showPartialResult(task) {
+        const isNewView = state.currentTaskId !== task.id || dom.resultView.style.display === 'none';
+        state.currentTaskId = task.id;
+        dom.welcomeScreen.style.display = 'none';
+        dom.resultView.style.display = 'flex';
+        dom.playerFilename.textContent = task.filename;
+        dom.playerEngine.textContent = task.engine + ' / ' + task.model;
+        if (isNewView) {
+            dom.audioElement.src = `/api/audio/${task.id}`;
+            dom.audioElement.load();
+            renderTaskList();
+        }
+        dom.detectedLang.textContent = '';
+
+        const segments = task.partial_segments || [];
+        if (segments.length === 0) {
+            dom.segmentsList.innerHTML = '<div class="empty-state"><div class="spinner" style="margin:0 auto 12px"></div>正在转录...</div>';
+            dom.segmentCount.textContent = '';
+            return;
+        }
+        renderSegments(segments);
+        // 部分结果不可编辑
+        dom.segmentsList.querySelectorAll('.segment-actions').forEach(el => el.remove());
+        const processed = task.processed_seconds ? ` · 已处理 ${formatTime(task.processed_seconds)}` : '';
+        dom.segmentCount.textContent = `转录中 · ${segments.length} 个片段${processed}`;
+    }
+
+    function finishTask(event) {
+        const task = state.tasks.find(t => t.id === event.id);
+        if (!state.trackedTasks.has(event.id)) {
+            // 其他页面发起的任务：只更新列表状态，不保留结果
+            if (task) {
+                const { result, ...rest } = event;
+                Object.assign(task, rest, { has_result: !!result, queue_position: null });
+                renderTaskList();
+            }
+            return;
+        }
+        if (!task) {
+            refreshTask(event.id);
+            return;
+        }
+        Object.assign(task, event, { has_result: !!event.result, queue_position: null });
+        handleTaskState(task);
+    }
+
+    // 拉取一次任务完整状态（新建任务加入列表、断线后补齐结果时使用）
+    async function refreshTask(taskId) {
+        if (state.refreshingTasks.has(taskId)) return;
+        state.refreshingTasks.add(taskId);
+        try {
+            const data = await api(`/api/task/${taskId}`);
+            handleTaskState(data.task);
+        } catch (e) {
+            console.error('Refresh task error:', e);
+        } finally {
+            state.refreshingTasks.delete(taskId);
+        }
+    }
+
+    // 更新任务列表；已跟踪的任务结束时提示并展示结果，返回任务是否已结束
+    function handleTaskState(task) {
+        updateTaskList(task);
+        if (task.status !== 'completed' && task.status !== 'failed') return false;
+        if (state.trackedTasks.has(task.id)) {
+            state.trackedTasks.delete(task.id);
+            if (task.status === 'completed') {
+                showToast(`"${task.filename}" 转录完成`, 'success');
+                showResult(task);
+            } else {
+                showToast(`转录失败: ${task.error}`, 'error');
+            }
+        }
+        return true;
+    }
+
     function startPolling(taskId) {
         if (state.pollingTimers[taskId]) return;
 
         const poll = async () => {
             try {
                 const data = await api(`/api/task/${taskId}`);
-                const task = data.task;
-                updateTaskList(task);
-
-                if (task.status === 'completed') {
-                    clearInterval(state.pollingTimers[taskId]);
-                    delete state.pollingTimers[taskId];
-                    showToast(`"${task.filename}" 转录完成`, 'success');
-                    showResult(task);
-                } else if (task.status === 'failed') {
+                if (handleTaskState(data.task)) {
                     clearInterval(state.pollingTimers[taskId]);
                     delete state.pollingTimers[taskId];
-                    showToast(`转录失败: ${task.error}`, 'error');
                 }
             } catch (e) {
                 console.error('Polling error:', e);
@@ -325,13 +551,16 @@
 
         dom.taskList.innerHTML = state.tasks.map(task => {
             const timeStr = task.created_at ? formatDate(task.created_at) : '';
+            const statusLabel = (task.status === 'pending' && task.queue_position)
+                ? `排队第 ${task.queue_position} 位`
+                : (statusLabels[task.status] || task.status);
             return `
             <div class="task-item ${task.id === state.currentTaskId ? 'active' : ''}"
                  data-task-id="${task.id}">
                 <div class="task-item-header">
                     <span class="task-item-name" title="${task.filename}">${task.filename}</span>
                     <div class="task-item-right">
-                        <span class="task-item-status ${task.status}">${statusLabels[task.status] || task.status}</span>
+                        <span class="task-item-status ${task.status}">${statusLabel}</span>
                         ${(task.status === 'completed' || task.status === 'failed') ? `
                         <button class="task-retranscribe-btn" data-task-id="${task.id}" title="重新转录">
                             <svg width="12" height="12" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2">
@@ -353,7 +582,15 @@
                 ` : ''}
                 <div class="task-item-meta">${task.engine || ''} ${task.model ? '/ ' + task.model : ''}${timeStr ? ' · ' + timeStr : ''}</div>
             </div>`;
-        }).join('');
+        }).join('') + (state.nextCursor ? '<button class="task-load-more">加载更多</button>' : '');
+
+        const loadMoreBtn = dom.taskList.querySelector('.task-load-more');
+        if (loadMoreBtn) {
+            loadMoreBtn.addEventListener('click', () => {
+                loadMoreBtn.disabled = true;
+                loadHistory(state.nextCursor);
+            });
+        }
 
         // Click task to view
         dom.taskList.querySelectorAll('.task-item').forEach(el => {
@@ -368,6 +605,14 @@
                     } catch (err) {
                         showToast('加载任务失败: ' + err.message, 'error');
                     }
+                } else if (task && task.status === 'processing') {
+                    // 转录中的任务：显示已输出的部分片段
+                    try {
+                        if (await loadPartialSegments(task) === null) return;
+                    } catch (err) {
+                        task.partial_segments = [];
+                    }
+                    showPartialResult(task);
                 }
             });
         });
@@ -444,6 +689,7 @@
         // Setup audio
         dom.audioElement.src = `/api/audio/${task.id}`;
         dom.audioElement.load();
+        loadWaveform(task.id);
 
         const result = task.result;
         if (!result) {
@@ -656,20 +902,56 @@
         });
     }
 
-    async function saveEditSegment(index, text) {
-        const formData = new FormData();
-        formData.append('segment_index', index);
-        formData.append('text', text);
+    function queueSegmentEdit(taskId, index, text) {
+        if (!state.pendingEdits.has(taskId)) state.pendingEdits.set(taskId, new Map());
+        state.pendingEdits.get(taskId).set(index, text);
+        clearTimeout(state.editFlushTimer);
+        state.editFlushTimer = setTimeout(flushSegmentEdits, 800);
+    }
 
-        try {
-            await api(`/api/result/${state.currentTaskId}/edit`, {
-                method: 'POST',
-                body: formData,
+    function takePendingEdits() {
+        const batches = [];
+        state.pendingEdits.forEach((edits, taskId) => {
+            batches.push({
+                taskId,
+                edits: [...edits].map(([index, text]) => ({ index, text })),
             });
-            showToast('已保存修改', 'success');
-        } catch (e) {
-            showToast('保存失败: ' + e.message, 'error');
+        });
+        state.pendingEdits.clear();
+        clearTimeout(state.editFlushTimer);
+        state.editFlushTimer = null;
+        return batches;
+    }
+
+    async function flushSegmentEdits() {
+        for (const { taskId, edits } of takePendingEdits()) {
+            try {
+                await api(`/api/result/${taskId}/edits`, {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ edits }),
+                });
+                showToast(edits.length > 1 ? `已保存 ${edits.length} 处修改` : '已保存修改', 'success');
+            } catch (e) {
+                showToast('保存失败: ' + e.message, 'error');
+            }
         }
+    }
+
+    // 页面关闭前提交未发送的编辑
+    window.addEventListener('pagehide', () => {
+        for (const { taskId, edits } of takePendingEdits()) {
+            const body = new Blob([JSON.stringify({ edits })], { type: 'application/json' });
+            navigator.sendBeacon(`/api/result/${taskId}/edits`, body);
+        }
+    });
+
+    function saveEditSegment(index, text) {
+        const task = state.tasks.find(t => t.id === state.currentTaskId);
+        if (task && task.result && task.result.segments[index]) {
+            task.result.segments[index].text = text;
+        }
+        queueSegmentEdit(state.currentTaskId, index, text);
 
         state.editingSegmentIndex = -1;
         const textEl = dom.segmentsList.querySelector(`.segment-text[data-index="${index}"]`);
@@ -821,8 +1103,8 @@
             dom.segmentCount.textContent = '';
             dom.detectedLang.textContent = '';
 
-            // Start polling for the retranscription
-            startPolling(state.currentTaskId);
+            // Track progress of the retranscription
+            trackTask(state.currentTaskId);
         } catch (e) {
             showToast('重新转录失败: ' + e.message, 'error');
         } finally {
@@ -921,6 +1203,56 @@
         updatePlayerUI();
     }
 
+    // ---- Waveform ----
+    // 按进度条宽度请求预先计算的峰值（服务端选择合适的级别），不需要下载音频
+    async function loadWaveform(taskId) {
+        const canvas = dom.waveformCanvas;
+        const ctx = canvas.getContext('2d');
+        ctx.clearRect(0, 0, canvas.width, canvas.height);
+        const width = dom.waveformBar.clientWidth;
+        if (!width) return;
+        let data;
+        try {
+            data = await api(`/api/peaks/${taskId}?width=${width}`);
+        } catch (e) {
+            return;  // 没有可用的音频时不显示波形
+        }
+        if (state.currentTaskId !== taskId) return;
+        drawWaveform(data);
+    }
+
+    function drawWaveform(data) {
+        const canvas = dom.waveformCanvas;
+        const ratio = window.devicePixelRatio || 1;
+        const width = dom.waveformBar.clientWidth;
+        const height = dom.waveformBar.clientHeight;
+        canvas.width = width * ratio;
+        canvas.height = height * ratio;
+        const ctx = canvas.getContext('2d');
+        ctx.scale(ratio, ratio);
+        ctx.fillStyle = 'rgba(108, 92, 231, 0.45)';
+
+        const peaks = data.peaks;
+        const buckets = peaks.length / 2;
+        if (!buckets || !data.duration) return;
+        // 每个像素覆盖的桶取最小/最大值
+        const bucketsPerPx = (data.duration / data.seconds_per_bucket) / width;
+        const mid = height / 2;
+        for (let x = 0; x < width; x++) {
+            const from = Math.floor(x * bucketsPerPx);
+            const to = Math.min(buckets, Math.max(from + 1, Math.floor((x + 1) * bucketsPerPx)));
+            if (from >= buckets) break;
+            let lo = 0, hi = 0;
+            for (let i = from; i < to; i++) {
+                if (peaks[2 * i] < lo) lo = peaks[2 * i];
+                if (peaks[2 * i + 1] > hi) hi = peaks[2 * i + 1];
+            }
+            const top = mid - (hi / 32768) * mid;
+            const bottom = mid - (lo / 32768) * mid;
+            ctx.fillRect(x, top, 1, Math.max(1, bottom - top));
+        }
+    }
+
     function updatePlayerUI() {
         const audio = dom.audioElement;
         if (!audio.duration) return;
@@ -934,8 +1266,11 @@
     let _cachedPhrases = null;  // [{el, start, end, group}]
     let _cachedItems = null;    // [{el, start, end, textEl}]
     let _highlightMode = '';    // 'phrases' | 'items'
+    let _activeEntry = -1;      // index of the highlighted entry in the cache
 
     function buildHighlightCache() {
+        _activeEntry = -1;
+        state._lastActiveGroup = null;
         const phrases = dom.segmentsList.querySelectorAll('.segment-phrase');
         if (phrases.length > 0) {
             _highlightMode = 'phrases';
@@ -965,52 +1300,61 @@
         }
     }
 
+    // 二分查找 current 所在的条目（条目按开始时间排序），没有返回 -1
+    function findActiveIndex(entries, current) {
+        let lo = 0, hi = entries.length;
+        while (lo < hi) {
+            const mid = (lo + hi) >> 1;
+            if (entries[mid].start <= current) lo = mid + 1;
+            else hi = mid;
+        }
+        const i = lo - 1;
+        return (i >= 0 && current < entries[i].end) ? i : -1;
+    }
+
     function highlightActiveSegment() {
         const current = dom.audioElement.currentTime;
 
         if (_highlightMode === 'phrases' && _cachedPhrases) {
-            let activeGroup = null;
-            for (const p of _cachedPhrases) {
-                if (current >= p.start && current < p.end) {
-                    p.el.classList.add('phrase-playing');
-                    activeGroup = p.group;
-                } else {
-                    p.el.classList.remove('phrase-playing');
-                }
+            const i = findActiveIndex(_cachedPhrases, current);
+            if (i === _activeEntry) return;
+            if (_activeEntry >= 0 && _cachedPhrases[_activeEntry]) {
+                _cachedPhrases[_activeEntry].el.classList.remove('phrase-playing');
             }
+            _activeEntry = i;
+            const activeGroup = i >= 0 ? _cachedPhrases[i].group : null;
+            if (i >= 0) _cachedPhrases[i].el.classList.add('phrase-playing');
 
             // Highlight the parent group
-            const groups = dom.segmentsList.querySelectorAll('.segment-item');
-            for (const g of groups) {
-                if (g === activeGroup) g.classList.add('playing');
-                else g.classList.remove('playing');
+            if (state._lastActiveGroup && state._lastActiveGroup !== activeGroup) {
+                state._lastActiveGroup.classList.remove('playing');
             }
-
             if (activeGroup && activeGroup !== state._lastActiveGroup) {
-                state._lastActiveGroup = activeGroup;
+                activeGroup.classList.add('playing');
                 activeGroup.scrollIntoView({ behavior: 'smooth', block: 'nearest' });
             }
+            state._lastActiveGroup = activeGroup;
             return;
         }
 
         if (_cachedItems) {
-            let newActive = -1;
-            for (let i = 0; i < _cachedItems.length; i++) {
+            const i = findActiveIndex(_cachedItems, current);
+            if (i === _activeEntry) return;
+            const prev = _activeEntry >= 0 ? _cachedItems[_activeEntry] : null;
+            if (prev) {
+                prev.el.classList.remove('playing');
+                if (prev.textEl) prev.textEl.classList.remove('text-playing');
+            }
+            _activeEntry = i;
+            if (i >= 0) {
                 const c = _cachedItems[i];
-                if (current >= c.start && current < c.end) {
-                    newActive = i;
-                    c.el.classList.add('playing');
-                    if (c.textEl) c.textEl.classList.add('text-playing');
-                } else {
-                    c.el.classList.remove('playing');
-                    if (c.textEl) c.textEl.classList.remove('text-playing');
+                c.el.classList.add('playing');
+                if (c.textEl) c.textEl.classList.add('text-playing');
+                if (i !== state.activeSegmentIndex) {
+                    state.activeSegmentIndex = i;
+                    c.el.scrollIntoView({ behavior: 'smooth', block: 'nearest' });
                 }
             }
-
-            if (newActive !== state.activeSegmentIndex && newActive >= 0) {
-                state.activeSegmentIndex = newActive;
-                _cachedItems[newActive].el.scrollIntoView({ behavior: 'smooth', block: 'nearest' });
-            }
         }
     }
 
@@ -1038,22 +1382,21 @@
     async function exportResult(format) {
         if (!state.currentTaskId) return;
         try {
-            const data = await api(`/api/export/${state.currentTaskId}?format=${format}`);
-            downloadText(data.content, data.filename);
-            showToast(`已导出 ${data.filename}`, 'success');
+            // 先保存未提交的编辑，导出内容才包含它们
+            await flushSegmentEdits();
+            downloadUrl(`/api/export/${state.currentTaskId}?format=${format}`);
+            showToast(`正在导出 ${format.toUpperCase()}`, 'success');
         } catch (e) {
             showToast('导出失败: ' + e.message, 'error');
         }
     }
 
-    function downloadText(content, filename) {
-        const blob = new Blob([content], { type: 'text/plain;charset=utf-8' });
-        const url = URL.createObjectURL(blob);
+    function downloadUrl(url) {
+        // 文件名由服务端的 Content-Disposition 指定
         const a = document.createElement('a');
         a.href = url;
-        a.download = filename;
+        a.download = '';
         a.click();
-        URL.revokeObjectURL(url);
     }
 
     // ---- Helpers ----
@@ -0,0 +1,203 @@
+"""长音频模式：静音切分规划与片段结果拼接"""
+import wave
+
+import numpy as np
+import pytest
+
+from app import long_audio
+from app.long_audio import AudioChunk, plan_chunks, stitch_segments
+
+RATE = 16000
+
+
+def _write_wav(path, samples):
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(RATE)
+        w.writeframes(samples.astype("<i2").tobytes())
+    return str(path)
+
+
+def _speech(seconds, pauses=(), pause_seconds=0.6):
+    """模拟语音：每秒中有 0.15s 的短停顿（短于可切分的最短静音），pauses 处为较长的静音"""
+    t = np.arange(int(seconds * RATE)) / RATE
+    x = 3000 * np.sin(2 * np.pi * 220 * t)
+    x[(t % 1.0) >= 0.85] = 0
+    for p in pauses:
+        x[(t >= p) & (t < p + pause_seconds)] = 0
+    return x
+
+
+def _check_layout(chunks, total, max_chunk):
+    assert chunks[0].core_start == 0.0
+    assert chunks[-1].core_end == pytest.approx(total, abs=0.05)
+    for i, c in enumerate(chunks):
+        assert c.index == i
+        assert c.core_end - c.core_start <= max_chunk + 1e-6
+        assert c.audio_start <= c.core_start < c.core_end <= c.audio_end
+        assert 0.0 <= c.audio_start and c.audio_end <= total + 1e-6
+    for a, b in zip(chunks, chunks[1:]):
+        assert a.core_end == b.core_start
+
+
+# ---- 切分规划 ----
+
+def test_short_audio_is_one_chunk(tmp_path):
+    path = _write_wav(tmp_path / "a.wav", _speech(8))
+    chunks = plan_chunks(path, max_chunk_seconds=10, overlap_seconds=2)
+    assert len(chunks) == 1
+    c = chunks[0]
+    assert (c.core_start, c.audio_start) == (0.0, 0.0)
+    assert c.core_end == c.audio_end == pytest.approx(8.0, abs=0.05)
+
+
+def test_cuts_in_silences_without_overlap(tmp_path):
+    pauses = [7.9, 15.9, 23.9]
+    path = _write_wav(tmp_path / "a.wav", _speech(30, pauses))
+    chunks = plan_chunks(path, max_chunk_seconds=10, overlap_seconds=2)
+
+    _check_layout(chunks, 30.0, 10)
+    assert len(chunks) == 4
+    for c, p in zip(chunks, pauses):
+        # 切分点在静音内部，相邻片段不重叠
+        assert p < c.core_end < p + 0.6
+    for c in chunks:
+        assert (c.audio_start, c.audio_end) == (c.core_start, c.core_end)
+
+
+def test_prefers_longest_silence(tmp_path):
+    x = _speech(14)
+    t = np.arange(len(x)) / RATE
+    x[(t >= 6.0) & (t < 6.4)] = 0
+    x[(t >= 8.0) & (t < 9.2)] = 0
+    path = _write_wav(tmp_path / "a.wav", x)
+    chunks = plan_chunks(path, max_chunk_seconds=10, overlap_seconds=2)
+    assert len(chunks) == 2
+    assert 8.0 < chunks[0].core_end < 9.2
+
+
+def test_continuous_audio_overlaps_at_cuts(tmp_path):
+    # 没有任何停顿、音量缓慢起伏的音频：找不到静音，在能量最低处切分并重叠
+    t = np.arange(35 * RATE) / RATE
+    x = 3000 * np.sin(2 * np.pi * 220 * t) * (0.6 + 0.4 * np.sin(2 * np.pi * 0.3 * t))
+    path = _write_wav(tmp_path / "a.wav", x)
+    chunks = plan_chunks(path, max_chunk_seconds=10, overlap_seconds=2)
+
+    _check_layout(chunks, 35.0, 10)
+    assert len(chunks) >= 4
+    assert chunks[0].audio_start == 0.0
+    assert chunks[-1].audio_end == chunks[-1].core_end
+    for a, b in zip(chunks, chunks[1:]):
+        assert a.audio_end == pytest.approx(a.core_end + 2)
+        assert b.audio_start == pytest.approx(b.core_start - 2)
+
+
+def test_mixed_clean_and_overlapping_cuts(tmp_path):
+    # 前半段有静音，后半段没有：只有找不到静音的切分点两侧重叠
+    t = np.arange(20 * RATE) / RATE
+    x = 3000 * np.sin(2 * np.pi * 220 * t)
+    x[(t >= 7.5) & (t < 8.5)] = 0
+    x[t < 1.0] = 0
+    x[(t >= 1.0) & (t < 2.0)] *= 0.05
+    path = _write_wav(tmp_path / "a.wav", x)
+    chunks = plan_chunks(path, max_chunk_seconds=10, overlap_seconds=2)
+
+    _check_layout(chunks, 20.0, 10)
+    first, second = chunks[0], chunks[1]
+    assert 7.5 < first.core_end < 8.5
+    assert first.audio_end == first.core_end
+    assert second.audio_start == second.core_start
+    assert second.audio_end == pytest.approx(second.core_end + 2)
+    assert chunks[2].audio_start == pytest.approx(chunks[2].core_start - 2)
+
+
+# ---- 片段拼接 ----
+
+def _seg(start, end, text):
+    return {"start": start, "end": end, "text": text, "confidence": 0.9}
+
+
+def _texts(segments):
+    return [(round(s.start, 3), round(s.end, 3), s.text) for s in segments]
+
+
+def test_stitch_keeps_segments_by_midpoint():
+    chunks = [AudioChunk(0, 0, 10, 0, 12), AudioChunk(1, 10, 20, 8, 20)]
+    results = {
+        0: {"segments": [_seg(0, 4, "a"), _seg(8, 11, "b"), _seg(10.5, 12, "c")]},
+        # 片段 1 的时间相对其 audio_start=8
+        1: {"segments": [_seg(0, 3, "b"), _seg(2.5, 4, "c"), _seg(5, 9, "d")]},
+    }
+    assert _texts(stitch_segments(chunks, results)) == [
+        (0, 4, "a"), (8, 11, "b"), (10.5, 12, "c"), (13, 17, "d"),
+    ]
+
+
+def test_stitch_midpoint_on_boundary_belongs_to_later_chunk():
+    chunks = [AudioChunk(0, 0, 10, 0, 12), AudioChunk(1, 10, 20, 8, 20)]
+    results = {
+        0: {"segments": [_seg(9, 11, "x")]},
+        1: {"segments": [_seg(1, 3, "y")]},
+    }
+    # 两个句子的中点都恰好是 10：片段 0 的被丢弃，片段 1 的被保留
+    assert _texts(stitch_segments(chunks, results)) == [(9, 11, "y")]
+
+
+def test_stitch_last_chunk_keeps_trailing_segment():
+    chunks = [AudioChunk(0, 0, 10, 0, 10), AudioChunk(1, 10, 20, 10, 20)]
+    results = {
+        0: {"segments": [_seg(9, 12, "dropped")]},
+        # 引擎给出的结束时间超出音频末尾，中点 >= core_end，但最后一段仍然保留
+        1: {"segments": [_seg(9, 11.5, "tail")]},
+    }
+    assert _texts(stitch_segments(chunks, results)) == [(19, 21.5, "tail")]
+
+
+def test_stitch_merges_identical_text_across_boundary():
+    chunks = [AudioChunk(0, 0, 10, 0, 12), AudioChunk(1, 10, 20, 8, 20)]
+    results = {
+        0: {"segments": [_seg(3, 4, "好的"), _seg(9, 10.4, "好的")]},
+        1: {"segments": [_seg(1.9, 2.6, "好的"), _seg(6, 7, "好的")]},
+    }
+    # 边界两侧时间重叠的相同文本合并为一句；不重叠的重复文本保留
+    assert _texts(stitch_segments(chunks, results)) == [
+        (3, 4, "好的"), (9, 10.6, "好的"), (14, 15, "好的"),
+    ]
+
+
+def test_stitch_skips_empty_text_and_missing_results():
+    chunks = [AudioChunk(0, 0, 10, 0, 10), AudioChunk(1, 10, 20, 10, 20), AudioChunk(2, 20, 30, 20, 30)]
+    results = {
+        0: {"segments": [_seg(1, 2, "  "), _seg(3, 4, " a ")]},
+        2: {"segments": [_seg(0, 1, "c")]},
+    }
+    assert _texts(stitch_segments(chunks, results)) == [(3, 4, "a"), (20, 21, "c")]
+
+
+# ---- 并行转录 ----
+
+def test_transcribe_long_audio_emits_segments_in_order(tmp_path, monkeypatch):
+    path = _write_wav(tmp_path / "a.wav", _speech(30, [7.9, 15.9, 23.9]))
+    monkeypatch.setattr(long_audio, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(long_audio, "_parallelism", lambda: 3)
+    monkeypatch.setattr(long_audio, "plan_chunks", lambda wav_path: plan_chunks(wav_path, 10, 2))
+
+    def fake_transcribe(engine_name, chunk_path, model_name, language):
+        index = int(chunk_path[-9:-4])
+        with wave.open(chunk_path, "rb") as w:
+            seconds = w.getnframes() / w.getframerate()
+        return {"segments": [_seg(0.5, seconds - 0.5, f"s{index}")], "language": "zh", "engine": "fake"}
+
+    monkeypatch.setattr(long_audio, "_transcribe_chunk", fake_transcribe)
+    emitted = []
+    result = long_audio.transcribe_long_audio(
+        "whisper", path, "base", None,
+        segment_callback=lambda segs, upto: emitted.append(([s.text for s in segs], upto)),
+    )
+    assert [s.text for s in result.segments] == ["s0", "s1", "s2", "s3"]
+    assert [texts for texts, _ in emitted] == [["s0"], ["s1"], ["s2"], ["s3"]]
+    assert [upto for _, upto in emitted] == sorted(upto for _, upto in emitted)
+    assert (result.language, result.engine) == ("zh", "fake")
+    # 片段临时目录已删除
+    assert [p.name for p in tmp_path.iterdir()] == ["a.wav"]
@@ -0,0 +1,330 @@
+"""任务存储：旧版数据库升级、旧版 history 目录导入与分页查询"""
+import json
+import sqlite3
+
+import pytest
+
+from app import task_manager as task_manager_module
+from app.task_store import SCHEMA_VERSION, TaskStore
+
+# 版本 1 的表结构（首个 SQLite 版本）
+V1_SCHEMA = """
+CREATE TABLE tasks (
+    id            TEXT PRIMARY KEY,
+    filename      TEXT NOT NULL,
+    engine        TEXT NOT NULL DEFAULT '',
+    model         TEXT NOT NULL DEFAULT '',
+    language      TEXT NOT NULL DEFAULT '',
+    file_path     TEXT NOT NULL DEFAULT '',
+    media_file    TEXT NOT NULL DEFAULT '',
+    wav_file      TEXT NOT NULL DEFAULT '',
+    content_hash  TEXT NOT NULL DEFAULT '',
+    file_size     INTEGER NOT NULL DEFAULT 0,
+    media_info    TEXT,
+    conversion    TEXT,
+    status        TEXT NOT NULL,
+    progress      REAL NOT NULL DEFAULT 0,
+    message       TEXT NOT NULL DEFAULT '',
+    error         TEXT,
+    has_result    INTEGER NOT NULL DEFAULT 0,
+    created_at    REAL NOT NULL DEFAULT 0,
+    completed_at  REAL,
+    updated_at    REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX idx_tasks_created ON tasks(created_at);
+CREATE INDEX idx_tasks_status_created ON tasks(status, created_at);
+CREATE INDEX idx_tasks_engine_created ON tasks(engine, created_at);
+CREATE TABLE results (
+    task_id     TEXT PRIMARY KEY REFERENCES tasks(id) ON DELETE CASCADE,
+    data        TEXT NOT NULL,
+    updated_at  REAL NOT NULL
+);
+CREATE TABLE store_meta (
+    key    TEXT PRIMARY KEY,
+    value  TEXT NOT NULL
+);
+"""
+
+# 版本 2：新增 last_played_at 列、文件名索引与编辑日志表
+V2_SCHEMA = V1_SCHEMA.replace(
+    "    completed_at  REAL,\n",
+    "    completed_at  REAL,\n    last_played_at REAL,\n",
+) + """
+CREATE INDEX idx_tasks_filename ON tasks(filename COLLATE NOCASE);
+CREATE TABLE result_edits (
+    seq            INTEGER PRIMARY KEY AUTOINCREMENT,
+    task_id        TEXT NOT NULL REFERENCES tasks(id) ON DELETE CASCADE,
+    segment_index  INTEGER NOT NULL,
+    text           TEXT NOT NULL,
+    created_at     REAL NOT NULL
+);
+"""
+
+RESULT = {
+    "segments": [
+        {"start": 0.0, "end": 1.5, "text": "你好", "confidence": 0.9, "speaker": ""},
+        {"start": 1.5, "end": 3.0, "text": "世界", "confidence": 0.8, "speaker": ""},
+    ],
+    "full_text": "你好 世界",
+    "language": "zh",
+    "duration": 3.0,
+}
+
+
+def _legacy_db(path, schema, version, extra=None):
+    """按旧版表结构建库，写入一个已完成的任务及其结果"""
+    conn = sqlite3.connect(path)
+    conn.executescript(schema)
+    row = {
+        "id": "t1", "filename": "会议.mp3", "engine": "whisper", "model": "base",
+        "language": "zh", "media_info": json.dumps({"duration": 3.0}), "status": "completed",
+        "progress": 1.0, "message": "转录完成", "has_result": 1, "created_at": 100.0,
+        "completed_at": 110.0, "updated_at": 110.0,
+    }
+    row.update(extra or {})
+    conn.execute(
+        f"INSERT INTO tasks ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+        list(row.values()),
+    )
+    conn.execute(
+        "INSERT INTO results(task_id, data, updated_at) VALUES ('t1', ?, 110.0)",
+        (json.dumps(RESULT, ensure_ascii=False),),
+    )
+    conn.execute("INSERT INTO store_meta(key, value) VALUES ('schema_version', ?)", (str(version),))
+    conn.commit()
+    conn.close()
+
+
+def _schema_version(path):
+    conn = sqlite3.connect(path)
+    try:
+        return int(conn.execute("SELECT value FROM store_meta WHERE key = 'schema_version'").fetchone()[0])
+    finally:
+        conn.close()
+
+
+def _task(task_id, filename="a.wav", created_at=0.0, **extra):
+    task = {
+        "id": task_id, "filename": filename, "engine": "whisper", "model": "base",
+        "language": "auto", "status": "completed", "progress": 1.0, "message": "",
+        "created_at": created_at,
+    }
+    task.update(extra)
+    return task
+
+
+# ---- 数据库升级 ----
+
+def test_new_database_records_current_version(tmp_path):
+    path = str(tmp_path / "tasks.db")
+    store = TaskStore(path)
+    store.save_task(_task("t1"))
+    store.close()
+    assert _schema_version(path) == SCHEMA_VERSION
+
+
+@pytest.mark.parametrize("schema, version, extra", [
+    (V1_SCHEMA, 1, {}),
+    (V2_SCHEMA, 2, {"last_played_at": 120.0}),
+])
+def test_legacy_database_is_migrated(tmp_path, schema, version, extra):
+    path = str(tmp_path / "tasks.db")
+    _legacy_db(path, schema, version, extra)
+
+    store = TaskStore(path)
+    tasks = store.load_tasks()
+    assert len(tasks) == 1
+    task = tasks[0]
+    assert task["filename"] == "会议.mp3"
+    assert task["media_info"] == {"duration": 3.0}
+    assert task["has_result"] is True
+    assert task["batch_id"] == ""
+    assert task["last_played_at"] == extra.get("last_played_at")
+    result, replayed, updated_at = store.load_result("t1")
+    assert result == RESULT
+    assert (replayed, updated_at) == (0, 110.0)
+
+    # 升级后新列与新表可以正常写入
+    store.save_task(dict(task, batch_id="b1", last_played_at=130.0))
+    store.save_batch({"id": "b1", "source": "upload", "total": 1})
+    assert store.load_tasks()[0]["batch_id"] == "b1"
+    assert [b["id"] for b in store.load_batches()] == ["b1"]
+    store.close()
+
+    assert _schema_version(path) == SCHEMA_VERSION
+    conn = sqlite3.connect(path)
+    indexes = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    conn.close()
+    assert {"idx_tasks_batch", "idx_tasks_filename"} <= indexes
+
+    # 再次打开不重复升级
+    store = TaskStore(path)
+    assert store.load_tasks()[0]["last_played_at"] == 130.0
+    store.close()
+
+
+def test_newer_database_is_refused(tmp_path):
+    path = str(tmp_path / "tasks.db")
+    store = TaskStore(path)
+    store.save_task(_task("t1"))
+    store.close()
+    conn = sqlite3.connect(path)
+    conn.execute("UPDATE store_meta SET value = ? WHERE key = 'schema_version'", (str(SCHEMA_VERSION + 1),))
+    conn.commit()
+    conn.close()
+
+    store = TaskStore(path)
+    with pytest.raises(RuntimeError):
+        store.load_tasks()
+    # 拒绝打开时不改写版本号，也不留下打开的连接
+    with pytest.raises(RuntimeError):
+        store.task_ids()
+    assert _schema_version(path) == SCHEMA_VERSION + 1
+
+
+# ---- 旧版 history 目录导入 ----
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    """指向临时目录的 HISTORY_DIR，以及在其上创建 TaskManager 的工厂函数"""
+    history_dir = tmp_path / "history"
+    history_dir.mkdir()
+    db_path = str(history_dir / "tasks.db")
+    monkeypatch.setattr(task_manager_module, "HISTORY_DIR", str(history_dir))
+    monkeypatch.setattr(task_manager_module, "TRASH_DIR", str(history_dir / ".trash"))
+    monkeypatch.setattr(task_manager_module, "TaskStore", lambda: TaskStore(db_path))
+    managers = []
+
+    def open_manager():
+        manager = task_manager_module.TaskManager()
+        manager.submitted = []
+        manager.submit = lambda task_id, media_path=None: manager.submitted.append((task_id, media_path))
+        manager.load_history()
+        managers.append(manager)
+        return manager
+
+    yield history_dir, open_manager
+    for manager in managers:
+        manager.close()
+
+
+def _legacy_dir(history_dir, task_id, meta, result=None, media=True, wav=False):
+    task_dir = history_dir / task_id
+    task_dir.mkdir()
+    (task_dir / "meta.json").write_text(json.dumps(dict(meta, id=task_id), ensure_ascii=False), encoding="utf-8")
+    if result is not None:
+        (task_dir / "result.json").write_text(json.dumps(result, ensure_ascii=False), encoding="utf-8")
+    if media:
+        (task_dir / "media.mp3").write_bytes(b"ID3")
+    if wav:
+        (task_dir / "audio.wav").write_bytes(b"RIFF")
+    return task_dir
+
+
+def _legacy_meta(status="completed", created_at=100.0, **extra):
+    meta = {
+        "filename": "访谈 01.mp3", "engine": "whisper", "model": "small", "language": "zh",
+        "media_file": "", "status": status, "progress": 1.0, "message": "转录完成",
+        "error": None, "created_at": created_at, "completed_at": created_at + 10,
+    }
+    meta.update(extra)
+    return meta
+
+
+def test_legacy_history_is_imported(history):
+    history_dir, open_manager = history
+    done = _legacy_dir(history_dir, "done", _legacy_meta(), RESULT, wav=True)
+    _legacy_dir(history_dir, "failed", _legacy_meta(status="failed", error="解码失败"), media=False)
+    _legacy_dir(history_dir, "pending", _legacy_meta(status="pending", created_at=200.0))
+    _legacy_dir(history_dir, "orphan", _legacy_meta(status="processing"), media=False)
+    broken = history_dir / "broken"
+    broken.mkdir()
+    (broken / "meta.json").write_text("{", encoding="utf-8")
+
+    manager = open_manager()
+
+    task = manager.get_task("done")
+    assert task["filename"] == "访谈 01.mp3"
+    assert (task["engine"], task["model"], task["language"]) == ("whisper", "small", "zh")
+    assert task["status"] == "completed"
+    assert task["created_at"] == 100.0 and task["completed_at"] == 110.0
+    assert task["media_file"] == str(done / "media.mp3")
+    assert task["wav_file"] == str(done / "audio.wav")
+    assert task["result"] == RESULT
+
+    failed = manager.get_task("failed")
+    assert (failed["status"], failed["error"], failed["has_result"]) == ("failed", "解码失败", False)
+    # 有媒体文件的未完成任务重新排队，没有媒体文件的标记为失败
+    assert manager.get_task("pending")["status"] == "pending"
+    assert manager.submitted == [("pending", str(history_dir / "pending" / "media.mp3"))]
+    assert manager.get_task("orphan")["status"] == "failed"
+    assert manager.get_task("broken") is None
+    manager.close()
+
+    # 重新打开时从数据库读取，不再重复导入，结果与导入时一致
+    (done / "meta.json").write_text(json.dumps(_legacy_meta(filename="changed.mp3")), encoding="utf-8")
+    manager = open_manager()
+    task = manager.get_task("done")
+    assert task["filename"] == "访谈 01.mp3"
+    assert task["result"] == RESULT
+    assert sorted(t["id"] for t in manager.get_all_tasks()) == ["done", "failed", "orphan", "pending"]
+
+
+def test_results_round_trip_through_task_manager(history):
+    history_dir, open_manager = history
+    _legacy_dir(history_dir, "t1", _legacy_meta(), RESULT)
+    manager = open_manager()
+    assert manager.edit_segments("t1", [(1, "朋友")]) == 2
+    manager.close()
+
+    manager = open_manager()
+    result = manager.get_task("t1")["result"]
+    assert [s["text"] for s in result["segments"]] == ["你好", "朋友"]
+    assert result["full_text"] == "你好 朋友"
+
+
+# ---- 分页查询 ----
+
+def test_query_ids_prefix_is_literal(tmp_path):
+    store = TaskStore(str(tmp_path / "tasks.db"))
+    names = ["100%_done.wav", "100x_done.wav", "1000_done.wav", "a_b.wav", "axb.wav", "a\\b.wav", "A_B2.wav"]
+    for i, name in enumerate(names):
+        store.save_task(_task(f"t{i}", filename=name, created_at=float(i)))
+
+    def names_for(prefix):
+        ids = [task_id for task_id, _ in store.query_ids(prefix=prefix)]
+        return sorted(names[int(task_id[1:])] for task_id in ids)
+
+    assert names_for("100%") == ["100%_done.wav"]
+    assert names_for("100%_") == ["100%_done.wav"]
+    assert names_for("a_") == ["A_B2.wav", "a_b.wav"]
+    assert names_for("a\\") == ["a\\b.wav"]
+    assert names_for("%") == []
+    store.close()
+
+
+def test_query_ids_cursor_pages_through_ties(tmp_path):
+    store = TaskStore(str(tmp_path / "tasks.db"))
+    # 多个任务创建时间相同，游标须按 (created_at, id) 区分
+    expected = []
+    for i in range(10):
+        created_at = float(i // 3)
+        store.save_task(_task(f"t{i:02d}", created_at=created_at, status="failed" if i % 2 else "completed"))
+        expected.append((f"t{i:02d}", created_at))
+    expected.sort(key=lambda r: (r[1], r[0]), reverse=True)
+
+    pages, after = [], None
+    while True:
+        page = store.query_ids(after=after, limit=3)
+        if not page:
+            break
+        pages.append(page)
+        last_id, last_created = page[-1]
+        after = (last_created, last_id)
+    assert [row for page in pages for row in page] == expected
+    assert [len(page) for page in pages] == [3, 3, 3, 1]
+
+    # 游标与过滤条件、时间范围组合
+    rows = store.query_ids(statuses=["failed"], since=1.0, until=3.0, after=(2.0, "t07"))
+    assert rows == [("t05", 1.0), ("t03", 1.0)]
+    store.close()
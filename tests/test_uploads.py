@@ -0,0 +1,171 @@
+"""流式上传：multipart/form-data 增量解析"""
+import hashlib
+import os
+
+import pytest
+
+from app import uploads
+from app.uploads import MultipartUpload, UploadError
+
+BOUNDARY = "----form-boundary-7MA4YWxk"
+CONTENT_TYPE = f"multipart/form-data; boundary={BOUNDARY}"
+
+
+@pytest.fixture(autouse=True)
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(uploads, "MAX_FILE_SIZE_MB", 1)
+    return tmp_path
+
+
+def _body(*parts):
+    """parts: (字段名, 值) 或 (字段名, 文件名, 内容)"""
+    out = b""
+    for part in parts:
+        out += f"--{BOUNDARY}\r\n".encode()
+        if len(part) == 2:
+            out += f'Content-Disposition: form-data; name="{part[0]}"\r\n\r\n'.encode()
+            out += part[1].encode("utf-8")
+        else:
+            name, filename, data = part
+            out += f'Content-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'.encode("utf-8")
+            out += b"Content-Type: application/octet-stream\r\n\r\n" + data
+        out += b"\r\n"
+    return out + f"--{BOUNDARY}--\r\n".encode()
+
+
+def _feed(upload, body, step):
+    for i in range(0, len(body), step):
+        upload.write(body[i:i + step])
+    upload.finish()
+
+
+def _files(directory):
+    return sorted(os.listdir(directory))
+
+
+AUDIO = bytes(range(256)) * 64 + f"\r\n--{BOUNDARY[:-3]}".encode() + b"tail"
+
+
+@pytest.mark.parametrize("step", [1, 7, 64, len(BOUNDARY) + 3, 1 << 20])
+def test_parses_fields_and_file_across_write_boundaries(upload_dir, step):
+    body = _body(("engine", "funasr"), ("file", "会议 录音.MP3", AUDIO), ("language", "zh"))
+    upload = MultipartUpload(CONTENT_TYPE)
+    _feed(upload, body, step)
+
+    assert upload.fields == {"engine": "funasr", "language": "zh"}
+    assert len(upload.files) == 1
+    f = upload.files[0]
+    assert (f.field, f.filename, f.size) == ("file", "会议 录音.MP3", len(AUDIO))
+    assert f.content_hash == hashlib.sha256(AUDIO).hexdigest()
+    assert f.path.endswith(".mp3") and os.path.dirname(f.path) == str(upload_dir)
+    with open(f.path, "rb") as fh:
+        assert fh.read() == AUDIO
+    assert upload.skipped == []
+
+
+def test_rejects_non_multipart_content_type():
+    for content_type in ("application/json", "multipart/form-data", ""):
+        with pytest.raises(UploadError):
+            MultipartUpload(content_type)
+
+
+def test_strict_rejects_unsupported_format(upload_dir):
+    upload = MultipartUpload(CONTENT_TYPE)
+    with pytest.raises(UploadError, match="不支持的文件格式: .txt"):
+        upload.write(_body(("file", "notes.txt", b"hello")))
+    upload.discard()
+    assert _files(upload_dir) == []
+
+
+def test_strict_rejects_empty_filename(upload_dir):
+    upload = MultipartUpload(CONTENT_TYPE)
+    with pytest.raises(UploadError, match="未选择文件"):
+        upload.write(_body(("file", "", b"")))
+    assert _files(upload_dir) == []
+
+
+def test_non_strict_skips_rejected_files(upload_dir):
+    big = b"\0" * (1024 * 1024 + 1)
+    body = _body(
+        ("files", "a.wav", b"RIFF-a"),
+        ("files", "b.txt", b"text"),
+        ("files", "c.flac", big),
+        ("files", "", b""),
+        ("files", "d.WAV", b"RIFF-d"),
+        ("model", "small"),
+    )
+    upload = MultipartUpload(CONTENT_TYPE, strict=False)
+    _feed(upload, body, 4096)
+
+    assert [f.filename for f in upload.files] == ["a.wav", "d.WAV"]
+    assert [s["file"] for s in upload.skipped] == ["b.txt", "c.flac", ""]
+    assert "不支持的文件格式" in upload.skipped[0]["reason"]
+    assert "超过限制" in upload.skipped[1]["reason"]
+    assert upload.fields == {"model": "small"}
+    # 超限文件写了一半的部分已删除，只剩两个保存成功的文件
+    assert _files(upload_dir) == sorted(os.path.basename(f.path) for f in upload.files)
+
+
+def test_strict_size_limit_aborts_and_removes_partial_file(upload_dir):
+    limit = 1024 * 1024
+    body = _body(("file", "big.wav", b"\1" * (limit * 3)))
+    upload = MultipartUpload(CONTENT_TYPE)
+    written = 0
+    with pytest.raises(UploadError, match="超过限制 1MB"):
+        for i in range(0, len(body), 65536):
+            upload.write(body[i:i + 65536])
+            written = i + 65536
+    # 超过限制后立即停止，不会读完整个请求体
+    assert written <= limit + 2 * 65536
+    assert _files(upload_dir) == []
+    upload.discard()
+    assert _files(upload_dir) == []
+
+
+def test_file_at_exact_limit_is_accepted(upload_dir):
+    data = b"\2" * (1024 * 1024)
+    upload = MultipartUpload(CONTENT_TYPE)
+    _feed(upload, _body(("file", "a.ogg", data)), 100000)
+    assert upload.files[0].size == len(data)
+
+
+def test_max_files(upload_dir):
+    body = _body(*[("files", f"{i}.wav", b"RIFF") for i in range(4)])
+    upload = MultipartUpload(CONTENT_TYPE, strict=False, max_files=3)
+    with pytest.raises(UploadError, match="文件数超过单批上限 3"):
+        _feed(upload, body, 4096)
+    assert len(_files(upload_dir)) == 3
+    upload.discard()
+    assert _files(upload_dir) == []
+    assert upload.files == []
+
+    upload = MultipartUpload(CONTENT_TYPE, strict=False, max_files=4)
+    _feed(upload, body, 4096)
+    assert len(upload.files) == 4
+
+
+def test_truncated_body_is_incomplete_and_discard_cleans_up(upload_dir):
+    body = _body(("file", "a.wav", b"x" * 10000), ("files", "b.wav", b"y" * 10000))
+    cut = body.index(b"y" * 100) + 500
+    upload = MultipartUpload(CONTENT_TYPE, strict=False)
+    upload.write(body[:cut])
+    with pytest.raises(UploadError, match="请求体不完整"):
+        upload.finish()
+    # 第一个文件已完整写入，第二个写了一半
+    assert len(upload.files) == 1
+    assert len(_files(upload_dir)) == 2
+    upload.discard()
+    assert _files(upload_dir) == []
+
+
+def test_malformed_body(upload_dir):
+    upload = MultipartUpload(CONTENT_TYPE)
+    with pytest.raises(UploadError, match="请求体格式错误"):
+        upload.write(b"this is not multipart\r\n")
+
+
+def test_field_too_long(upload_dir):
+    upload = MultipartUpload(CONTENT_TYPE)
+    with pytest.raises(UploadError, match="表单字段 language 过长"):
+        _feed(upload, _body(("language", "z" * (64 * 1024 + 1))), 8192)